@@ -1,6 +1,13 @@
 import os
+import json
+import asyncio
+import time
+import uuid
+import logging
+from contextlib import aclosing
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -8,9 +15,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Sistema RAG com cache inteligente
-from engine_rag import perguntar_ao_modelo, cache_manager
+from engine_rag import (perguntar_ao_modelo_async, perguntar_ao_modelo_stream, perguntar_em_lote,
+                        cache_manager, cache_busca, detectar_capacidades_busca_async,
+                        BATCH_CONCURRENCY)
+from tokenizacao import carregar_tokenizador_em_segundo_plano
+from aquecimento_cache import (aquecer_cache, registrar_pergunta_log, WARMUP_TOP, WARMUP_RPS,
+                               WARMUP_CONCURRENCY)
 
-print("🧠 Sistema RAG com cache inteligente carregado")
+log = logging.getLogger("rag.api")
+log.info("🧠 Sistema RAG com cache inteligente carregado")
+
+BATCH_MAX_QUESTIONS = int(os.getenv("RAG_BATCH_MAX_QUESTIONS", "5000"))
 
 app = FastAPI(
     title="Sistema RAG API - Cache Inteligente",
@@ -27,6 +42,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def detectar_busca():
+    """Detecta uma vez o modo de busca suportado pelo índice"""
+    try:
+        modo = await detectar_capacidades_busca_async()
+        log.info(f"🔎 Azure Search pronto (modo: {modo})")
+    except Exception as e:
+        log.warning(f"⚠️ Não foi possível sondar o Azure Search na inicialização: {e}")
+
+@app.on_event("startup")
+async def iniciar_tokenizador():
+    """Carrega o tiktoken fora do event loop; até lá os tokens são estimados por caracteres"""
+    carregar_tokenizador_em_segundo_plano()
+
+# Estado do aquecimento do cache; /ready só responde 200 depois que ele termina
+estado_aquecimento = {"status": "warming_up" if WARMUP_TOP > 0 else "ready"}
+
+async def executar_aquecimento():
+    try:
+        relatorio = await asyncio.to_thread(aquecer_cache, WARMUP_TOP, WARMUP_RPS, WARMUP_CONCURRENCY,
+                                            progresso=estado_aquecimento)
+        estado_aquecimento.update(relatorio)
+    except Exception as e:
+        log.warning(f"⚠️ Erro no aquecimento do cache: {e}")
+        estado_aquecimento["error"] = str(e)
+    estado_aquecimento["status"] = "ready"
+
+@app.on_event("startup")
+async def iniciar_aquecimento():
+    """Pré-responde as perguntas mais frequentes em segundo plano (RAG_WARMUP_TOP > 0)"""
+    if WARMUP_TOP > 0:
+        app.state.tarefa_aquecimento = asyncio.create_task(executar_aquecimento())
+
 @app.get("/")
 async def root():
     return {
@@ -43,7 +91,10 @@ async def root():
             "models": "/v1/models",
             "chat": "/v1/chat/completions",
             "health": "/health",
-            "stats": "/stats"
+            "ready": "/ready",
+            "stats": "/stats",
+            "metrics": "/metrics",
+            "batch": "/v1/batch"
         }
     }
 
@@ -55,31 +106,48 @@ async def health_check():
         "intelligent_caching": True
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Prontidão para receber tráfego: 503 enquanto o cache está sendo aquecido"""
+    return JSONResponse(
+        status_code=200 if estado_aquecimento["status"] == "ready" else 503,
+        content={"warmup": estado_aquecimento}
+    )
+
 @app.get("/stats")
 async def get_stats():
     """Retorna estatísticas detalhadas do cache inteligente"""
     try:
-        cache = cache_manager.cache
-        total = len(cache)
+        total, soma_usos, max_usos = cache_manager.estatisticas_uso()
+        eviction = {
+            "eviction_policy": cache_manager.politica.nome,
+            "cache_bytes": cache_manager.politica.total_bytes,
+            **cache_manager.contadores,
+            "retrieval_cache": cache_busca.estatisticas()
+        }
         
         if total == 0:
-            return {"cache_entries": 0, "message": "Cache vazio", "cache_type": "intelligent"}
-        
-        usos = [entry.get('uso_count', 1) for entry in cache.values()]
+            return {"cache_entries": 0, "message": "Cache vazio", "cache_type": "intelligent", **eviction}
         
         return {
             "cache_entries": total,
-            "average_usage": round(sum(usos) / len(usos), 2),
-            "max_usage": max(usos),
-            "total_cache_hits": sum(usos) - total,
-            "cache_efficiency": round((sum(usos) - total) / sum(usos) * 100, 1) if sum(usos) > 0 else 0,
+            "average_usage": round(soma_usos / total, 2),
+            "max_usage": max_usos,
+            "total_cache_hits": soma_usos - total,
+            "cache_efficiency": round((soma_usos - total) / soma_usos * 100, 1) if soma_usos > 0 else 0,
             "cache_type": "intelligent",
             "memory_optimization": "Ativa",
-            "semantic_detection": "Ativa"
+            "semantic_detection": "Ativa",
+            **eviction
         }
     except Exception as e:
         return {"error": f"Erro ao obter estatísticas: {e}", "cache_type": "intelligent"}
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato Prometheus (latência por etapa, hits/misses do cache)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/v1/models")
 async def list_models():
     return {
@@ -102,6 +170,35 @@ async def list_models():
         ]
     }
 
+def evento_sse(completion_id, criado, delta, finish_reason=None):
+    """Formata um chunk chat.completion.chunk no padrão SSE da OpenAI"""
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": criado,
+        "model": "rag-azure-intelligent",
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "finish_reason": finish_reason
+        }]
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+async def gerar_eventos_sse(pergunta):
+    """Repassa os fragmentos do motor RAG como eventos SSE"""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    criado = int(time.time())
+    
+    yield evento_sse(completion_id, criado, {"role": "assistant", "content": ""})
+    try:
+        async for fragmento in perguntar_ao_modelo_stream(pergunta):
+            yield evento_sse(completion_id, criado, {"content": fragmento})
+    except Exception as e:
+        yield evento_sse(completion_id, criado, {"content": f"\n\n❌ Erro interno: {str(e)}"})
+    yield evento_sse(completion_id, criado, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
 @app.post("/v1/chat/completions")
 async def chat_completions(request: Request):
     try:
@@ -123,8 +220,17 @@ async def chat_completions(request: Request):
                 content={"error": "Mensagem não pode estar vazia"}
             )
         
-        # Chama o modelo RAG
-        resposta = perguntar_ao_modelo(user_message)
+        registrar_pergunta_log(user_message)
+        
+        if data.get("stream"):
+            return StreamingResponse(
+                gerar_eventos_sse(user_message),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        # Chama o modelo RAG sem bloquear o event loop
+        resposta = await perguntar_ao_modelo_async(user_message)
         
         return JSONResponse({
             "object": "chat.completion",
@@ -149,6 +255,46 @@ async def chat_completions(request: Request):
             content={"error": f"Erro interno: {str(e)}"}
         )
 
+async def gerar_linhas_lote(perguntas, concorrencia):
+    """Serializa os resultados do lote como JSONL, na ordem em que ficam prontos"""
+    # aclosing: se o cliente desconectar, o lote cancela as perguntas pendentes na hora
+    async with aclosing(perguntar_em_lote(perguntas, concorrencia)) as itens:
+        async for item in itens:
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+@app.post("/v1/batch")
+async def batch(request: Request):
+    """Responde várias perguntas de uma vez, devolvendo JSONL em streaming"""
+    try:
+        data = await request.json()
+    except Exception:
+        return JSONResponse(status_code=400, content={"error": "JSON inválido"})
+    
+    perguntas = data.get("questions")
+    if not isinstance(perguntas, list) or not perguntas:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Campo 'questions' é obrigatório (lista de perguntas)"}
+        )
+    
+    if len(perguntas) > BATCH_MAX_QUESTIONS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Máximo de {BATCH_MAX_QUESTIONS} perguntas por lote"}
+        )
+    
+    if not all(isinstance(p, str) and p.strip() for p in perguntas):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Todas as perguntas devem ser textos não vazios"}
+        )
+    
+    concorrencia = data.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concorrencia, int) or concorrencia < 1:
+        return JSONResponse(status_code=400, content={"error": "'concurrency' deve ser um inteiro >= 1"})
+    
+    return StreamingResponse(gerar_linhas_lote(perguntas, concorrencia), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Iniciando API RAG com cache inteligente")
@@ -0,0 +1,202 @@
+"""Aquecimento do cache de respostas.
+
+Lê o log de perguntas recebidas pela API e o uso registrado no cache,
+ordena as perguntas por frequência e pré-responde as N mais populares via
+perguntar_ao_modelo, respeitando um limite de requisições por segundo.
+
+Uso:
+    python aquecimento_cache.py [--top 50] [--rps 2] [--concorrencia 4] [--dias 7] [--atualizar]
+"""
+import os
+import glob
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from engine_rag import cache_manager, perguntar_ao_modelo, hash_pergunta
+from metricas import configurar_logging
+
+log = logging.getLogger("rag.aquecimento")
+
+REQUEST_LOG_FILE = os.getenv("RAG_REQUEST_LOG", "log_perguntas.jsonl")
+WARMUP_TOP = int(os.getenv("RAG_WARMUP_TOP", "0"))  # 0 desativa o aquecimento na inicialização da API
+WARMUP_RPS = float(os.getenv("RAG_WARMUP_RPS", "2"))
+WARMUP_CONCURRENCY = int(os.getenv("RAG_WARMUP_CONCURRENCY", "4"))
+WARMUP_DAYS = int(os.getenv("RAG_WARMUP_DAYS", "7"))
+REQUEST_LOG_MAX_MB = float(os.getenv("RAG_REQUEST_LOG_MAX_MB", "50"))
+REQUEST_LOG_BACKUPS = int(os.getenv("RAG_REQUEST_LOG_BACKUPS", "5"))
+
+REQUEST_LOG_RETENTION_DAYS = int(os.getenv("RAG_REQUEST_LOG_RETENTION_DAYS", "30"))
+
+def caminho_log_processo(caminho=REQUEST_LOG_FILE, pid=None):
+    """Arquivo do log de perguntas deste processo: log_perguntas.<pid>.jsonl.
+
+    Cada worker escreve e rotaciona o seu; rotacionar um arquivo compartilhado
+    faria os outros processos continuarem escrevendo no arquivo renomeado.
+    """
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}.{pid or os.getpid()}{extensao}"
+
+def _logger_perguntas(caminho):
+    """Logger do log de perguntas: escrita na thread do QueueListener, arquivo rotacionado"""
+    arquivo = caminho_log_processo(caminho)
+    nome = f"rag.perguntas.{hash_pergunta(os.path.abspath(arquivo))}"
+    logger = logging.getLogger(nome)
+    if not logger.handlers:
+        _remover_logs_antigos(caminho)
+        saida = RotatingFileHandler(arquivo, maxBytes=int(REQUEST_LOG_MAX_MB * 1024 * 1024),
+                                    backupCount=REQUEST_LOG_BACKUPS, encoding='utf-8', delay=True)
+        configurar_logging(nome, saida=saida, nivel=logging.INFO)
+    return logger
+
+def registrar_pergunta_log(pergunta, caminho=REQUEST_LOG_FILE):
+    """Enfileira a pergunta recebida para o log JSONL usado pelo aquecimento (não bloqueia)"""
+    linha = json.dumps({'timestamp': datetime.now().isoformat(), 'pergunta': pergunta}, ensure_ascii=False)
+    _logger_perguntas(caminho).info(linha)
+
+def arquivos_log_perguntas(caminho=REQUEST_LOG_FILE):
+    """Arquivos do log de perguntas de todos os processos (e rotacionados), além do arquivo único antigo"""
+    raiz, extensao = os.path.splitext(glob.escape(caminho))
+    padroes = [f"{raiz}.[0-9]*{extensao}", f"{raiz}.[0-9]*{extensao}.[0-9]*",
+               glob.escape(caminho), f"{glob.escape(caminho)}.[0-9]*"]
+    return sorted({arquivo for padrao in padroes for arquivo in glob.glob(padrao)})
+
+def _remover_logs_antigos(caminho):
+    """Apaga arquivos de processos antigos sem escrita há mais de RAG_REQUEST_LOG_RETENTION_DAYS dias"""
+    if REQUEST_LOG_RETENTION_DAYS <= 0:
+        return
+    limite = time.time() - REQUEST_LOG_RETENTION_DAYS * 86400
+    for arquivo in arquivos_log_perguntas(caminho):
+        try:
+            if os.path.getmtime(arquivo) < limite:
+                os.remove(arquivo)
+        except OSError:
+            pass
+
+def ler_log_perguntas(caminho=REQUEST_LOG_FILE, dias=WARMUP_DAYS):
+    """Conta as perguntas do log (agrupadas pela forma normalizada) dos últimos `dias`"""
+    contagem = Counter()
+    variantes = {}
+    limite = (datetime.now() - timedelta(days=dias)).isoformat() if dias else ""
+    for arquivo in arquivos_log_perguntas(caminho):
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue
+                if registro.get('timestamp', '') < limite or not registro.get('pergunta', '').strip():
+                    continue
+                pergunta = registro['pergunta']
+                chave = hash_pergunta(cache_manager.normalizar_pergunta(pergunta))
+                contagem[chave] += 1
+                variantes.setdefault(chave, Counter())[pergunta] += 1
+
+    # Representa cada grupo pela forma escrita mais comum
+    return contagem, {chave: formas.most_common(1)[0][0] for chave, formas in variantes.items()}
+
+def ranquear_perguntas(caminho=REQUEST_LOG_FILE, dias=WARMUP_DAYS):
+    """Lista [(pergunta, pontuação)] ordenada: ocorrências no log + uso_count no cache"""
+    contagem, perguntas = ler_log_perguntas(caminho, dias)
+
+    with cache_manager.lock:
+        entradas = list(cache_manager.cache.values())
+    for entry in entradas:
+        chave = hash_pergunta(entry['pergunta_normalizada'])
+        contagem[chave] += entry.get('uso_count', 1)
+        perguntas.setdefault(chave, entry['pergunta_original'])
+
+    return [(perguntas[chave], pontos) for chave, pontos in contagem.most_common()]
+
+class LimitadorTaxa:
+    """Espaça as chamadas para no máximo `por_segundo` (compartilhado entre threads)"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self.proximo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        with self.lock:
+            agora = time.monotonic()
+            espera = self.proximo - agora
+            self.proximo = max(agora, self.proximo) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+def aquecer_cache(top=50, rps=WARMUP_RPS, concorrencia=WARMUP_CONCURRENCY, dias=WARMUP_DAYS,
+                  atualizar=False, caminho=REQUEST_LOG_FILE, progresso=None):
+    """Pré-responde as `top` perguntas mais frequentes que ainda não estão no cache.
+
+    Com `atualizar`, as respostas já existentes também são regeneradas (útil após
+    reindexar os documentos). `progresso`, se informado, é um dict atualizado
+    durante a execução (usado pelo endpoint /ready da API).
+    """
+    inicio = time.perf_counter()
+    ranking = ranquear_perguntas(caminho, dias)[:top]
+
+    pendentes = []
+    ja_em_cache = 0
+    for pergunta, _ in ranking:
+        if not atualizar and cache_manager.contem(pergunta):
+            ja_em_cache += 1
+            continue
+        pendentes.append(pergunta)
+
+    relatorio = {'candidatas': len(ranking), 'ja_em_cache': ja_em_cache, 'aquecidas': 0, 'falhas': 0}
+    if progresso is not None:
+        progresso.update(relatorio, pendentes=len(pendentes))
+    log.info(f"🔥 Aquecimento: {len(ranking)} perguntas populares, {ja_em_cache} já em cache, "
+          f"{len(pendentes)} a responder ({rps:g} req/s, {concorrencia} em paralelo)")
+
+    limitador = LimitadorTaxa(rps)
+
+    def responder(pergunta):
+        limitador.aguardar()
+        if atualizar:
+            cache_manager.invalidar(pergunta)
+        perguntar_ao_modelo(pergunta)
+        # Erros do modelo voltam como texto e não são gravados no cache
+        return cache_manager.contem(pergunta)
+
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as executor:
+        futuros = {executor.submit(responder, pergunta): pergunta for pergunta in pendentes}
+        for futuro in as_completed(futuros):
+            try:
+                ok = futuro.result()
+            except Exception as e:
+                log.warning(f"⚠️ Falha ao aquecer '{futuros[futuro][:60]}': {e}")
+                ok = False
+            relatorio['aquecidas' if ok else 'falhas'] += 1
+            if progresso is not None:
+                progresso.update(relatorio)
+
+    relatorio['duracao_s'] = round(time.perf_counter() - inicio, 2)
+    log.info(f"✅ Aquecimento concluído: {relatorio['aquecidas']} respostas novas, "
+          f"{relatorio['falhas']} falhas em {relatorio['duracao_s']}s")
+    return relatorio
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=WARMUP_TOP or 50, help="quantas perguntas populares aquecer")
+    parser.add_argument("--rps", type=float, default=WARMUP_RPS, help="limite de perguntas por segundo (0 = sem limite)")
+    parser.add_argument("--concorrencia", type=int, default=WARMUP_CONCURRENCY)
+    parser.add_argument("--dias", type=int, default=WARMUP_DAYS, help="janela do log considerada (0 = tudo)")
+    parser.add_argument("--log", default=REQUEST_LOG_FILE, help="arquivo de log de perguntas")
+    parser.add_argument("--atualizar", action="store_true",
+                        help="regenera também as respostas já em cache (após reindexar)")
+    args = parser.parse_args()
+
+    aquecer_cache(args.top, args.rps, args.concorrencia, args.dias, args.atualizar, args.log)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import os
+import json
+import zlib
+import base64
+import sqlite3
+import logging
+import threading
+
+log = logging.getLogger("rag.cache")
+
+# Compacta o log quando houver mais que este múltiplo de registros por entrada viva
+FATOR_COMPACTACAO_LOG = 2
+MIN_REGISTROS_COMPACTACAO = 100
+
+# Eventos de alteração mantidos para sincronizar outros processos (modo compartilhado)
+RETENCAO_EVENTOS = 50000
+INTERVALO_LIMPEZA_EVENTOS = 1000
+
+CAMPOS_ENTRADA = ('pergunta_original', 'pergunta_normalizada', 'resposta', 'timestamp', 'uso_count')
+
+def importar_json_legado(caminho):
+    """Lê o cache no formato JSON antigo (dict chave -> entrada)"""
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        dados = json.load(f)
+    if not isinstance(dados, dict):
+        raise ValueError(f"Formato de cache inválido em {caminho}")
+    return dados
+
+def _comprimir(texto):
+    return zlib.compress(texto.encode('utf-8'))
+
+def _descomprimir(dados):
+    return zlib.decompress(dados).decode('utf-8')
+
+class ArmazenamentoMemoria:
+    """Backend sem persistência (útil para benchmarks e execuções descartáveis)"""
+
+    novo = False
+
+    def carregar(self):
+        return {}
+
+    def gravar(self, chave, entry):
+        pass
+
+    def registrar_uso(self, chave, entry):
+        pass
+
+    def remover(self, chave):
+        pass
+
+    def importar(self, entradas):
+        pass
+
+    def fechar(self):
+        pass
+
+class ArmazenamentoSQLite:
+    """Backend SQLite em modo WAL: cada escrita é uma transação de uma linha.
+
+    Toda escrita também anexa um evento em `eventos`, que outros processos
+    usando o mesmo arquivo leem em `alteracoes_desde` para manter seus
+    índices em memória sincronizados (modo compartilhado entre workers).
+    """
+
+    suporta_compartilhamento = True
+
+    def __init__(self, caminho, comprimir=False):
+        self.caminho = caminho
+        self.comprimir = comprimir
+        self.lock = threading.Lock()
+        self.novo = not os.path.exists(caminho)
+        self.conexao = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                chave TEXT PRIMARY KEY,
+                pergunta_original TEXT NOT NULL,
+                pergunta_normalizada TEXT NOT NULL,
+                resposta BLOB NOT NULL,
+                comprimida INTEGER NOT NULL DEFAULT 0,
+                timestamp TEXT NOT NULL,
+                uso_count INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+        self.conexao.execute("""
+            CREATE TABLE IF NOT EXISTS eventos (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT NOT NULL,
+                op TEXT NOT NULL
+            )
+        """)
+        self.conexao.commit()
+        self.escritas = 0
+        self.data_version = None
+
+    def _linha_para_entrada(self, linha):
+        pergunta_original, pergunta_normalizada, resposta, comprimida, timestamp, uso_count = linha
+        return {
+            'pergunta_original': pergunta_original,
+            'pergunta_normalizada': pergunta_normalizada,
+            'resposta': _descomprimir(resposta) if comprimida else resposta,
+            'timestamp': timestamp,
+            'uso_count': uso_count
+        }
+
+    def _entrada_para_linha(self, chave, entry):
+        resposta = entry['resposta']
+        if self.comprimir:
+            resposta = _comprimir(resposta)
+        return (chave, entry['pergunta_original'], entry['pergunta_normalizada'], resposta,
+                int(self.comprimir), entry['timestamp'], entry.get('uso_count', 1))
+
+    def carregar(self):
+        with self.lock:
+            linhas = self.conexao.execute(
+                "SELECT chave, pergunta_original, pergunta_normalizada, resposta, "
+                "comprimida, timestamp, uso_count FROM cache ORDER BY rowid"
+            ).fetchall()
+        return {linha[0]: self._linha_para_entrada(linha[1:]) for linha in linhas}
+
+    def _anotar_evento(self, chave, op):
+        self.conexao.execute("INSERT INTO eventos (chave, op) VALUES (?, ?)", (chave, op))
+        self.escritas += 1
+        if self.escritas % INTERVALO_LIMPEZA_EVENTOS == 0:
+            self.conexao.execute(
+                "DELETE FROM eventos WHERE seq <= (SELECT MAX(seq) FROM eventos) - ?",
+                (RETENCAO_EVENTOS,)
+            )
+
+    def gravar(self, chave, entry):
+        with self.lock, self.conexao:
+            self.conexao.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._entrada_para_linha(chave, entry)
+            )
+            self._anotar_evento(chave, 'set')
+
+    def registrar_uso(self, chave, entry):
+        """Incrementa uso_count no banco (atômico entre processos) e atualiza o timestamp.
+
+        Anota um evento 'uso', que os outros processos aplicam sem reler a resposta.
+        """
+        with self.lock, self.conexao:
+            if self.conexao.execute(
+                "UPDATE cache SET uso_count = uso_count + 1, timestamp = ? WHERE chave = ?",
+                (entry['timestamp'], chave)
+            ).rowcount:
+                self._anotar_evento(chave, 'uso')
+
+    def timestamp(self, chave):
+        """Timestamp gravado da entrada (None se ela não existe mais)"""
+        with self.lock:
+            linha = self.conexao.execute("SELECT timestamp FROM cache WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else None
+
+    def remover(self, chave):
+        with self.lock, self.conexao:
+            if self.conexao.execute("DELETE FROM cache WHERE chave = ?", (chave,)).rowcount:
+                self._anotar_evento(chave, 'del')
+
+    def ultimo_evento(self):
+        with self.lock:
+            return self.conexao.execute("SELECT COALESCE(MAX(seq), 0) FROM eventos").fetchone()[0]
+
+    def alteracoes_desde(self, seq):
+        """Retorna (novo_seq, {chave: entrada ou None se removida}, {chave: (timestamp, uso_count)}) após `seq`.
+
+        Eventos 'uso' (hits) só trazem timestamp e uso_count; a linha inteira só
+        é relida para chaves gravadas ('set') desde `seq`. Usa PRAGMA data_version
+        para não consultar nada quando nenhum outro processo escreveu. Retorna
+        None se os eventos necessários já foram descartados (o chamador deve
+        recarregar tudo).
+        """
+        with self.lock:
+            data_version = self.conexao.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return seq, {}, {}
+            self.data_version = data_version
+
+            minimo = self.conexao.execute("SELECT MIN(seq) FROM eventos").fetchone()[0]
+            if minimo is not None and seq < minimo - 1:
+                return None
+
+            ops = {}
+            for seq, chave, op in self.conexao.execute(
+                    "SELECT seq, chave, op FROM eventos WHERE seq > ? ORDER BY seq", (seq,)):
+                if op != 'uso' or ops.get(chave) not in ('set', 'del'):
+                    ops[chave] = op
+
+            gravadas = [chave for chave, op in ops.items() if op != 'uso']
+            usadas = [chave for chave, op in ops.items() if op == 'uso']
+            linhas = {}
+            for inicio in range(0, len(gravadas), 500):
+                lote = gravadas[inicio:inicio + 500]
+                linhas.update((linha[0], linha[1:]) for linha in self.conexao.execute(
+                    "SELECT chave, pergunta_original, pergunta_normalizada, resposta, comprimida, "
+                    f"timestamp, uso_count FROM cache WHERE chave IN ({','.join('?' * len(lote))})", lote))
+            usos = {}
+            for inicio in range(0, len(usadas), 500):
+                lote = usadas[inicio:inicio + 500]
+                usos.update((chave, (timestamp, uso_count)) for chave, timestamp, uso_count in self.conexao.execute(
+                    f"SELECT chave, timestamp, uso_count FROM cache WHERE chave IN ({','.join('?' * len(lote))})", lote))
+
+        alteracoes = {chave: self._linha_para_entrada(linhas[chave]) if chave in linhas else None
+                      for chave in gravadas}
+        # Usada e depois apagada por outro processo: vira remoção
+        alteracoes.update((chave, None) for chave in usadas if chave not in usos)
+        return seq, alteracoes, usos
+
+    def importar(self, entradas):
+        with self.lock, self.conexao:
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._entrada_para_linha(chave, entry) for chave, entry in entradas.items()]
+            )
+            self.conexao.executemany(
+                "INSERT INTO eventos (chave, op) VALUES (?, 'set')", [(chave,) for chave in entradas]
+            )
+
+    def fechar(self):
+        with self.lock:
+            self.conexao.close()
+
+class ArmazenamentoLog:
+    """Backend de log JSONL append-only com compactação periódica.
+
+    Cada escrita anexa um registro `set`/`del`; ao carregar, o log é reaplicado
+    e uma última linha truncada (queda no meio da escrita) é descartada.
+    """
+
+    def __init__(self, caminho, comprimir=False):
+        self.caminho = caminho
+        self.comprimir = comprimir
+        self.lock = threading.Lock()
+        self.novo = not os.path.exists(caminho)
+        self.entradas = {}
+        self.registros = 0
+        self.arquivo = None
+
+    def _serializar(self, chave, entry):
+        registro = {'op': 'set', 'chave': chave,
+                    'entry': {campo: entry.get(campo) for campo in CAMPOS_ENTRADA}}
+        if self.comprimir:
+            resposta = registro['entry'].pop('resposta')
+            registro['entry']['resposta_z'] = base64.b64encode(_comprimir(resposta)).decode('ascii')
+        return json.dumps(registro, ensure_ascii=False)
+
+    def _desserializar(self, registro):
+        entry = registro['entry']
+        if 'resposta_z' in entry:
+            entry['resposta'] = _descomprimir(base64.b64decode(entry.pop('resposta_z')))
+        return entry
+
+    def carregar(self):
+        entradas = {}
+        registros = 0
+        corrompido = False
+        if os.path.exists(self.caminho):
+            with open(self.caminho, 'r', encoding='utf-8') as f:
+                for num_linha, linha in enumerate(f, 1):
+                    if not linha.strip():
+                        continue
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        log.warning(f"⚠️ Registro inválido ignorado no log do cache (linha {num_linha})")
+                        corrompido = True
+                        continue
+                    registros += 1
+                    if registro['op'] == 'set':
+                        entradas[registro['chave']] = self._desserializar(registro)
+                    else:
+                        entradas.pop(registro['chave'], None)
+
+        with self.lock:
+            self.entradas = {chave: dict(entry) for chave, entry in entradas.items()}
+            self.registros = registros
+            if corrompido:
+                self._compactar()
+            else:
+                self._compactar_se_necessario()
+        return entradas
+
+    def _anexar(self, linha):
+        if self.arquivo is None:
+            self.arquivo = open(self.caminho, 'a', encoding='utf-8')
+        self.arquivo.write(linha + '\n')
+        self.arquivo.flush()
+        self.registros += 1
+
+    def gravar(self, chave, entry):
+        with self.lock:
+            self.entradas[chave] = dict(entry)
+            self._anexar(self._serializar(chave, entry))
+            self._compactar_se_necessario()
+
+    def registrar_uso(self, chave, entry):
+        self.gravar(chave, entry)
+
+    def remover(self, chave):
+        with self.lock:
+            if self.entradas.pop(chave, None) is None:
+                return
+            self._anexar(json.dumps({'op': 'del', 'chave': chave}))
+            self._compactar_se_necessario()
+
+    def importar(self, entradas):
+        with self.lock:
+            self.entradas.update({chave: dict(entry) for chave, entry in entradas.items()})
+            self._compactar()
+
+    def _compactar_se_necessario(self):
+        limite = max(MIN_REGISTROS_COMPACTACAO, FATOR_COMPACTACAO_LOG * len(self.entradas))
+        if self.registros > limite:
+            self._compactar()
+
+    def _compactar(self):
+        """Reescreve o log só com as entradas vivas e troca o arquivo atomicamente"""
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
+        temporario = self.caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            for chave, entry in self.entradas.items():
+                f.write(self._serializar(chave, entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, self.caminho)
+        self.registros = len(self.entradas)
+
+    def fechar(self):
+        with self.lock:
+            if self.arquivo is not None:
+                self.arquivo.close()
+                self.arquivo = None
+
+BACKENDS = {
+    'sqlite': ArmazenamentoSQLite,
+    'log': ArmazenamentoLog,
+}
+
+def criar_armazenamento(backend, caminho=None, comprimir=False):
+    """Cria o backend de persistência do cache pelo nome"""
+    if backend == 'memoria':
+        return ArmazenamentoMemoria()
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de cache desconhecido: {backend} (use: sqlite, log, memoria)")
+    return BACKENDS[backend](caminho, comprimir=comprimir)
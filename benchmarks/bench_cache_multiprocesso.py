@@ -0,0 +1,108 @@
+"""Benchmark de taxa de acerto do cache com vários workers.
+
+Simula N processos (como workers do uvicorn/gunicorn) recebendo, em
+round-robin, um fluxo de perguntas com popularidade Zipf. Compara o cache
+isolado por processo (um arquivo SQLite por worker) com o modo compartilhado
+(RAG_CACHE_SHARED: mesmo arquivo SQLite WAL para todos).
+
+Uso:
+    python benchmarks/bench_cache_multiprocesso.py [--workers 1 2 4 8] [--requisicoes 4000]
+"""
+import os
+import io
+import sys
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("RAG_CACHE_BACKEND", "memoria")
+os.environ.setdefault("RAG_LOG_LEVEL", "WARNING")
+
+def gerar_fluxo(requisicoes, perguntas_distintas, seed=7, s=1.1):
+    """Sequência de índices de perguntas com distribuição Zipf"""
+    rng = random.Random(seed)
+    pesos = [1 / (i ** s) for i in range(1, perguntas_distintas + 1)]
+    return rng.choices(range(perguntas_distintas), weights=pesos, k=requisicoes)
+
+def pergunta(numero):
+    """Pergunta sintética com vocabulário próprio (termos que só ela usa)"""
+    return f"como resolver a falha{numero} no servico{numero} do cliente{numero}"
+
+def resposta(numero):
+    return f"resposta {numero} " * 50
+
+def worker(caminho_db, compartilhado, fluxo, barreira, fila):
+    import engine_rag
+    from armazenamento_cache import ArmazenamentoSQLite
+    from politicas_cache import PoliticaLRU
+
+    engine_rag.CACHE_FILE = os.path.join(os.path.dirname(caminho_db), "inexistente.json")
+    hits = erradas = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache = engine_rag.CacheAvancado(ArmazenamentoSQLite(caminho_db), PoliticaLRU(100000),
+                                         compartilhado=compartilhado)
+        barreira.wait()
+        inicio = time.perf_counter()
+        for numero in fluxo:
+            encontrada = cache.encontrar_pergunta_similar(pergunta(numero))
+            if encontrada == resposta(numero):
+                hits += 1
+            elif encontrada is None:
+                cache.adicionar_ao_cache(pergunta(numero), resposta(numero))
+            else:
+                erradas += 1
+    fila.put((time.perf_counter() - inicio, hits, erradas, len(fluxo)))
+
+def executar(workers, compartilhado, fluxo, diretorio):
+    contexto = multiprocessing.get_context("spawn")
+    barreira = contexto.Barrier(workers)
+    fila = contexto.Queue()
+    processos = []
+    for w in range(workers):
+        nome = "compartilhado.db" if compartilhado else f"isolado_{w}.db"
+        caminho = os.path.join(diretorio, f"{workers}_{nome}")
+        p = contexto.Process(target=worker, args=(caminho, compartilhado, fluxo[w::workers], barreira, fila))
+        processos.append(p)
+        p.start()
+
+    resultados = [fila.get() for _ in processos]
+    duracao = max(r[0] for r in resultados)
+    for p in processos:
+        p.join()
+        if p.exitcode != 0:
+            raise RuntimeError(f"Worker terminou com código {p.exitcode}")
+
+    hits = sum(r[1] for r in resultados)
+    erradas = sum(r[2] for r in resultados)
+    total = sum(r[3] for r in resultados)
+    if erradas:
+        print(f"⚠️ {erradas} consultas devolveram a resposta de outra pergunta")
+    return hits / total * 100, total / duracao
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requisicoes", type=int, default=4000)
+    parser.add_argument("--perguntas", type=int, default=800)
+    args = parser.parse_args()
+
+    fluxo = gerar_fluxo(args.requisicoes, args.perguntas)
+    teorico = (1 - len(set(fluxo)) / len(fluxo)) * 100
+    print(f"📊 {args.requisicoes} requisições, {len(set(fluxo))} perguntas distintas "
+          f"(taxa de acerto máxima: {teorico:.1f}%)")
+    print(f"{'workers':>7} | {'isolado hit%':>12} | {'compart. hit%':>13} | {'isolado req/s':>13} | {'compart. req/s':>14}")
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        for workers in args.workers:
+            hit_isolado, vazao_isolado = executar(workers, False, fluxo, diretorio)
+            hit_compartilhado, vazao_compartilhado = executar(workers, True, fluxo, diretorio)
+            print(f"{workers:>7} | {hit_isolado:>12.1f} | {hit_compartilhado:>13.1f} | "
+                  f"{vazao_isolado:>13.0f} | {vazao_compartilhado:>14.0f}")
+
+if __name__ == "__main__":
+    main()
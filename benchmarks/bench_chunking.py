@@ -0,0 +1,111 @@
+"""Benchmark das estratégias de chunking do indexador (fixo, frases, tokens).
+
+Para cada estratégia mede, sobre o mesmo corpus já extraído:
+  - número de chunks, tamanho médio e chunks pequenos (< 25% do tamanho-alvo)
+  - bytes enviados ao índice (JSON dos documentos) e texto repetido pela sobreposição
+  - chunks que atravessam páginas
+  - vazão do chunking (páginas/s e MB/s, melhor de 3 execuções)
+
+Usa os PDFs de kbs_confluence (ou --pasta) se existirem; senão gera um corpus
+sintético com parágrafos e frases de tamanhos variados.
+
+Uso:
+    python benchmarks/bench_chunking.py [--pasta kbs_confluence] [--max-arquivos 200]
+    python benchmarks/bench_chunking.py --sintetico 300 --estrategias fixo frases
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indexar_documentos import PDF_FOLDER, extrair_texto_com_paginas, gerar_chunks
+from estrategias_chunking import ESTRATEGIAS, criar_estrategia
+
+REPETICOES = 3
+
+def carregar_pdfs(pasta, max_arquivos):
+    corpus = []
+    nomes = sorted(nome for nome in os.listdir(pasta) if nome.lower().endswith('.pdf'))[:max_arquivos]
+    for nome in nomes:
+        try:
+            paginas = extrair_texto_com_paginas(os.path.join(pasta, nome))
+        except Exception as e:
+            print(f"⚠️ Ignorando {nome}: {e}")
+            continue
+        if paginas:
+            corpus.append((nome, paginas))
+    return corpus
+
+def gerar_corpus(documentos, seed=5):
+    """Documentos sintéticos: páginas de 200-3500 caracteres, parágrafos de 1-8 frases"""
+    rng = random.Random(seed)
+    vocabulario = [f"termo{i}" for i in range(4000)] + ["o", "a", "de", "para", "com", "no", "servidor", "usuário"]
+
+    def frase():
+        return " ".join(rng.choice(vocabulario) for _ in range(rng.randint(4, 30))).capitalize() + rng.choice(".......?!:")
+
+    corpus = []
+    for d in range(documentos):
+        paginas = []
+        for numero in range(1, rng.randint(1, 25) + 1):
+            alvo = rng.randint(200, 3500)
+            paragrafos = []
+            while sum(len(p) for p in paragrafos) < alvo:
+                paragrafos.append(" ".join(frase() for _ in range(rng.randint(1, 8))))
+            paginas.append({'texto': "\n\n".join(paragrafos), 'pagina': numero})
+        corpus.append((f"KB_{d}_Sintetico.pdf", paginas))
+    return corpus
+
+def medir(corpus, estrategia):
+    docs = []
+    melhor = float('inf')
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        docs = [doc for nome, paginas in corpus for doc in gerar_chunks(paginas, nome, estrategia)]
+        melhor = min(melhor, time.perf_counter() - inicio)
+
+    caracteres_paginas = sum(len(p['texto']) for _, paginas in corpus for p in paginas)
+    caracteres_chunks = sum(len(doc['content']) for doc in docs)
+    alvo = estrategia.tamanho * (4 if estrategia.nome == "tokens" else 1)  # tokens -> ~caracteres
+    return {
+        'chunks': len(docs),
+        'media': caracteres_chunks / max(1, len(docs)),
+        'pequenos': sum(1 for doc in docs if len(doc['content']) < alvo * 0.25),
+        'bytes': sum(len(json.dumps(doc, ensure_ascii=False).encode('utf-8')) for doc in docs),
+        'repetido': caracteres_chunks / max(1, caracteres_paginas) - 1,
+        'multipagina': sum(1 for doc in docs if doc['page_end'] != doc['page_number']),
+        'paginas_s': sum(len(paginas) for _, paginas in corpus) / melhor,
+        'mb_s': caracteres_paginas / melhor / 1024 / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pasta", default=PDF_FOLDER)
+    parser.add_argument("--max-arquivos", type=int, default=200)
+    parser.add_argument("--sintetico", type=int, default=0, help="usa N documentos sintéticos em vez dos PDFs")
+    parser.add_argument("--estrategias", nargs="+", choices=list(ESTRATEGIAS), default=list(ESTRATEGIAS))
+    args = parser.parse_args()
+
+    if not args.sintetico and os.path.isdir(args.pasta) and any(n.lower().endswith('.pdf') for n in os.listdir(args.pasta)):
+        print(f"📂 Extraindo até {args.max_arquivos} PDFs de {args.pasta}...")
+        corpus = carregar_pdfs(args.pasta, args.max_arquivos)
+    else:
+        corpus = gerar_corpus(args.sintetico or 200)
+    total_paginas = sum(len(paginas) for _, paginas in corpus)
+    print(f"📊 {len(corpus)} documentos, {total_paginas} páginas\n")
+
+    print(f"{'estratégia':<26} | {'chunks':>7} | {'média':>6} | {'pequenos':>8} | {'índice MB':>9} | "
+          f"{'repetido':>8} | {'multipág.':>9} | {'pág/s':>8} | {'MB/s':>6}")
+    for nome in args.estrategias:
+        estrategia = criar_estrategia(nome)
+        r = medir(corpus, estrategia)
+        print(f"{estrategia.assinatura():<26} | {r['chunks']:>7} | {r['media']:>6.0f} | {r['pequenos']:>8} | "
+              f"{r['bytes'] / 1024 / 1024:>9.2f} | {r['repetido']:>8.1%} | {r['multipagina']:>9} | "
+              f"{r['paginas_s']:>8.0f} | {r['mb_s']:>6.2f}")
+
+if __name__ == "__main__":
+    main()
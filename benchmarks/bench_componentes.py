@@ -0,0 +1,221 @@
+"""Microbenchmarks dos componentes CPU-bound do motor RAG (offline, sem Azure).
+
+Mede ops/s e pico de memória (tracemalloc) de:
+  - CacheAvancado: consulta, inserção (com remoção pela política) e expiração
+    com 1k/10k/100k entradas
+  - DeduplicadorContexto.remover_duplicatas_inteligente, agrupar_por_documento e
+    formatar_contexto_otimizado com 25-500 resultados de busca
+  - gerar_chunks do indexador
+
+Uso:
+    python benchmarks/bench_componentes.py                         # só mede
+    python benchmarks/bench_componentes.py --salvar baseline.json  # grava baseline
+    python benchmarks/bench_componentes.py --comparar baseline.json [--tolerancia 0.25]
+    python benchmarks/bench_componentes.py --filtro cache --tamanhos-cache 1000 10000
+
+Com --comparar, termina com código 1 se algum caso ficar mais lento que a
+baseline além da tolerância.
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import contextlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RAG_CACHE_BACKEND", "memoria")
+os.environ.setdefault("RAG_LOG_LEVEL", "WARNING")
+
+import engine_rag
+from engine_rag import CacheAvancado, DeduplicadorContexto, agrupar_por_documento, formatar_contexto_otimizado
+from armazenamento_cache import ArmazenamentoMemoria
+from politicas_cache import PoliticaLRU
+from indexar_documentos import gerar_chunks
+from bench_deduplicacao import gerar_documentos
+
+TAMANHOS_CACHE = [1000, 10000, 100000]
+TAMANHOS_BUSCA = [25, 100, 500]
+REPETICOES = 5
+
+VOCABULARIO = [f"termo{i}" for i in range(5000)]
+
+def gerar_perguntas(quantidade, seed=1):
+    rng = random.Random(seed)
+    return [f"como {' '.join(rng.choice(VOCABULARIO) for _ in range(rng.randint(4, 10)))} no sistema {i}?"
+            for i in range(quantidade)]
+
+def criar_cache(perguntas, max_entradas=None):
+    cache = CacheAvancado(ArmazenamentoMemoria(), PoliticaLRU(max_entradas or len(perguntas) + 1))
+    for pergunta in perguntas:
+        cache.adicionar_ao_cache(pergunta, "resposta " * 40)
+    return cache
+
+def caso_cache_consulta(tamanho):
+    perguntas = gerar_perguntas(tamanho)
+    cache = criar_cache(perguntas)
+    rng = random.Random(2)
+    # Metade idêntica (hash), um quarto parecida (similaridade), um quarto inédita
+    consultas = []
+    for i in range(1000):
+        base = rng.choice(perguntas)
+        tipo = i % 4
+        if tipo < 2:
+            consultas.append(base)
+        elif tipo == 2:
+            consultas.append(base.replace("como", "como eu", 1))
+        else:
+            consultas.append(f"pergunta inédita {rng.choice(VOCABULARIO)} {rng.choice(VOCABULARIO)} {i}")
+
+    def executar():
+        for consulta in consultas:
+            cache.encontrar_pergunta_similar(consulta)
+        return len(consultas)
+    return executar
+
+def caso_cache_insercao(tamanho):
+    cache = criar_cache(gerar_perguntas(tamanho), max_entradas=tamanho)
+    rodada = [0]
+
+    def executar():
+        # Cache cheio: cada inserção também remove a entrada escolhida pela política
+        rodada[0] += 1
+        for pergunta in gerar_perguntas(500, seed=1000 + rodada[0]):
+            cache.adicionar_ao_cache(pergunta, "resposta " * 40)
+        return 500
+    return executar
+
+def caso_cache_expiracao(tamanho):
+    perguntas = gerar_perguntas(tamanho)
+    vencido = (datetime.now() - timedelta(hours=engine_rag.CACHE_EXPIRY_HOURS + 1)).isoformat()
+
+    def preparar():
+        cache = criar_cache(perguntas)
+        # Metade das entradas vencidas; a outra metade fica no heap sem ser tocada
+        for chave in list(cache.cache)[::2]:
+            cache.cache[chave]['timestamp'] = vencido
+            cache._agendar_expiracao(chave)
+        return cache
+
+    def executar(cache):
+        cache.limpar_cache_expirado()
+        return tamanho // 2
+    return executar, preparar
+
+def caso_deduplicacao(tamanho):
+    documentos = gerar_documentos(tamanho)
+    return lambda: (DeduplicadorContexto.remover_duplicatas_inteligente(documentos), 1)[1]
+
+def caso_agrupamento(tamanho):
+    documentos = gerar_documentos(tamanho)
+    for doc in documentos:
+        doc['filename'] = f"KB_{doc['chunk_id'] % max(1, tamanho // 5)}.pdf"
+    return lambda: (agrupar_por_documento(documentos), 1)[1]
+
+def caso_formatacao(tamanho):
+    documentos = sorted(gerar_documentos(tamanho), key=lambda d: -d['score'])
+    pergunta = "como configurar termo10 termo200 termo3000 no sistema?"
+    return lambda: (formatar_contexto_otimizado(documentos, pergunta), 1)[1]
+
+def caso_chunking(paginas):
+    rng = random.Random(4)
+    paginas_texto = [{'texto': ' '.join(rng.choice(VOCABULARIO) for _ in range(rng.randint(50, 900))),
+                      'pagina': i} for i in range(1, paginas + 1)]
+    return lambda: len(gerar_chunks(paginas_texto, "Manual de Operação (v2).pdf"))
+
+def montar_casos(tamanhos_cache, tamanhos_busca):
+    casos = {}
+    for tamanho in tamanhos_cache:
+        casos[f"cache_consulta_{tamanho}"] = lambda t=tamanho: caso_cache_consulta(t)
+        casos[f"cache_insercao_{tamanho}"] = lambda t=tamanho: caso_cache_insercao(t)
+        casos[f"cache_expiracao_{tamanho}"] = lambda t=tamanho: caso_cache_expiracao(t)
+    for tamanho in tamanhos_busca:
+        casos[f"deduplicacao_{tamanho}"] = lambda t=tamanho: caso_deduplicacao(t)
+        casos[f"agrupamento_{tamanho}"] = lambda t=tamanho: caso_agrupamento(t)
+        casos[f"formatacao_{tamanho}"] = lambda t=tamanho: caso_formatacao(t)
+    casos["chunking_200_paginas"] = lambda: caso_chunking(200)
+    return casos
+
+def medir(fabrica):
+    """Retorna (ops/s da melhor repetição, pico de memória em KB durante uma execução)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        caso = fabrica()
+        executar, preparar = caso if isinstance(caso, tuple) else (caso, None)
+
+        melhor = 0.0
+        for _ in range(REPETICOES):
+            argumentos = (preparar(),) if preparar else ()
+            inicio = time.perf_counter()
+            operacoes = executar(*argumentos)
+            melhor = max(melhor, operacoes / (time.perf_counter() - inicio))
+
+        argumentos = (preparar(),) if preparar else ()
+        tracemalloc.start()
+        executar(*argumentos)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return melhor, pico / 1024
+
+def comparar(resultados, baseline, tolerancia):
+    """Imprime a variação contra a baseline e retorna os casos que regrediram"""
+    regressoes = []
+    print(f"\n📏 Comparação com a baseline ({baseline.get('gerado_em', '?')}, tolerância {tolerancia:.0%})")
+    for nome, atual in resultados.items():
+        referencia = baseline['casos'].get(nome)
+        if referencia is None:
+            print(f"   {nome:<28} (novo)")
+            continue
+        variacao = atual['ops_s'] / referencia['ops_s'] - 1
+        marcador = "❌" if variacao < -tolerancia else "✅"
+        print(f"   {marcador} {nome:<28} {variacao:+7.1%} ops/s | "
+              f"memória {atual['pico_kb']:.0f} KB (baseline {referencia['pico_kb']:.0f} KB)")
+        if variacao < -tolerancia:
+            regressoes.append(nome)
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos-cache", type=int, nargs="+", default=TAMANHOS_CACHE)
+    parser.add_argument("--tamanhos-busca", type=int, nargs="+", default=TAMANHOS_BUSCA)
+    parser.add_argument("--filtro", default="", help="só executa casos cujo nome contém o texto")
+    parser.add_argument("--salvar", help="grava os resultados como baseline (JSON)")
+    parser.add_argument("--comparar", help="baseline (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="queda de ops/s aceita (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    casos = {nome: fabrica for nome, fabrica in montar_casos(args.tamanhos_cache, args.tamanhos_busca).items()
+             if args.filtro in nome}
+
+    resultados = {}
+    print(f"{'caso':<28} | {'ops/s':>12} | {'pico memória':>13}")
+    for nome, fabrica in casos.items():
+        ops_s, pico_kb = medir(fabrica)
+        resultados[nome] = {'ops_s': round(ops_s, 2), 'pico_kb': round(pico_kb, 1)}
+        print(f"{nome:<28} | {ops_s:>12,.1f} | {pico_kb:>10,.0f} KB")
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as f:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'maquina': platform.platform(),
+                'casos': resultados
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Baseline gravada em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressoes = comparar(resultados, baseline, args.tolerancia)
+        if regressoes:
+            print(f"\n❌ {len(regressoes)} caso(s) regrediram: {', '.join(regressoes)}")
+            sys.exit(1)
+        print("\n✅ Nenhuma regressão acima da tolerância")
+
+if __name__ == "__main__":
+    main()
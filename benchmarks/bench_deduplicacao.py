@@ -0,0 +1,94 @@
+"""Benchmark da deduplicação de contexto: algoritmo antigo (Jaccard par a par,
+re-tokenizando a cada comparação) vs. tokenização única + MinHash/LSH.
+
+Uso:
+    python benchmarks/bench_deduplicacao.py
+"""
+import os
+import io
+import sys
+import time
+import random
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RAG_CACHE_BACKEND", "memoria")
+os.environ.setdefault("RAG_LOG_LEVEL", "WARNING")
+
+from engine_rag import DeduplicadorContexto
+
+TAMANHOS = [25, 100, 500]
+REPETICOES = 5
+
+def gerar_documentos(quantidade, seed=42, palavras_por_chunk=180, fracao_duplicatas=0.3):
+    """Gera chunks sintéticos com uma fração de quase-duplicatas (5-30% das palavras trocadas)"""
+    rng = random.Random(seed)
+    vocabulario = [f"termo{i}" for i in range(3000)]
+    documentos = []
+    for i in range(quantidade):
+        if documentos and rng.random() < fracao_duplicatas:
+            base = rng.choice(documentos)
+            palavras = base['content'].split()
+            for _ in range(int(len(palavras) * rng.uniform(0.05, 0.3))):
+                palavras[rng.randrange(len(palavras))] = rng.choice(vocabulario)
+            filename = base['filename'] if rng.random() < 0.5 else f"KB_{rng.randrange(50)}.pdf"
+        else:
+            palavras = [rng.choice(vocabulario) for _ in range(palavras_por_chunk)]
+            filename = f"KB_{rng.randrange(50)}.pdf"
+        documentos.append({
+            'content': ' '.join(palavras),
+            'filename': filename,
+            'page': rng.randrange(1, 40),
+            'chunk_id': i,
+            'score': rng.random()
+        })
+    return documentos
+
+def remover_duplicatas_legado(documentos):
+    """Implementação anterior (referência): compara cada candidato com todos os aceitos"""
+    documentos_ordenados = sorted(
+        documentos,
+        key=lambda x: (-x.get('score', 0), x.get('page', 9999), x.get('chunk_id', 9999))
+    )
+    documentos_unicos = []
+    chunks_utilizados = set()
+    for doc in documentos_ordenados:
+        chunk_identifier = f"{doc['filename']}_{doc.get('page', 'N/A')}_{doc.get('chunk_id', 'N/A')}"
+        if chunk_identifier in chunks_utilizados:
+            continue
+        eh_duplicata = False
+        for unico in documentos_unicos:
+            sim_jaccard = DeduplicadorContexto.calcular_similaridade_jaccard(doc['content'], unico['content'])
+            mesmo_arquivo = doc['filename'] == unico['filename']
+            paginas_proximas = abs(int(doc['page']) - int(unico['page'])) <= 1
+            threshold_jaccard = 0.85 if mesmo_arquivo and paginas_proximas else 0.75
+            if sim_jaccard > threshold_jaccard:
+                eh_duplicata = True
+                break
+        if not eh_duplicata:
+            documentos_unicos.append(doc)
+            chunks_utilizados.add(chunk_identifier)
+    return documentos_unicos
+
+def medir(funcao, documentos):
+    melhor = float('inf')
+    resultado = None
+    for _ in range(REPETICOES):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            resultado = funcao(documentos)
+            melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+def main():
+    print(f"{'chunks':>7} | {'legado (ms)':>12} | {'novo (ms)':>10} | {'speedup':>8} | {'únicos':>7} | iguais")
+    for tamanho in TAMANHOS:
+        documentos = gerar_documentos(tamanho)
+        tempo_legado, unicos_legado = medir(remover_duplicatas_legado, documentos)
+        tempo_novo, unicos_novo = medir(DeduplicadorContexto.remover_duplicatas_inteligente, documentos)
+        iguais = [d['chunk_id'] for d in unicos_legado] == [d['chunk_id'] for d in unicos_novo]
+        print(f"{tamanho:>7} | {tempo_legado * 1000:>12.2f} | {tempo_novo * 1000:>10.2f} | "
+              f"{tempo_legado / tempo_novo:>7.1f}x | {len(unicos_novo):>7} | {'sim' if iguais else 'NÃO'}")
+
+if __name__ == "__main__":
+    main()
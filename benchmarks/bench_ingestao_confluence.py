@@ -0,0 +1,232 @@
+"""Benchmark: ingestão via PDF exportado x ingestão direta do HTML do Confluence.
+
+Sobe um servidor local que imita o Confluence (busca CQL com body.view e
+pdfpageexport.action, com latência configurável de renderização do PDF) e
+mede, para as mesmas páginas, até os documentos prontos para o índice:
+  - caminho PDF: listagem + download dos PDFs (download_confluence) +
+    extração com PyPDF2 + chunking
+  - caminho direto: listagem com body.view + HTML->texto + chunking
+    (ingestao_confluence)
+O upload ao Azure fica de fora (é igual nos dois caminhos). O servidor roda no
+mesmo processo, então o tempo de CPU inclui o trabalho dele nos dois caminhos.
+
+Uso:
+    python benchmarks/bench_ingestao_confluence.py [--paginas 200] [--latencia-pdf 0.3]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import threading
+from html import escape
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+LINHAS_POR_PAGINA_PDF = 55
+COLUNAS_PDF = 95
+
+def gerar_paginas(quantidade, seed=7):
+    """Páginas sintéticas: [(id, título, blocos)] com títulos, parágrafos, listas e tabelas"""
+    rng = random.Random(seed)
+    vocabulario = [f"termo{i}" for i in range(3000)] + ["servidor", "usuário", "acesso", "configuração", "erro"]
+
+    def frase():
+        return " ".join(rng.choice(vocabulario) for _ in range(rng.randint(5, 25))).capitalize() + "."
+
+    paginas = []
+    for i in range(quantidade):
+        blocos = []
+        for _ in range(rng.randint(3, 20)):
+            tipo = rng.choice(['h2', 'p', 'p', 'p', 'ul', 'table'])
+            if tipo == 'h2':
+                blocos.append(('h2', frase()[:60]))
+            elif tipo == 'p':
+                blocos.append(('p', " ".join(frase() for _ in range(rng.randint(1, 6)))))
+            elif tipo == 'ul':
+                blocos.append(('ul', [frase() for _ in range(rng.randint(2, 6))]))
+            else:
+                blocos.append(('table', [[rng.choice(vocabulario) for _ in range(4)] for _ in range(rng.randint(2, 8))]))
+        paginas.append((str(100000 + i), f"Procedimento {i} {rng.choice(vocabulario)}", blocos))
+    return paginas
+
+def renderizar_html(blocos):
+    partes = []
+    for tipo, conteudo in blocos:
+        if tipo == 'ul':
+            partes.append("<ul>" + "".join(f"<li><p>{escape(item)}</p></li>" for item in conteudo) + "</ul>")
+        elif tipo == 'table':
+            linhas = "".join("<tr>" + "".join(f"<td>{escape(c)}</td>" for c in linha) + "</tr>" for linha in conteudo)
+            partes.append(f'<div class="table-wrap"><table class="confluenceTable"><tbody>{linhas}</tbody></table></div>')
+        else:
+            partes.append(f"<{tipo}>{escape(conteudo)}</{tipo}>")
+    return "\n".join(partes)
+
+def linhas_texto(blocos):
+    """Texto das páginas quebrado em linhas de largura fixa, como num PDF"""
+    linhas = []
+    for tipo, conteudo in blocos:
+        if tipo == 'ul':
+            textos = [f"- {item}" for item in conteudo]
+        elif tipo == 'table':
+            textos = [" | ".join(linha) for linha in conteudo]
+        else:
+            textos = [conteudo]
+        for texto in textos:
+            atual = ""
+            for palavra in texto.split():
+                if atual and len(atual) + len(palavra) + 1 > COLUNAS_PDF:
+                    linhas.append(atual)
+                    atual = palavra
+                else:
+                    atual = f"{atual} {palavra}" if atual else palavra
+            linhas.append(atual)
+        linhas.append("")
+    return linhas
+
+def gerar_pdf(linhas):
+    """PDF mínimo (Helvetica, uma linha de texto por operador Tj) legível pelo PyPDF2"""
+    paginas = [linhas[i:i + LINHAS_POR_PAGINA_PDF] for i in range(0, len(linhas), LINHAS_POR_PAGINA_PDF)] or [[]]
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(paginas)))}] "
+        f"/Count {len(paginas)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, pagina in enumerate(paginas):
+        textos = " ".join(f"({l.replace(chr(92), '').replace('(', '').replace(')', '')}) Tj T*" for l in pagina)
+        stream = f"BT /F1 9 Tf 30 810 Td 13 TL {textos} ET".encode('latin-1', 'replace')
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objetos.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    saida = b"%PDF-1.4\n"
+    posicoes = []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += f"{numero} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    xref = len(saida)
+    saida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    saida += b"".join(f"{p:010d} 00000 n \n".encode() for p in posicoes)
+    saida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return saida
+
+def criar_servidor(paginas, latencia_api, latencia_pdf):
+    """Servidor HTTP local com a busca CQL e a exportação de PDF"""
+    por_id = {page_id: (titulo, blocos) for page_id, titulo, blocos in paginas}
+    pdfs = {}
+    lock_pdfs = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def responder(self, status, corpo, tipo):
+            self.send_response(status)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/rest/api/content/search":
+                time.sleep(latencia_api)
+                inicio, limite = int(query['start'][0]), int(query['limit'][0])
+                com_corpo = 'body.view' in query.get('expand', [''])[0]
+                resultados = []
+                for page_id, titulo, blocos in paginas[inicio:inicio + limite]:
+                    page = {'id': page_id, 'title': titulo,
+                            'version': {'number': 1, 'when': "2024-01-01T00:00:00.000Z"}}
+                    if com_corpo:
+                        page['body'] = {'view': {'value': renderizar_html(blocos), 'representation': 'view'}}
+                    resultados.append(page)
+                corpo = json.dumps({'results': resultados, 'start': inicio, 'limit': limite,
+                                    'size': len(resultados), 'totalSize': len(paginas)}).encode()
+                self.responder(200, corpo, "application/json")
+            elif url.path == "/spaces/flyingpdf/pdfpageexport.action":
+                time.sleep(latencia_pdf)  # renderização do PDF no servidor
+                page_id = query['pageId'][0]
+                with lock_pdfs:
+                    if page_id not in pdfs:
+                        pdfs[page_id] = gerar_pdf(linhas_texto(por_id[page_id][1]))
+                self.responder(200, pdfs[page_id], "application/pdf")
+            else:
+                self.responder(404, b"{}", "application/json")
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def medir(funcao):
+    inicio_cpu, inicio = time.process_time(), time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # sem o progresso página a página do download
+        resultado = funcao()
+    return resultado, time.perf_counter() - inicio, time.process_time() - inicio_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paginas", type=int, default=200)
+    parser.add_argument("--latencia-api", type=float, default=0.05, help="segundos por requisição de listagem")
+    parser.add_argument("--latencia-pdf", type=float, default=0.3, help="segundos para renderizar cada PDF")
+    parser.add_argument("--chunking", default="frases")
+    args = parser.parse_args()
+
+    paginas = gerar_paginas(args.paginas)
+    servidor = criar_servidor(paginas, args.latencia_api, args.latencia_pdf)
+    pasta = tempfile.mkdtemp(prefix="bench_ingestao_")
+    os.chdir(pasta)  # download_confluence cria a pasta de PDFs no diretório atual
+    os.environ.update({'CONFLUENCE_URL': f"http://127.0.0.1:{servidor.server_address[1]}",
+                       'CONFLUENCE_API_TOKEN': "bench", 'CONFLUENCE_SPACE_KEY': "BENCH"})
+
+    import download_confluence
+    from indexar_documentos import extrair_texto_com_paginas, gerar_chunks
+    from ingestao_confluence import LIMITE_LISTAGEM_CORPO, documentos_pagina
+    from estrategias_chunking import criar_estrategia
+    estrategia = criar_estrategia(args.chunking)
+    print(f"📊 {len(paginas)} páginas, latência da listagem {args.latencia_api}s, "
+          f"renderização do PDF {args.latencia_pdf}s, chunking {estrategia.assinatura()}\n")
+
+    def caminho_pdf():
+        pages = download_confluence.buscar_paginas_confluence()
+        baixados = download_confluence.baixar_paginas(pages, forcar=True)[0]
+        docs = []
+        for page in baixados:
+            nome = download_confluence.nome_arquivo_kb(page['id'], page['title'])
+            paginas_texto = extrair_texto_com_paginas(os.path.join(download_confluence.PDF_FOLDER, nome))
+            docs.extend(gerar_chunks(paginas_texto, nome, estrategia))
+        return docs
+
+    def caminho_direto():
+        docs = []
+        for lote in download_confluence.iterar_paginas_confluence(expand='body.view,version', limit=LIMITE_LISTAGEM_CORPO):
+            for page in lote:
+                docs.extend(documentos_pagina(page, estrategia)[0])
+        return docs
+
+    resultados = []
+    for nome, funcao in (("PDF (exportação + PyPDF2)", caminho_pdf), ("direto (body.view + HTML)", caminho_direto)):
+        docs, segundos, cpu = medir(funcao)
+        resultados.append((nome, docs, segundos, cpu))
+
+    print(f"\n{'caminho':<26} | {'tempo s':>8} | {'CPU s':>7} | {'pág/s':>7} | {'chunks':>7} | {'caracteres':>10}")
+    for nome, docs, segundos, cpu in resultados:
+        print(f"{nome:<26} | {segundos:>8.2f} | {cpu:>7.2f} | {len(paginas) / segundos:>7.1f} | {len(docs):>7} | "
+              f"{sum(len(doc['content']) for doc in docs):>10}")
+    print(f"\n⚡ Ingestão direta {resultados[0][2] / resultados[1][2]:.1f}x mais rápida "
+          f"({resultados[0][3] / max(resultados[1][3], 1e-9):.1f}x menos CPU)")
+    servidor.shutdown()
+
+if __name__ == "__main__":
+    main()
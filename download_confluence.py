@@ -1,7 +1,15 @@
 import os
+import json
+import time
+import argparse
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from manifestos import carregar_manifesto as ler_manifesto, salvar_manifesto
 
 # Carrega as variáveis do arquivo .env
 load_dotenv('.env')
@@ -16,99 +24,312 @@ PDF_FOLDER = "kbs_confluence"
 if not os.path.exists(PDF_FOLDER):
     os.makedirs(PDF_FOLDER)
 
-def verificar_kb_existente(page_id, title):
-    """Verifica se o KB já existe na pasta e retorna o caminho se existir."""
+# Concorrência adaptativa dos downloads (AIMD): começa em INICIAL, fica entre 1 e MAX
+CONCORRENCIA_INICIAL = int(os.getenv("CONFLUENCE_CONCURRENCY", "8"))
+CONCORRENCIA_MAX = int(os.getenv("CONFLUENCE_MAX_CONCURRENCY", "32"))
+TENTATIVAS_HTTP = int(os.getenv("CONFLUENCE_RETRIES", "5"))
+TIMEOUT_HTTP = (10, 120)  # (conexão, leitura) em segundos; a exportação de PDF é lenta
+
+# Sincronização incremental: página -> versão/data de modificação/arquivo
+CONFLUENCE_MANIFEST = os.getenv("CONFLUENCE_MANIFEST", "confluence_manifesto.json")
+LIMITE_LISTAGEM = 100  # páginas por requisição de listagem
+# Margem ao consultar "modificadas desde". O CQL interpreta a data no fuso do usuário
+# do token; reler um dia de alterações é barato porque a versão evita downloads repetidos
+MARGEM_SINCRONIZACAO_MIN = int(os.getenv("CONFLUENCE_SYNC_MARGIN_MIN", "1440"))
+
+_sessao = None
+_lock_sessao = threading.Lock()
+
+def criar_sessao(pool=CONCORRENCIA_MAX, tentativas=TENTATIVAS_HTTP):
+    """Sessão HTTP com pool de conexões (keep-alive) e retry com backoff.
+
+    429/5xx são refeitos até `tentativas` vezes com backoff exponencial, respeitando
+    o header Retry-After quando o Confluence o envia.
+    """
+    retry = Retry(
+        total=tentativas,
+        backoff_factor=1,
+        backoff_max=60,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=pool, max_retries=retry)
+    sessao = requests.Session()
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    sessao.headers.update({'Authorization': f'Bearer {CONFLUENCE_API_TOKEN}'})
+    return sessao
+
+def get_sessao():
+    """Sessão compartilhada por todas as threads do processo"""
+    global _sessao
+    with _lock_sessao:
+        if _sessao is None:
+            _sessao = criar_sessao()
+        return _sessao
+
+def tentativas_refeitas(response):
+    """Quantas vezes o urllib3 refez a requisição antes desta resposta"""
+    retries = getattr(response.raw, 'retries', None)
+    return len(retries.history) if retries is not None else 0
+
+class LimitadorAIMD:
+    """Limite de requisições simultâneas ajustado pela latência e pelos erros (AIMD).
+
+    Cada resposta rápida e sem retry soma 1/limite (≈ +1 por rodada completa);
+    erro, throttling (429/5xx refeitos) ou latência acima de `fator_latencia` x a
+    melhor latência observada cortam o limite pela metade, no máximo uma vez
+    por janela de latência para que uma rajada de falhas não derrube tudo a 1.
+    """
+
+    def __init__(self, inicial=CONCORRENCIA_INICIAL, minimo=1, maximo=CONCORRENCIA_MAX, fator_latencia=3.0):
+        self.limite = float(max(minimo, min(inicial, maximo)))
+        self.minimo = minimo
+        self.maximo = maximo
+        self.fator_latencia = fator_latencia
+        self.em_uso = 0
+        self.latencia_base = None
+        self.ultima_reducao = 0.0
+        self.reducoes = 0
+        self.pico = int(self.limite)
+        self.condicao = threading.Condition()
+
+    def adquirir(self):
+        with self.condicao:
+            while self.em_uso >= int(self.limite):
+                self.condicao.wait()
+            self.em_uso += 1
+
+    def liberar(self, latencia, sobrecarga=False):
+        with self.condicao:
+            self.em_uso -= 1
+            if self.latencia_base is None or latencia < self.latencia_base:
+                self.latencia_base = latencia
+            lento = latencia > self.latencia_base * self.fator_latencia
+            agora = time.monotonic()
+            if sobrecarga or lento:
+                if agora - self.ultima_reducao > max(latencia, 1.0):
+                    self.limite = max(self.minimo, self.limite / 2)
+                    self.ultima_reducao = agora
+                    self.reducoes += 1
+            else:
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+                self.pico = max(self.pico, int(self.limite))
+            self.condicao.notify_all()
+
+def nome_arquivo_kb(page_id, title):
+    """Nome do PDF salvo para a página"""
     safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
-    pdf_filename = f"KB_{page_id}_{safe_title}.pdf"
+    return f"KB_{page_id}_{safe_title}.pdf"
+
+def listar_pasta_kbs(pasta=PDF_FOLDER):
+    """Uma única varredura da pasta: nome -> (tamanho, mtime) dos PDFs e dos downloads parciais (.part)"""
+    arquivos = {}
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.name.endswith(('.pdf', '.part')) and entrada.is_file():
+                info = entrada.stat()
+                arquivos[entrada.name] = (info.st_size, info.st_mtime)
+    return arquivos
+
+def verificar_kb_existente(page_id, title, existentes=None):
+    """Verifica se o KB já existe na pasta e retorna o caminho se existir.
+    
+    Com `existentes` (resultado de listar_pasta_kbs) consulta a varredura em vez do disco.
+    """
+    pdf_filename = nome_arquivo_kb(page_id, title)
     pdf_path = os.path.join(PDF_FOLDER, pdf_filename)
     
-    if os.path.exists(pdf_path):
+    if (pdf_filename in existentes) if existentes is not None else os.path.exists(pdf_path):
         return pdf_path
     return None
 
-def buscar_paginas_confluence():
-    # URL específica para buscar páginas do espaço
-    url = f"{CONFLUENCE_URL}/rest/api/content"
+def buscar_lote_paginas(cql, start, limit=LIMITE_LISTAGEM, expand='version'):
+    """Uma página da busca CQL (com a versão de cada página); levanta RequestException"""
+    params = {
+        'cql': cql,
+        'expand': expand,
+        'limit': limit,
+        'start': start
+    }
+    response = get_sessao().get(f"{CONFLUENCE_URL}/rest/api/content/search", params=params,
+                                headers={'Accept': 'application/json'}, timeout=TIMEOUT_HTTP)
+    response.raise_for_status()
+    return response.json()
+
+def iterar_paginas_confluence(desde=None, expand='version', limit=LIMITE_LISTAGEM, resumo=None):
+    """Gera as páginas do espaço em lotes, à medida que as requisições terminam.
+    
+    Só as modificadas a partir de `desde`, se informado. A primeira requisição
+    informa o total (totalSize) e as demais faixas são buscadas em paralelo; sem
+    o total, pagina sequencialmente até uma resposta vazia. O Confluence pode
+    devolver menos páginas que o `limit` pedido (principalmente com o corpo
+    expandido), então as faixas avançam pelo tamanho que ele de fato usou.
+    Se `resumo` (dict) for informado, recebe 'total' (None se o servidor não
+    informou). Levanta RequestException se alguma requisição falhar (a
+    listagem ficaria incompleta).
+    """
+    cql = f'space="{CONFLUENCE_SPACE_KEY}" and type=page'
+    if desde is not None:
+        cql += f' and lastmodified >= "{desde.strftime("%Y-%m-%d %H:%M")}"'
+    
+    primeiro = buscar_lote_paginas(cql, 0, limit, expand)
+    pages = primeiro.get('results', [])
+    total = primeiro.get('totalSize')
+    if resumo is not None:
+        resumo['total'] = total
+    yield pages
+    
+    if total is not None:
+        # Tamanho de página efetivo: o limite informado na resposta ou quantas vieram
+        passo = min(n for n in (limit, primeiro.get('limit'), len(pages)) if n)
+        inicios = range(passo, total, passo)
+        with ThreadPoolExecutor(max_workers=CONCORRENCIA_INICIAL) as executor:
+            # map mantém a ordem das faixas
+            yield from (dados.get('results', []) for dados in
+                        executor.map(lambda start: buscar_lote_paginas(cql, start, passo, expand), inicios))
+    else:
+        start = 0
+        while pages:
+            start += len(pages)
+            pages = buscar_lote_paginas(cql, start, limit, expand).get('results', [])
+            if pages:
+                yield pages
+
+def listagem_completa(ids_listados, resumo):
+    """A listagem trouxe todas as páginas que o servidor disse ter? (sem isso, não é seguro apagar nada)"""
+    return resumo.get('total') is None or len(ids_listados) >= resumo['total']
+
+def buscar_paginas_confluence(desde=None, resumo=None):
+    """Lista as páginas do espaço (só as modificadas a partir de `desde`, se informado)"""
     all_pages = []
-    start = 0
-    limit = 100  # Número de páginas por requisição
-    
-    while True:
-        params = {
-            'spaceKey': CONFLUENCE_SPACE_KEY,
-            'type': 'page',
-            'limit': limit,
-            'start': start
-        }
-        
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {CONFLUENCE_API_TOKEN}'
-        }
-        
-        try:
-            response = requests.get(url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Adiciona as páginas encontradas à lista
-            pages = data.get('results', [])
-            all_pages.extend(pages)
-            
-            # Verifica se há mais páginas para buscar
-            if len(pages) < limit:
-                break
-                
-            # Atualiza o índice inicial para a próxima página
-            start += limit
-            
-            print(f"📥 Baixadas {len(all_pages)} páginas até agora...")
-            
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Erro ao buscar páginas: {str(e)}")
-            if hasattr(e.response, 'text'):
-                print(f"Resposta do servidor: {e.response.text}")
-            break
-    
-    return all_pages
-
-def baixar_pdf_confluence(page_id, title):
+    for pages in iterar_paginas_confluence(desde, resumo=resumo):
+        all_pages.extend(pages)
+        print(f"📥 Listadas {len(all_pages)} páginas até agora...")
+    
+    # Uma página editada durante a listagem pode aparecer em duas faixas
+    return list({page['id']: page for page in all_pages}.values())
+
+def validar_pdf(caminho, tamanho_esperado=None):
+    """Confere tamanho (Content-Length) e as marcas de início/fim de um PDF; retorna o erro ou None"""
+    tamanho = os.path.getsize(caminho)
+    if tamanho_esperado is not None and tamanho != tamanho_esperado:
+        return f"tamanho {tamanho} diferente do esperado {tamanho_esperado}"
+    with open(caminho, 'rb') as f:
+        inicio = f.read(5)
+        f.seek(max(0, tamanho - 1024))
+        fim = f.read()
+    if inicio != b'%PDF-':
+        return "arquivo não começa com %PDF-"
+    if b'%%EOF' not in fim:
+        return "arquivo sem %%EOF (truncado?)"
+    return None
+
+def carregar_meta_parcial(caminho_meta):
     try:
-        # Verifica se o KB já existe
-        pdf_path = verificar_kb_existente(page_id, title)
-        if pdf_path:
-            print(f"📄 KB já existe: {os.path.basename(pdf_path)}")
-            return True
+        with open(caminho_meta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def descartar_parcial(parcial, existentes=None):
+    """Apaga um download parcial e o validador salvo para retomá-lo"""
+    for caminho in (parcial, parcial + '.json'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    if existentes is not None:
+        existentes.pop(os.path.basename(parcial), None)
 
+def baixar_pdf_confluence(page_id, title, limitador=None, existentes=None):
+    """Baixa o PDF da página (sobrescrevendo o anterior) de forma atômica.
+    
+    O conteúdo vai para `<arquivo>.part` e só é renomeado para o nome final depois
+    de validado (content-type, tamanho e marcas do PDF). Se um download anterior foi
+    interrompido, continua de onde parou com um header Range (If-Range com o
+    ETag/Last-Modified salvo garante que o arquivo no servidor é o mesmo).
+    """
+    try:
         # URL para download direto do PDF
         url = f"{CONFLUENCE_URL}/spaces/flyingpdf/pdfpageexport.action?pageId={page_id}"
         
-        # Configuração da autenticação Bearer Token
-        headers = {
-            'Authorization': f'Bearer {CONFLUENCE_API_TOKEN}'
-        }
+        # Cria nome do arquivo PDF
+        pdf_filename = nome_arquivo_kb(page_id, title)
+        pdf_path = os.path.join(PDF_FOLDER, pdf_filename)
+        parcial = pdf_path + '.part'
+        caminho_meta = parcial + '.json'
         
-        # Faz o download do PDF
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()
+        # Sem compressão: Content-Length e os offsets do Range precisam ser os
+        # mesmos bytes gravados no disco (o requests descomprime gzip sozinho)
+        headers = {'Accept-Encoding': 'identity'}
+        ja_baixado = 0
+        tem_parcial = (pdf_filename + '.part' in existentes) if existentes is not None else os.path.exists(parcial)
+        meta = carregar_meta_parcial(caminho_meta) if tem_parcial else None
+        if meta and meta.get('validador'):
+            ja_baixado = os.path.getsize(parcial)
+            headers.update({'Range': f'bytes={ja_baixado}-', 'If-Range': meta['validador']})
         
-        # Verifica se o conteúdo é realmente um PDF
-        if 'application/pdf' not in response.headers.get('content-type', '').lower():
-            print(f"⚠️ A resposta não é um PDF para a página {title}")
-            return False
+        # Faz o download do PDF (a autenticação Bearer está na sessão). A vaga do
+        # limitador vale até o arquivo ser salvo, e a resposta é sempre fechada
+        # para a conexão voltar ao pool
+        if limitador:
+            limitador.adquirir()
+        inicio = time.perf_counter()
+        latencia = None
+        sobrecarga = True
+        try:
+            with get_sessao().get(url, headers=headers, stream=True, timeout=TIMEOUT_HTTP) as response:
+                latencia = time.perf_counter() - inicio  # até os headers: não depende do tamanho do PDF
+                sobrecarga = response.status_code in (429, 500, 502, 503, 504) or tentativas_refeitas(response) > 0
+                if response.status_code == 416:
+                    # O parcial não corresponde mais ao arquivo do servidor: recomeça na próxima tentativa
+                    descartar_parcial(parcial, existentes)
+                response.raise_for_status()
+                
+                # Verifica se o conteúdo é realmente um PDF
+                if 'application/pdf' not in response.headers.get('content-type', '').lower():
+                    print(f"⚠️ A resposta não é um PDF para a página {title}")
+                    return False
+                
+                retomado = response.status_code == 206
+                if not retomado:
+                    ja_baixado = 0
+                comprimido = response.headers.get('content-encoding', 'identity').lower() != 'identity'
+                tamanho_resposta = None if comprimido else response.headers.get('content-length')
+                tamanho_esperado = ja_baixado + int(tamanho_resposta) if tamanho_resposta else None
+                
+                # Guarda o validador para uma retomada futura (só se o servidor aceita Range)
+                validador = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                if not retomado:
+                    if validador and not comprimido and response.headers.get('Accept-Ranges', '').lower() == 'bytes':
+                        with open(caminho_meta, 'w', encoding='utf-8') as f:
+                            json.dump({'validador': validador}, f)
+                    elif os.path.exists(caminho_meta):
+                        os.remove(caminho_meta)
+                
+                # Salva no arquivo parcial (anexa se o servidor retomou o download)
+                with open(parcial, 'ab' if retomado else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        if chunk:
+                            f.write(chunk)
+        finally:
+            if limitador:
+                limitador.liberar(latencia if latencia is not None else time.perf_counter() - inicio, sobrecarga)
         
-        # Cria nome do arquivo PDF
-        safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
-        pdf_filename = f"KB_{page_id}_{safe_title}.pdf"
-        pdf_path = os.path.join(PDF_FOLDER, pdf_filename)
+        erro = validar_pdf(parcial, tamanho_esperado)
+        if erro:
+            descartar_parcial(parcial, existentes)
+            print(f"⚠️ PDF inválido para a página {title}: {erro}")
+            return False
         
-        # Salva o PDF
-        with open(pdf_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        os.replace(parcial, pdf_path)
+        descartar_parcial(parcial, existentes)
+        if existentes is not None:
+            info = os.stat(pdf_path)
+            existentes[pdf_filename] = (info.st_size, info.st_mtime)
         
-        print(f"✅ PDF baixado: {pdf_filename}")
+        print(f"✅ PDF baixado: {pdf_filename}" + (f" (retomado de {ja_baixado} bytes)" if ja_baixado else ""))
         return True
         
     except Exception as e:
@@ -117,41 +338,148 @@ def baixar_pdf_confluence(page_id, title):
             print(f"Resposta do servidor: {e.response.text}")
         return False
 
-def baixar_pdf_wrapper(page):
+def baixar_pdf_wrapper(page, limitador=None, forcar=False, existentes=None):
     page_id = page['id']
     title = page['title']
-    pdf_path = verificar_kb_existente(page_id, title)
-    if pdf_path:
+    if not forcar and verificar_kb_existente(page_id, title, existentes):
         return ('existente', title)
-    if baixar_pdf_confluence(page_id, title):
+    if baixar_pdf_confluence(page_id, title, limitador, existentes):
         return ('baixado', title)
     return ('erro', title)
 
-def processar_paginas_confluence():
-    pages = buscar_paginas_confluence()
+def baixar_paginas(pages, forcar=False, existentes=None):
+    """Baixa as páginas com concorrência adaptativa; retorna (baixadas, existentes, com erro)"""
+    if existentes is None:
+        existentes = listar_pasta_kbs()
     pdfs_baixados = []
     pdfs_existentes = []
     pdfs_erro = []
-
-    print(f"\n📁 Salvando PDFs na pasta: {PDF_FOLDER}")
-    print(f"📚 Total de páginas encontradas: {len(pages)}")
-
-    with ThreadPoolExecutor(max_workers=30) as executor:  # Ajuste max_workers conforme necessário
-        future_to_page = {executor.submit(baixar_pdf_wrapper, page): page for page in pages}
+    
+    # As threads cobrem o máximo; quantas baixam ao mesmo tempo é decidido pelo limitador
+    limitador = LimitadorAIMD()
+    print(f"⚙️ Concorrência adaptativa: início {int(limitador.limite)}, máximo {limitador.maximo}")
+    with ThreadPoolExecutor(max_workers=limitador.maximo) as executor:
+        future_to_page = {executor.submit(baixar_pdf_wrapper, page, limitador, forcar, existentes): page for page in pages}
         for i, future in enumerate(as_completed(future_to_page), 1):
             status, title = future.result()
+            page = future_to_page[future]
             if status == 'baixado':
-                pdfs_baixados.append(title)
+                pdfs_baixados.append(page)
                 print(f"[{i}/{len(pages)}] Baixado: {title}")
             elif status == 'existente':
-                pdfs_existentes.append(title)
+                pdfs_existentes.append(page)
                 print(f"[{i}/{len(pages)}] Já existe: {title}")
             else:
-                pdfs_erro.append(title)
+                pdfs_erro.append(page)
                 print(f"[{i}/{len(pages)}] Erro: {title}")
-
+            if i % 100 == 0:
+                print(f"⚙️ Concorrência atual: {int(limitador.limite)}")
+    
+    print(f"⚙️ Concorrência final {int(limitador.limite)} (pico {limitador.pico}, {limitador.reducoes} reduções)")
     return pdfs_baixados, pdfs_existentes, pdfs_erro
 
+def processar_paginas_confluence():
+    try:
+        pages = buscar_paginas_confluence()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Erro ao buscar páginas: {str(e)}")
+        if hasattr(e.response, 'text'):
+            print(f"Resposta do servidor: {e.response.text}")
+        return [], [], []
+    
+    print(f"\n📁 Salvando PDFs na pasta: {PDF_FOLDER}")
+    print(f"📚 Total de páginas encontradas: {len(pages)}")
+    
+    baixados, existentes, erros = baixar_paginas(pages)
+    return ([p['title'] for p in baixados], [p['title'] for p in existentes], [p['title'] for p in erros])
+
+def carregar_manifesto(caminho=CONFLUENCE_MANIFEST):
+    return ler_manifesto(caminho, {'ultima_sincronizacao': None, 'paginas': {}})
+
+def versao_pagina(page):
+    """(número da versão, data de modificação ISO) informados pela listagem"""
+    versao = page.get('version') or {}
+    return versao.get('number'), versao.get('when')
+
+def precisa_baixar(page, registro, existentes):
+    """Decide se a página listada precisa ser (re)baixada"""
+    numero, modificado = versao_pagina(page)
+    arquivo = existentes.get(nome_arquivo_kb(page['id'], page['title']))
+    if arquivo is None:
+        return True
+    if registro is not None:
+        return registro.get('versao') != numero
+    # Sem registro (PDF de um download antigo): só baixa de novo se a página é mais nova que o arquivo
+    if not modificado:
+        return True
+    return datetime.fromisoformat(modificado.replace('Z', '+00:00')).timestamp() > arquivo[1]
+
+def sincronizar_confluence(completo=False, caminho=CONFLUENCE_MANIFEST):
+    """Baixa só as páginas novas ou com versão diferente da registrada no manifesto.
+    
+    Sem manifesto (ou com `completo`), lista o espaço inteiro e também apaga os PDFs
+    de páginas que não existem mais. Caso contrário lista só as modificadas desde
+    a última sincronização (CQL lastmodified). A data da sincronização só avança
+    se todas as páginas alteradas forem baixadas, então falhas são refeitas na
+    próxima execução.
+    """
+    manifesto = carregar_manifesto(caminho)
+    registros = manifesto['paginas']
+    ultima = manifesto.get('ultima_sincronizacao')
+    completo = completo or not ultima
+    inicio = datetime.now(timezone.utc)
+    
+    desde = None
+    if not completo:
+        desde = datetime.fromisoformat(ultima) - timedelta(minutes=MARGEM_SINCRONIZACAO_MIN)
+    resumo = {}
+    try:
+        pages = buscar_paginas_confluence(desde, resumo)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Erro ao listar páginas, sincronização abortada: {str(e)}")
+        return None
+    
+    existentes = listar_pasta_kbs()
+    alteradas = [page for page in pages if precisa_baixar(page, registros.get(page['id']), existentes)]
+    if completo:
+        print(f"📚 Listagem completa: {len(pages)} páginas, {len(alteradas)} novas/alteradas")
+    else:
+        print(f"📚 {len(pages)} páginas modificadas desde {desde:%Y-%m-%d %H:%M} UTC, {len(alteradas)} a baixar")
+    
+    baixados, _, erros = baixar_paginas(alteradas, forcar=True, existentes=existentes)
+    ids_erro = {page['id'] for page in erros}
+    
+    for page in pages:
+        if page['id'] in ids_erro:
+            continue
+        numero, modificado = versao_pagina(page)
+        arquivo = nome_arquivo_kb(page['id'], page['title'])
+        anterior = registros.get(page['id'])
+        if anterior and anterior['arquivo'] != arquivo and existentes.pop(anterior['arquivo'], None):
+            # Título mudou: o PDF antigo ficaria duplicado na pasta
+            os.remove(os.path.join(PDF_FOLDER, anterior['arquivo']))
+        registros[page['id']] = {'versao': numero, 'modificado': modificado, 'titulo': page['title'],
+                                 'arquivo': arquivo}
+    
+    removidas = []
+    listadas = {page['id'] for page in pages}
+    if completo and not listagem_completa(listadas, resumo):
+        print(f"⚠️ A listagem trouxe {len(listadas)} de {resumo['total']} páginas; "
+              f"nenhum PDF será apagado nesta execução")
+    elif completo:
+        for page_id in [page_id for page_id in registros if page_id not in listadas]:
+            antigo = registros.pop(page_id)['arquivo']
+            if existentes.pop(antigo, None):
+                os.remove(os.path.join(PDF_FOLDER, antigo))
+            removidas.append(page_id)
+        if removidas:
+            print(f"🗑️ {len(removidas)} páginas removidas do Confluence tiveram o PDF apagado")
+    
+    if not erros:
+        manifesto['ultima_sincronizacao'] = inicio.isoformat()
+    salvar_manifesto(manifesto, caminho)
+    return {'listadas': len(pages), 'baixadas': len(baixados), 'erros': len(erros), 'removidas': len(removidas)}
+
 def validar_configuracao():
     variaveis_requeridas = {
         "CONFLUENCE_URL": CONFLUENCE_URL,
@@ -169,8 +497,24 @@ def validar_configuracao():
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Baixa as páginas do espaço do Confluence como PDF")
+    parser.add_argument("--sincronizar", action="store_true",
+                        help="baixa só páginas novas/alteradas desde a última sincronização (usa o manifesto)")
+    parser.add_argument("--completo", action="store_true",
+                        help="com --sincronizar: lista o espaço inteiro e apaga PDFs de páginas removidas")
+    args = parser.parse_args()
+    
     if not validar_configuracao():
         exit(1)
+    
+    if args.sincronizar:
+        print(f"🔄 Sincronização incremental (manifesto: {CONFLUENCE_MANIFEST})")
+        resultado = sincronizar_confluence(args.completo)
+        if resultado is None:
+            exit(1)
+        print(f"\n✅ Sincronização concluída: {resultado['baixadas']} PDFs baixados, "
+              f"{resultado['erros']} erros, {resultado['removidas']} removidos")
+        exit(1 if resultado['erros'] else 0)
         
     print("🚀 Iniciando download dos PDFs do Confluence...")
     pdfs_baixados, pdfs_existentes, pdfs_erro = processar_paginas_confluence()
@@ -1,16 +1,35 @@
 import os
-import json
+import re
+import time
+import heapq
+import hashlib
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 import numpy as np
+from scipy import sparse
 from datetime import datetime, timedelta
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
 from azure.search.documents import SearchClient
-from openai import AzureOpenAI
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from armazenamento_cache import criar_armazenamento, importar_json_legado
+from politicas_cache import criar_politica, tamanho_entrada
+from metricas import (medir, configurar_logging, LATENCIA_ETAPA, LATENCIA_REQUISICAO, CONSULTAS_CACHE,
+                      CONSULTAS_CACHE_BUSCA, ERROS, ENTRADAS_CACHE, BYTES_CACHE)
 
 load_dotenv()
 
+from tokenizacao import contar_tokens, spans_frases
+
+log = configurar_logging()
+
 # Configurações Azure
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")
 AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
@@ -20,10 +39,24 @@ AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 
 # Configurações avançadas
-CACHE_FILE = "cache_respostas_avancado.json"
+CACHE_FILE = "cache_respostas_avancado.json"  # formato legado, importado na primeira execução
+CACHE_BACKEND = os.getenv("RAG_CACHE_BACKEND", "sqlite")
+CACHE_PATHS = {
+    "sqlite": os.getenv("RAG_CACHE_PATH", "cache_respostas.db"),
+    "log": os.getenv("RAG_CACHE_PATH", "cache_respostas.log.jsonl"),
+}
+CACHE_COMPRESS = os.getenv("RAG_CACHE_COMPRESS", "0") == "1"
+CACHE_SHARED = os.getenv("RAG_CACHE_SHARED", "0") == "1"  # cache compartilhado entre workers (sqlite)
 CACHE_EXPIRY_HOURS = 48
 SIMILARITY_THRESHOLD = 0.85
-MAX_CACHE_SIZE = 1000
+MAX_CACHE_SIZE = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1000"))
+CACHE_EVICTION_POLICY = os.getenv("RAG_CACHE_EVICTION", "lru")
+CACHE_MAX_BYTES = int(os.getenv("RAG_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Índice vetorial incremental do cache
+HASH_FEATURES = 2 ** 18
+MAX_TERMOS_PERGUNTA = 64
+CAPACIDADE_INICIAL_INDICE = 1024
 
 # Configurações de qualidade
 MAX_TOKENS = int(os.getenv("RAG_MAX_TOKENS", "2000"))
@@ -31,6 +64,19 @@ TEMPERATURE = float(os.getenv("RAG_TEMPERATURE", "0.15"))
 TOP_P = float(os.getenv("RAG_TOP_P", "0.92"))
 SEARCH_TOP_RESULTS = int(os.getenv("RAG_SEARCH_TOP", "25"))
 CONTEXT_MAX_DOCS = int(os.getenv("RAG_CONTEXT_DOCS", "10"))
+CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "6000"))  # orçamento de tokens do contexto
+CONTEXT_FORMAT = os.getenv("RAG_CONTEXT_FORMAT", "completo")  # completo | compacto
+CONTEXT_TRIM = os.getenv("RAG_CONTEXT_TRIM", "1") == "1"  # recorta chunks às frases ligadas à pergunta
+STREAM_CACHE_CHUNK_CHARS = 64
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))
+
+# Cache de resultados de busca (separado do cache de respostas)
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("RAG_SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("RAG_SEARCH_CACHE_SIZE", "2000"))
+INDEX_GENERATION_FILE = os.getenv("RAG_INDEX_GENERATION_FILE", "indice_geracao.txt")
+INTERVALO_VERIFICACAO_GERACAO = 5  # segundos entre verificações do arquivo de geração
+# Modo de busca degradado volta a sondar os modos mais ricos após este intervalo ou uma reindexação
+SEARCH_REPROBE_SECONDS = int(os.getenv("RAG_SEARCH_REPROBE_SECONDS", "600"))
 
 # Cliente Azure OpenAI será criado quando necessário
 azure_openai_client = None
@@ -49,129 +95,541 @@ def get_azure_openai_client():
                 api_version="2024-12-01-preview",
                 azure_endpoint=AZURE_OPENAI_ENDPOINT
             )
-            print("✅ Cliente Azure OpenAI inicializado com sucesso")
+            log.info("✅ Cliente Azure OpenAI inicializado com sucesso")
             
         except Exception as e:
-            print(f"❌ Erro ao inicializar cliente Azure OpenAI: {e}")
+            log.error(f"❌ Erro ao inicializar cliente Azure OpenAI: {e}")
             raise
     
     return azure_openai_client
 
+azure_openai_async_client = None
+
+def get_azure_openai_async_client():
+    """Cria cliente assíncrono Azure OpenAI de forma lazy (um por processo)"""
+    global azure_openai_async_client
+    
+    if azure_openai_async_client is None:
+        if not all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_DEPLOYMENT]):
+            raise ValueError("Variáveis Azure OpenAI não configuradas no .env")
+        
+        azure_openai_async_client = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_KEY,
+            api_version="2024-12-01-preview",
+            azure_endpoint=AZURE_OPENAI_ENDPOINT
+        )
+        log.info("✅ Cliente assíncrono Azure OpenAI inicializado com sucesso")
+    
+    return azure_openai_async_client
+
+class IndiceVetorialIncremental:
+    """Índice TF-IDF em espaço de features hasheado, atualizado linha a linha.
+
+    Cada pergunta ocupa um slot de uma matriz densa pré-alocada com até
+    MAX_TERMOS_PERGUNTA termos (índice hasheado + contagem). A frequência de
+    documentos é mantida incrementalmente, então inserir e remover custam
+    O(MAX_TERMOS_PERGUNTA) e o IDF é recalculado só na consulta seguinte.
+    """
+
+    def __init__(self, capacidade=CAPACIDADE_INICIAL_INDICE):
+        self.hasher = HashingVectorizer(stop_words='english', n_features=HASH_FEATURES,
+                                        alternate_sign=False, norm=None)
+        self.indices = np.zeros((capacidade, MAX_TERMOS_PERGUNTA), dtype=np.int32)
+        self.contagens = np.zeros((capacidade, MAX_TERMOS_PERGUNTA), dtype=np.float32)
+        self.frequencia_documentos = np.zeros(HASH_FEATURES, dtype=np.int32)
+        self.chave_por_slot = [None] * capacidade
+        self.slot_por_chave = {}
+        self.slots_livres = list(range(capacidade - 1, -1, -1))
+        self.alto = 0
+        self._idf = None
+        self._consulta = np.zeros(HASH_FEATURES, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.slot_por_chave)
+
+    def termos(self, texto):
+        """Retorna (índices hasheados, contagens) dos termos de um texto"""
+        linha = self.hasher.transform([texto])
+        indices = linha.indices.astype(np.int32)
+        contagens = linha.data.astype(np.float32)
+        if len(indices) > MAX_TERMOS_PERGUNTA:
+            mais_frequentes = np.argsort(-contagens, kind='stable')[:MAX_TERMOS_PERGUNTA]
+            indices, contagens = indices[mais_frequentes], contagens[mais_frequentes]
+        return indices, contagens
+
+    def vetor_normalizado(self, texto, ignorar_desconhecidos=True):
+        """Vetor TF-IDF (índices, pesos com norma L2) de um texto com o IDF atual.
+        
+        Como no TfidfVectorizer.transform, termos que nenhuma pergunta do cache tem
+        ficam com peso zero; com `ignorar_desconhecidos=False` recebem o IDF máximo
+        (para comparar dois textos que não estão no cache).
+        """
+        indices, contagens = self.termos(texto)
+        total = len(self.slot_por_chave)
+        frequencias = self.frequencia_documentos[indices]
+        idf = np.log((1.0 + total) / (1.0 + frequencias)) + 1.0
+        pesos = contagens * idf
+        if ignorar_desconhecidos:
+            pesos = pesos * (frequencias > 0)
+        norma = np.sqrt(np.dot(pesos, pesos))
+        if norma > 0:
+            pesos = pesos / norma
+        return indices, pesos
+    
+    def _expandir(self):
+        """Dobra a capacidade da matriz (custo amortizado O(1) por inserção)"""
+        capacidade = len(self.chave_por_slot)
+        nova_capacidade = capacidade * 2
+        for nome in ('indices', 'contagens'):
+            atual = getattr(self, nome)
+            nova = np.zeros((nova_capacidade, MAX_TERMOS_PERGUNTA), dtype=atual.dtype)
+            nova[:capacidade] = atual
+            setattr(self, nome, nova)
+        self.chave_por_slot.extend([None] * capacidade)
+        self.slots_livres.extend(range(nova_capacidade - 1, capacidade - 1, -1))
+
+    def adicionar(self, chave, texto):
+        """Insere (ou substitui) a pergunta de uma chave"""
+        if chave in self.slot_por_chave:
+            self.remover(chave)
+        if not self.slots_livres:
+            self._expandir()
+
+        indices, contagens = self.termos(texto)
+        slot = self.slots_livres.pop()
+        self.indices[slot, :len(indices)] = indices
+        self.contagens[slot, :len(indices)] = contagens
+        self.frequencia_documentos[indices] += 1
+        self.chave_por_slot[slot] = chave
+        self.slot_por_chave[chave] = slot
+        self.alto = max(self.alto, slot + 1)
+        self._idf = None
+
+    def remover(self, chave):
+        """Remove a pergunta de uma chave, liberando o slot"""
+        slot = self.slot_por_chave.pop(chave, None)
+        if slot is None:
+            return
+        usados = self.contagens[slot] > 0
+        self.frequencia_documentos[self.indices[slot, usados]] -= 1
+        self.indices[slot] = 0
+        self.contagens[slot] = 0
+        self.chave_por_slot[slot] = None
+        self.slots_livres.append(slot)
+        self._idf = None
+
+    def _pesos_linhas(self):
+        """Calcula pesos TF-IDF e normas das linhas ocupadas (cacheado até a próxima escrita)"""
+        if self._idf is None:
+            total = len(self.slot_por_chave)
+            self._idf = np.log((1.0 + total) / (1.0 + self.frequencia_documentos)).astype(np.float32) + 1.0
+            # Termos que nenhuma pergunta do cache tem ficam com peso zero nas consultas,
+            # como o TfidfVectorizer.transform faz com palavras fora do vocabulário
+            self._idf[self.frequencia_documentos == 0] = 0.0
+            pesos = self.contagens[:self.alto] * self._idf[self.indices[:self.alto]]
+            self._pesos = pesos
+            self._normas = np.sqrt(np.einsum('ij,ij->i', pesos, pesos))
+        return self._pesos, self._normas
+
+    def mais_similar(self, texto):
+        """Retorna (chave, similaridade cosseno) da pergunta mais parecida"""
+        if not self.slot_por_chave:
+            return None, 0.0
+
+        pesos, normas = self._pesos_linhas()
+        indices, contagens = self.termos(texto)
+        pesos_consulta = contagens * self._idf[indices]
+        norma_consulta = float(np.sqrt(np.dot(pesos_consulta, pesos_consulta)))
+        if norma_consulta == 0:
+            return None, 0.0
+
+        self._consulta[indices] = pesos_consulta
+        try:
+            produtos = np.einsum('ij,ij->i', pesos, self._consulta[self.indices[:self.alto]])
+        finally:
+            self._consulta[indices] = 0
+
+        similaridades = np.divide(produtos, normas * norma_consulta,
+                                  out=np.zeros_like(produtos), where=normas > 0)
+        slot = int(np.argmax(similaridades))
+        return self.chave_por_slot[slot], float(similaridades[slot])
+    
+    def matriz_consultas(self, textos, ignorar_desconhecidos=True):
+        """Matriz TF-IDF (linhas com norma L2) de várias perguntas, vetorizadas de uma vez
+        (termos fora do cache: ver vetor_normalizado)"""
+        self._pesos_linhas()
+        idf = self._idf
+        if not ignorar_desconhecidos:
+            total = len(self.slot_por_chave)
+            idf = np.log((1.0 + total) / (1.0 + self.frequencia_documentos)).astype(np.float32) + 1.0
+        contagens = self.hasher.transform(textos).tocsr()
+        return normalize(contagens.multiply(idf).tocsr())
+    
+    def mais_similares_lote(self, consultas):
+        """(chave, similaridade) da pergunta mais parecida para cada linha de `consultas`,
+        calculado com um único produto de matrizes esparsas"""
+        if not self.slot_por_chave:
+            return [(None, 0.0)] * consultas.shape[0]
+        
+        pesos, normas = self._pesos_linhas()
+        linhas_normalizadas = np.divide(pesos, normas[:, None], out=np.zeros_like(pesos),
+                                        where=normas[:, None] > 0)
+        ponteiros = np.arange(0, self.alto * MAX_TERMOS_PERGUNTA + 1, MAX_TERMOS_PERGUNTA)
+        matriz_cache = sparse.csr_matrix(
+            (linhas_normalizadas.ravel(), self.indices[:self.alto].ravel(), ponteiros),
+            shape=(self.alto, HASH_FEATURES)
+        )
+        
+        similaridades = (consultas @ matriz_cache.T).tocsr()
+        slots = np.asarray(similaridades.argmax(axis=1)).ravel()
+        maximos = similaridades.max(axis=1).toarray().ravel()
+        return [(self.chave_por_slot[slot], float(maximo)) for slot, maximo in zip(slots, maximos)]
+
+def hash_pergunta(pergunta_normalizada):
+    """Hash estável da pergunta normalizada (chave do caminho rápido de match exato)"""
+    return hashlib.blake2b(pergunta_normalizada.encode('utf-8'), digest_size=16).hexdigest()
+
 class CacheAvancado:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
+    def __init__(self, armazenamento=None, politica=None, compartilhado=None):
+        if armazenamento is None:
+            armazenamento = criar_armazenamento(CACHE_BACKEND, CACHE_PATHS.get(CACHE_BACKEND),
+                                                comprimir=CACHE_COMPRESS)
+        if politica is None:
+            politica = criar_politica(CACHE_EVICTION_POLICY, MAX_CACHE_SIZE, CACHE_MAX_BYTES)
+        if compartilhado is None:
+            compartilhado = CACHE_SHARED
+        if compartilhado and not getattr(armazenamento, 'suporta_compartilhamento', False):
+            raise ValueError("Cache compartilhado entre processos exige RAG_CACHE_BACKEND=sqlite")
+        self.armazenamento = armazenamento
+        self.politica = politica
+        self.compartilhado = compartilhado
+        self.lock = threading.RLock()
+        self.contadores = {'evictions': 0, 'bytes_evicted': 0, 'expirations': 0, 'synced_changes': 0}
+        self._carregar_tudo()
+    
+    def _carregar_tudo(self):
+        """(Re)constrói cache e índices a partir do armazenamento"""
+        self.ultimo_evento = self.armazenamento.ultimo_evento() if self.compartilhado else 0
         self.cache = self.carregar_cache()
-        self.perguntas_vetorizadas = None
-        self._atualizar_vetorizacao()
+        self.indice = IndiceVetorialIncremental()
+        self.chave_por_hash = {}
+        self.expira_em = {}
+        self.fila_expiracao = []
+        self.usos = {}
+        self.soma_usos = 0
+        self.max_usos = 0
+        for chave in sorted(self.cache, key=lambda k: self.cache[k]['timestamp']):
+            self._registrar(chave)
     
     def carregar_cache(self):
-        """Carrega cache do arquivo"""
-        if os.path.exists(CACHE_FILE):
-            try:
-                with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
-    def salvar_cache(self):
-        """Salva cache no arquivo"""
+        """Carrega cache do armazenamento, importando o JSON legado na primeira execução"""
         try:
-            with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            cache = self.armazenamento.carregar()
         except Exception as e:
-            print(f"⚠️ Erro ao salvar cache: {e}")
-    
-    def _atualizar_vetorizacao(self):
-        """Atualiza a vetorização TF-IDF das perguntas em cache"""
-        if not self.cache:
-            return
+            log.error(f"❌ Erro ao carregar cache persistido: {e}")
+            raise
         
-        perguntas = [entry['pergunta_normalizada'] for entry in self.cache.values()]
-        if perguntas:
+        if self.armazenamento.novo and os.path.exists(CACHE_FILE):
             try:
-                self.perguntas_vetorizadas = self.vectorizer.fit_transform(perguntas)
-            except:
-                self.perguntas_vetorizadas = None
+                cache = importar_json_legado(CACHE_FILE)
+                self.armazenamento.importar(cache)
+                log.info(f"📦 Importadas {len(cache)} entradas do cache legado {CACHE_FILE}")
+            except Exception as e:
+                log.warning(f"⚠️ Erro ao importar cache legado {CACHE_FILE}: {e}")
+                cache = {}
+        return cache
+    
+    def salvar_entrada(self, chave):
+        """Persiste somente a entrada informada"""
+        try:
+            self.armazenamento.gravar(chave, self.cache[chave])
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao salvar cache: {e}")
     
     def normalizar_pergunta(self, pergunta):
         """Normaliza pergunta para comparação"""
         return ' '.join(pergunta.lower().strip().split())
     
-    def cache_expirado(self, timestamp):
-        """Verifica se entrada está expirada"""
+    def instante_expiracao(self, timestamp):
+        """Converte o timestamp ISO da entrada no instante (epoch) em que ela expira"""
         try:
             cache_time = datetime.fromisoformat(timestamp)
-            return datetime.now() - cache_time > timedelta(hours=CACHE_EXPIRY_HOURS)
+            return (cache_time + timedelta(hours=CACHE_EXPIRY_HOURS)).timestamp()
         except:
-            return True
+            return 0.0
+    
+    def _agendar_expiracao(self, chave):
+        """Registra o novo prazo da entrada no heap (prazos antigos viram lixo preguiçoso)"""
+        expira = self.instante_expiracao(self.cache[chave]['timestamp'])
+        self.expira_em[chave] = expira
+        heapq.heappush(self.fila_expiracao, (expira, chave))
+        
+        if len(self.fila_expiracao) > 2 * len(self.expira_em) + 64:
+            self.fila_expiracao = [(expira, chave) for chave, expira in self.expira_em.items()]
+            heapq.heapify(self.fila_expiracao)
+    
+    def _registrar(self, chave):
+        """Indexa uma entrada já presente em self.cache"""
+        pergunta_normalizada = self.cache[chave]['pergunta_normalizada']
+        self.indice.adicionar(chave, pergunta_normalizada)
+        self.chave_por_hash[hash_pergunta(pergunta_normalizada)] = chave
+        self.politica.registrar(chave, self.cache[chave])
+        self._agendar_expiracao(chave)
+        self._contabilizar_uso(chave)
+    
+    def _contabilizar_uso(self, chave):
+        """Mantém soma/máximo de uso_count sem percorrer o cache (usados por /stats)"""
+        uso = self.cache[chave].get('uso_count', 1)
+        self.soma_usos += uso - self.usos.get(chave, 0)
+        self.usos[chave] = uso
+        if self.max_usos is not None:
+            self.max_usos = max(self.max_usos, uso)
+    
+    def remover_entrada(self, chave):
+        """Remove uma entrada do cache, dos índices e do armazenamento"""
+        self._remover_local(chave)
+        try:
+            self.armazenamento.remover(chave)
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao remover entrada do cache: {e}")
+    
+    def _remover_local(self, chave):
+        """Remove uma entrada só da memória deste processo"""
+        entry = self.cache.pop(chave, None)
+        if entry is not None:
+            hash_entrada = hash_pergunta(entry['pergunta_normalizada'])
+            if self.chave_por_hash.get(hash_entrada) == chave:
+                del self.chave_por_hash[hash_entrada]
+        self.expira_em.pop(chave, None)
+        self.indice.remover(chave)
+        self.politica.remover(chave)
+        uso = self.usos.pop(chave, 0)
+        self.soma_usos -= uso
+        if self.max_usos is not None and uso and uso >= self.max_usos:
+            self.max_usos = None  # recalculado sob demanda em estatisticas_uso
+    
+    def sincronizar(self):
+        """Aplica inserções/remoções feitas por outros processos no armazenamento compartilhado"""
+        if not self.compartilhado:
+            return
+        
+        try:
+            alteracoes = self.armazenamento.alteracoes_desde(self.ultimo_evento)
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao sincronizar cache compartilhado: {e}")
+            return
+        
+        if alteracoes is None:
+            log.info("♻️ Cache local defasado demais, recarregando do armazenamento compartilhado")
+            self._carregar_tudo()
+            return
+        
+        self.ultimo_evento, mudancas, usos = alteracoes
+        for chave, entry in mudancas.items():
+            if entry is None:
+                self._remover_local(chave)
+            else:
+                self.cache[chave] = entry
+                self._registrar(chave)
+        for chave, (timestamp, uso_count) in usos.items():
+            self._aplicar_uso(chave, timestamp, uso_count)
+        self.contadores['synced_changes'] += len(mudancas) + len(usos)
+    
+    def _aplicar_uso(self, chave, timestamp, uso_count):
+        """Aplica um hit de outro processo: só prazo de expiração e estado da política"""
+        entry = self.cache.get(chave)
+        if entry is None:
+            return
+        entry['timestamp'] = timestamp
+        entry['uso_count'] = uso_count
+        self.politica.acessar(chave, entry)
+        self._agendar_expiracao(chave)
+        self._contabilizar_uso(chave)
     
     def limpar_cache_expirado(self):
-        """Remove entradas expiradas do cache"""
-        chaves_expiradas = []
-        for chave, entry in self.cache.items():
-            if self.cache_expirado(entry['timestamp']):
-                chaves_expiradas.append(chave)
+        """Remove entradas expiradas do cache (só desempilha os prazos vencidos)"""
+        with self.lock:
+            self._limpar_cache_expirado()
+    
+    def _limpar_cache_expirado(self):
+        agora = time.time()
+        removidas = 0
         
-        for chave in chaves_expiradas:
-            del self.cache[chave]
+        while self.fila_expiracao and self.fila_expiracao[0][0] <= agora:
+            expira, chave = heapq.heappop(self.fila_expiracao)
+            if self.expira_em.get(chave) != expira:
+                continue
+            if self.compartilhado and self._renovada_por_outro_processo(chave, agora):
+                continue
+            self.remover_entrada(chave)
+            removidas += 1
         
-        if chaves_expiradas:
-            print(f"🧹 Removidas {len(chaves_expiradas)} entradas expiradas do cache")
-            self._atualizar_vetorizacao()
+        if removidas:
+            self.contadores['expirations'] += removidas
+            log.info(f"🧹 Removidas {removidas} entradas expiradas do cache")
+    
+    def _renovada_por_outro_processo(self, chave, agora):
+        """Relê o timestamp gravado antes de expirar: outro worker pode ter usado a entrada"""
+        try:
+            timestamp = self.armazenamento.timestamp(chave)
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao consultar cache compartilhado: {e}")
+            return False
+        if timestamp is None or self.instante_expiracao(timestamp) <= agora:
+            return False
+        self._aplicar_uso(chave, timestamp, self.cache[chave].get('uso_count', 1))
+        return True
+    
+    def _registrar_uso(self, chave):
+        """Atualiza timestamp/contador de uso de uma entrada encontrada"""
+        entry = self.cache[chave]
+        entry['timestamp'] = datetime.now().isoformat()
+        entry['uso_count'] = entry.get('uso_count', 0) + 1
+        self.politica.acessar(chave, entry)
+        self._agendar_expiracao(chave)
+        self._contabilizar_uso(chave)
+        try:
+            self.armazenamento.registrar_uso(chave, entry)
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao salvar cache: {e}")
+        return entry['resposta']
     
     def encontrar_pergunta_similar(self, pergunta):
-        """Encontra pergunta similar usando similaridade semântica"""
-        if not self.cache or self.perguntas_vetorizadas is None:
+        """Encontra pergunta idêntica (hash) ou similar (similaridade semântica)"""
+        with self.lock:
+            return self._encontrar_pergunta_similar(pergunta)
+    
+    def _encontrar_pergunta_similar(self, pergunta):
+        chave, similaridade = self._localizar(pergunta)
+        if chave is None:
+            CONSULTAS_CACHE.labels("miss").inc()
             return None
+        if similaridade is None:
+            CONSULTAS_CACHE.labels("hit_exact").inc()
+            log.info("🎯 Pergunta idêntica encontrada no cache")
+        else:
+            CONSULTAS_CACHE.labels("hit_similar").inc()
+            log.info(f"💡 Pergunta similar encontrada (similaridade: {similaridade:.2f})")
+        return self._registrar_uso(chave)
+    
+    def _localizar(self, pergunta):
+        """Retorna (chave, similaridade) da entrada que responde a pergunta, sem registrar uso.
+        
+        Similaridade None indica match exato por hash; chave None indica que não há entrada.
+        """
+        self.sincronizar()
+        if not self.cache:
+            return None, None
         
-        self.limpar_cache_expirado()
+        self._limpar_cache_expirado()
         pergunta_norm = self.normalizar_pergunta(pergunta)
         
+        chave_exata = self.chave_por_hash.get(hash_pergunta(pergunta_norm))
+        if chave_exata is not None:
+            return chave_exata, None
+        
         try:
-            pergunta_vec = self.vectorizer.transform([pergunta_norm])
-            similaridades = cosine_similarity(pergunta_vec, self.perguntas_vetorizadas)[0]
-            
-            max_sim_idx = np.argmax(similaridades)
-            max_similaridade = similaridades[max_sim_idx]
+            chave_similar, max_similaridade = self.indice.mais_similar(pergunta_norm)
             
-            if max_similaridade >= SIMILARITY_THRESHOLD:
-                chaves = list(self.cache.keys())
-                chave_similar = chaves[max_sim_idx]
-                entry = self.cache[chave_similar]
-                
-                print(f"💡 Pergunta similar encontrada (similaridade: {max_similaridade:.2f})")
-                
-                entry['timestamp'] = datetime.now().isoformat()
-                entry['uso_count'] = entry.get('uso_count', 0) + 1
-                
-                return entry['resposta']
+            if chave_similar is not None and max_similaridade >= SIMILARITY_THRESHOLD:
+                return chave_similar, max_similaridade
                 
         except Exception as e:
-            print(f"⚠️ Erro na busca por similaridade: {e}")
+            log.warning(f"⚠️ Erro na busca por similaridade: {e}")
         
-        return None
+        return None, None
+    
+    def contem(self, pergunta):
+        """Indica se a pergunta já tem resposta no cache (sem contar como uso)"""
+        with self.lock:
+            return self._localizar(pergunta)[0] is not None
+    
+    def invalidar(self, pergunta):
+        """Remove a entrada que responde a pergunta (ex.: resposta gerada antes de uma reindexação)"""
+        with self.lock:
+            chave, _ = self._localizar(pergunta)
+            if chave is None:
+                return False
+            self.remover_entrada(chave)
+            return True
+    
+    def encontrar_em_lote(self, perguntas):
+        """Versão em lote de encontrar_pergunta_similar: respostas (ou None) na mesma ordem"""
+        with self.lock:
+            self.sincronizar()
+            self._limpar_cache_expirado()
+            respostas = [None] * len(perguntas)
+            if not self.cache:
+                return respostas
+            
+            pendentes = []
+            for i, pergunta in enumerate(perguntas):
+                chave = self.chave_por_hash.get(hash_pergunta(self.normalizar_pergunta(pergunta)))
+                if chave is not None:
+                    CONSULTAS_CACHE.labels("hit_exact").inc()
+                    respostas[i] = self._registrar_uso(chave)
+                else:
+                    pendentes.append(i)
+            
+            if pendentes:
+                consultas = self.indice.matriz_consultas(
+                    [self.normalizar_pergunta(perguntas[i]) for i in pendentes])
+                for i, (chave, similaridade) in zip(pendentes, self.indice.mais_similares_lote(consultas)):
+                    if chave is not None and similaridade >= SIMILARITY_THRESHOLD:
+                        CONSULTAS_CACHE.labels("hit_similar").inc()
+                        respostas[i] = self._registrar_uso(chave)
+                    else:
+                        CONSULTAS_CACHE.labels("miss").inc()
+            
+            log.info(f"📦 Lote: {sum(r is not None for r in respostas)}/{len(perguntas)} respondidas pelo cache")
+            return respostas
+    
+    def estatisticas_uso(self):
+        """(entradas, soma de uso_count, maior uso_count) a partir dos contadores mantidos"""
+        with self.lock:
+            if self.max_usos is None:
+                self.max_usos = max(self.usos.values(), default=0)
+            return len(self.cache), self.soma_usos, self.max_usos
+    
+    def _liberar_espaco(self, entry):
+        """Remove entradas escolhidas pela política até a nova entrada caber"""
+        tamanho_novo = tamanho_entrada(entry)
+        while self.cache and self.politica.precisa_remover(tamanho_novo):
+            vitima = self.politica.escolher_vitima()
+            self.contadores['evictions'] += 1
+            self.contadores['bytes_evicted'] += tamanho_entrada(self.cache[vitima])
+            self.remover_entrada(vitima)
     
     def adicionar_ao_cache(self, pergunta, resposta):
         """Adiciona nova entrada ao cache"""
-        if len(self.cache) >= MAX_CACHE_SIZE:
-            chave_mais_antiga = min(self.cache.keys(), 
-                                  key=lambda k: self.cache[k]['timestamp'])
-            del self.cache[chave_mais_antiga]
-        
-        chave = f"q_{len(self.cache)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        self.cache[chave] = {
+        with self.lock:
+            self._adicionar_ao_cache(pergunta, resposta)
+    
+    def _adicionar_ao_cache(self, pergunta, resposta):
+        self.sincronizar()
+        agora = datetime.now()
+        chave = f"q_{agora.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
+        entry = {
             'pergunta_original': pergunta,
             'pergunta_normalizada': self.normalizar_pergunta(pergunta),
             'resposta': resposta,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': agora.isoformat(),
             'uso_count': 1
         }
         
-        self._atualizar_vetorizacao()
-        self.salvar_cache()
-        print(f"💾 Nova resposta adicionada ao cache (total: {len(self.cache)})")
+        self._liberar_espaco(entry)
+        self.cache[chave] = entry
+        self._registrar(chave)
+        self.salvar_entrada(chave)
+        log.info(f"💾 Nova resposta adicionada ao cache (total: {len(self.cache)})")
+
+# Deduplicação: MinHash/LSH só é usado acima deste número de chunks
+LSH_MIN_DOCUMENTOS = 40
+MINHASH_BANDAS = 32
+MINHASH_LINHAS_POR_BANDA = 4
+_rng_minhash = np.random.default_rng(20240601)
+MINHASH_A = _rng_minhash.integers(1, 2 ** 63, MINHASH_BANDAS * MINHASH_LINHAS_POR_BANDA, dtype=np.uint64) | np.uint64(1)
+MINHASH_B = _rng_minhash.integers(0, 2 ** 63, MINHASH_BANDAS * MINHASH_LINHAS_POR_BANDA, dtype=np.uint64)
 
 class DeduplicadorContexto:
     @staticmethod
@@ -180,14 +638,40 @@ class DeduplicadorContexto:
         palavras1 = set(texto1.lower().split())
         palavras2 = set(texto2.lower().split())
         
-        intersecao = palavras1 & palavras2
-        uniao = palavras1 | palavras2
+        return DeduplicadorContexto.jaccard_conjuntos(palavras1, palavras2)
+    
+    @staticmethod
+    def jaccard_conjuntos(palavras1, palavras2):
+        """Similaridade Jaccard entre conjuntos de tokens já calculados"""
+        intersecao = len(palavras1 & palavras2)
+        uniao = len(palavras1) + len(palavras2) - intersecao
         
-        return len(intersecao) / len(uniao) if uniao else 0
+        return intersecao / uniao if uniao else 0
+    
+    @staticmethod
+    def assinatura_minhash(palavras):
+        """Assinatura MinHash (hash multiplicativo em uint64) de um conjunto de tokens"""
+        if not palavras:
+            return np.full(len(MINHASH_A), np.iinfo(np.uint64).max, dtype=np.uint64)
+        
+        hashes = np.fromiter((hash(p) for p in palavras), dtype=np.int64, count=len(palavras)).view(np.uint64)
+        return (hashes[:, None] * MINHASH_A + MINHASH_B).min(axis=0)
+    
+    @staticmethod
+    def chaves_lsh(assinatura):
+        """Uma chave de bucket por banda da assinatura"""
+        linhas = MINHASH_LINHAS_POR_BANDA
+        return [(banda, assinatura[banda * linhas:(banda + 1) * linhas].tobytes())
+                for banda in range(MINHASH_BANDAS)]
     
     @staticmethod
     def remover_duplicatas_inteligente(documentos):
-        """Remove duplicatas considerando chunks e páginas"""
+        """Remove duplicatas considerando chunks e páginas.
+
+        Cada chunk é tokenizado uma única vez. Com muitos chunks, os candidatos
+        a duplicata vêm de buckets LSH (32 bandas x 4 linhas: um par com Jaccard
+        0.75 escapa com probabilidade ~5e-6) e o Jaccard exato decide.
+        """
         if not documentos:
             return []
         
@@ -200,7 +684,10 @@ class DeduplicadorContexto:
             )
         )
         
+        usar_lsh = len(documentos_ordenados) > LSH_MIN_DOCUMENTOS
         documentos_unicos = []
+        palavras_unicos = []
+        buckets = {}
         chunks_utilizados = set()
         
         for doc in documentos_ordenados:
@@ -213,10 +700,18 @@ class DeduplicadorContexto:
             
             if chunk_identifier in chunks_utilizados:
                 continue
-                
+            
+            palavras = set(content.lower().split())
+            if usar_lsh:
+                chaves = DeduplicadorContexto.chaves_lsh(DeduplicadorContexto.assinatura_minhash(palavras))
+                candidatos = sorted({i for chave in chaves for i in buckets.get(chave, ())})
+            else:
+                candidatos = range(len(documentos_unicos))
+            
             eh_duplicata = False
-            for unico in documentos_unicos:
-                sim_jaccard = DeduplicadorContexto.calcular_similaridade_jaccard(content, unico['content'])
+            for i in candidatos:
+                unico = documentos_unicos[i]
+                sim_jaccard = DeduplicadorContexto.jaccard_conjuntos(palavras, palavras_unicos[i])
                 
                 mesmo_arquivo = filename == unico['filename']
                 paginas_proximas = False
@@ -235,10 +730,14 @@ class DeduplicadorContexto:
                     break
             
             if not eh_duplicata:
+                if usar_lsh:
+                    for chave in chaves:
+                        buckets.setdefault(chave, []).append(len(documentos_unicos))
                 documentos_unicos.append(doc)
+                palavras_unicos.append(palavras)
                 chunks_utilizados.add(chunk_identifier)
         
-        print(f"🧠 Deduplicação: {len(documentos)} → {len(documentos_unicos)} chunks únicos")
+        log.info(f"🧠 Deduplicação: {len(documentos)} → {len(documentos_unicos)} chunks únicos")
         return documentos_unicos
 
 def agrupar_por_documento(documentos):
@@ -271,145 +770,522 @@ def agrupar_por_documento(documentos):
     
     resultado_final = sorted(documentos_agrupados, key=lambda x: -x.get('score', 0))
     
-    print(f"📚 Agrupamento: {len(documentos)} → {len(resultado_final)} chunks de {len(grupos_arquivo)} arquivos")
+    log.info(f"📚 Agrupamento: {len(documentos)} → {len(resultado_final)} chunks de {len(grupos_arquivo)} arquivos")
     return resultado_final
 
+_geracao_indice = {'valor': None, 'mtime': None, 'verificada_em': None}
+_lock_geracao_indice = threading.Lock()
+
+def _ler_geracao_indice():
+    try:
+        with open(INDEX_GENERATION_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def geracao_indice_atual():
+    """Geração do índice gravada pelo indexador (muda a cada reindexação).
+    
+    Chamada no caminho de cada busca: o mtime do arquivo é conferido no máximo a
+    cada INTERVALO_VERIFICACAO_GERACAO segundos e o conteúdo só é relido se mudou.
+    """
+    agora = time.monotonic()
+    with _lock_geracao_indice:
+        verificada_em = _geracao_indice['verificada_em']
+        if verificada_em is not None and agora - verificada_em < INTERVALO_VERIFICACAO_GERACAO:
+            return _geracao_indice['valor']
+        _geracao_indice['verificada_em'] = agora
+        try:
+            mtime = os.stat(INDEX_GENERATION_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if verificada_em is None or mtime != _geracao_indice['mtime']:
+            _geracao_indice['mtime'] = mtime
+            _geracao_indice['valor'] = _ler_geracao_indice() if mtime is not None else None
+        return _geracao_indice['valor']
+
+class CacheBusca:
+    """Cache com TTL dos documentos já deduplicados/agrupados de buscar_documentos.
+
+    Cada entrada é marcada com a geração do índice; uma reindexação muda a
+    geração e invalida tudo de uma vez.
+    """
+    
+    def __init__(self, ttl_segundos=SEARCH_CACHE_TTL_SECONDS, max_entradas=SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+        self.geracao = geracao_indice_atual()
+        self.contadores = {'hits': 0, 'misses': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def chave(self, pergunta):
+        """Termos de conteúdo ordenados: reformulações da mesma pergunta caem na mesma busca"""
+        termos = termos_relevantes(pergunta)
+        conteudo = ' '.join(sorted(termos)) if termos else ' '.join(pergunta.lower().split())
+        return (conteudo, AZURE_SEARCH_INDEX, SEARCH_TOP_RESULTS, CONTEXT_MAX_DOCS)
+    
+    def _verificar_geracao(self):
+        geracao = geracao_indice_atual()
+        if geracao != self.geracao:
+            if self.entradas:
+                log.info(f"♻️ Índice reindexado (geração {geracao}), cache de busca invalidado")
+            self.entradas.clear()
+            self.geracao = geracao
+            self.contadores['invalidations'] += 1
+    
+    def obter(self, pergunta):
+        """Documentos da mesma busca ainda válidos, ou None"""
+        chave = self.chave(pergunta)
+        with self.lock:
+            self._verificar_geracao()
+            item = self.entradas.get(chave)
+            if item is None:
+                self.contadores['misses'] += 1
+                CONSULTAS_CACHE_BUSCA.labels("miss").inc()
+                return None
+            
+            expira, documentos = item
+            if expira <= time.time():
+                del self.entradas[chave]
+                self.contadores['expirations'] += 1
+                self.contadores['misses'] += 1
+                CONSULTAS_CACHE_BUSCA.labels("miss").inc()
+                return None
+            
+            self.entradas.move_to_end(chave)
+            self.contadores['hits'] += 1
+            CONSULTAS_CACHE_BUSCA.labels("hit").inc()
+            return documentos
+    
+    def guardar(self, pergunta, documentos):
+        chave = self.chave(pergunta)
+        with self.lock:
+            self.entradas[chave] = (time.time() + self.ttl_segundos, documentos)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+    
+    def estatisticas(self):
+        with self.lock:
+            consultas = self.contadores['hits'] + self.contadores['misses']
+            return {
+                "entries": len(self.entradas),
+                "ttl_seconds": self.ttl_segundos,
+                "index_generation": self.geracao,
+                "hit_rate": round(self.contadores['hits'] / consultas * 100, 1) if consultas else 0,
+                **self.contadores
+            }
+
+class VooEmAndamento:
+    """Pergunta sendo respondida agora; outras requisições equivalentes esperam o mesmo futuro"""
+    
+    def __init__(self, hash_norm, vetor, lider, futuro=None):
+        self.hash_norm = hash_norm
+        self.vetor = vetor
+        self.lider = lider
+        self.futuro = futuro if futuro is not None else Future()
+    
+    def aguardar(self):
+        """Espera a resposta do líder (None se o líder falhou ou foi interrompido)"""
+        try:
+            return self.futuro.result()
+        except Exception:
+            return None
+    
+    async def aguardar_async(self):
+        # O futuro é compartilhado por todos os seguidores: o shield impede que o
+        # cancelamento de um deles (cliente desconectou) cancele o futuro dos outros
+        try:
+            return await asyncio.shield(asyncio.wrap_future(self.futuro))
+        except Exception:
+            return None
+
+class CoalescedorRequisicoes:
+    """Single-flight: perguntas idênticas ou similares (>= SIMILARITY_THRESHOLD) a uma
+    já em andamento aguardam a resposta dela em vez de repetir busca e geração."""
+    
+    def __init__(self, cache):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.em_voo = {}
+        self.coalescidas = 0
+    
+    @staticmethod
+    def _similaridade(vetor_a, vetor_b):
+        indices_a, pesos_a = vetor_a
+        indices_b, pesos_b = vetor_b
+        _, pos_a, pos_b = np.intersect1d(indices_a, indices_b, assume_unique=True, return_indices=True)
+        return float(np.dot(pesos_a[pos_a], pesos_b[pos_b]))
+    
+    def entrar(self, pergunta):
+        """Retorna o voo equivalente em andamento (lider=False) ou registra um novo (lider=True)"""
+        pergunta_norm = self.cache.normalizar_pergunta(pergunta)
+        hash_norm = hash_pergunta(pergunta_norm)
+        # Os voos comparam perguntas entre si, que em geral ainda não estão no cache
+        vetor = self.cache.indice.vetor_normalizado(pergunta_norm, ignorar_desconhecidos=False)
+        
+        with self.lock:
+            existente = self.em_voo.get(hash_norm)
+            if existente is None:
+                for voo in self.em_voo.values():
+                    if self._similaridade(vetor, voo.vetor) >= SIMILARITY_THRESHOLD:
+                        existente = voo
+                        break
+            
+            if existente is not None:
+                self.coalescidas += 1
+                return VooEmAndamento(existente.hash_norm, existente.vetor, lider=False,
+                                      futuro=existente.futuro)
+            
+            voo = VooEmAndamento(hash_norm, vetor, lider=True)
+            self.em_voo[hash_norm] = voo
+            return voo
+    
+    def concluir(self, voo, resposta):
+        """Publica a resposta do líder para todos os seguidores"""
+        with self.lock:
+            self.em_voo.pop(voo.hash_norm, None)
+        if not voo.futuro.done():
+            voo.futuro.set_result(resposta)
+    
+    def abandonar(self, voo, erro):
+        """Libera os seguidores quando o líder falha (eles passam a responder sozinhos)"""
+        with self.lock:
+            self.em_voo.pop(voo.hash_norm, None)
+        if not isinstance(erro, Exception):
+            # Cancelamento do líder não deve cancelar os seguidores: eles só passam a responder sozinhos
+            erro = RuntimeError(f"Pergunta líder interrompida ({type(erro).__name__})")
+        if not voo.futuro.done():
+            voo.futuro.set_exception(erro)
+
 # Instâncias globais
 cache_manager = CacheAvancado()
 deduplicador = DeduplicadorContexto()
+coalescedor = CoalescedorRequisicoes(cache_manager)
+ENTRADAS_CACHE.set_function(lambda: len(cache_manager.cache))
+BYTES_CACHE.set_function(lambda: cache_manager.politica.total_bytes)
+cache_busca = CacheBusca()
 
-def buscar_documentos(pergunta):
-    """Busca documentos com metadata rica e deduplicação avançada"""
-    search_client = SearchClient(endpoint=AZURE_SEARCH_ENDPOINT,
-                                 index_name=AZURE_SEARCH_INDEX,
-                                 credential=AzureKeyCredential(AZURE_SEARCH_KEY))
+CAMPOS_BUSCA = ["content", "file_name", "filename", "page_number", "page_end", "chunk_id", "total_pages", "file_type"]
+# Índices criados antes do campo page_end (estruturar_documentos usa page_number no lugar)
+CAMPOS_BUSCA_LEGADOS = [campo for campo in CAMPOS_BUSCA if campo != "page_end"]
+CAMPOS_BUSCA_BASICA = ["content", "file_name", "filename", "page_number"]
+MODOS_BUSCA = ["ordenada", "completa", "ordenada_legada", "completa_legada", "basica", "simples"]
+
+# Clientes de busca reutilizados (pool de conexões HTTP) e modo suportado pelo índice
+search_client = None
+search_async_client = None
+modo_busca_detectado = None
+_deteccao_busca = {'geracao': None, 'instante': 0.0}
+_lock_modo_busca = threading.Lock()
+
+def get_search_client():
+    """Cria o SearchClient uma única vez por processo (conexões HTTP reaproveitadas)"""
+    global search_client
     
-    try:
+    if search_client is None:
+        search_client = SearchClient(endpoint=AZURE_SEARCH_ENDPOINT,
+                                     index_name=AZURE_SEARCH_INDEX,
+                                     credential=AzureKeyCredential(AZURE_SEARCH_KEY))
+    return search_client
+
+def get_search_async_client():
+    """Cria o SearchClient assíncrono uma única vez por processo"""
+    global search_async_client
+    
+    if search_async_client is None:
+        search_async_client = AsyncSearchClient(endpoint=AZURE_SEARCH_ENDPOINT,
+                                                index_name=AZURE_SEARCH_INDEX,
+                                                credential=AzureKeyCredential(AZURE_SEARCH_KEY))
+    return search_async_client
+
+def parametros_busca(modo, pergunta, client, top=SEARCH_TOP_RESULTS):
+    """Parâmetros da busca para cada modo, do mais rico ao fallback simples"""
+    campos = CAMPOS_BUSCA_LEGADOS if modo.endswith("_legada") else CAMPOS_BUSCA
+    modo = modo.removesuffix("_legada")
+    if modo == "ordenada":
+        return dict(search_text=pergunta, top=top, select=campos,
+                    search_fields=["content"], highlight_fields="content",
+                    query_type="semantic" if hasattr(client, 'semantic_search') else "simple",
+                    order_by=["search.score() desc"])
+    if modo == "completa":
+        return dict(search_text=pergunta, top=top, select=campos,
+                    search_fields=["content"], highlight_fields="content")
+    if modo == "basica":
+        return dict(search_text=pergunta, top=top, select=CAMPOS_BUSCA_BASICA,
+                    search_fields=["content"])
+    return dict(search_text=pergunta, top=top)
+
+def _modos_a_tentar():
+    """Modo já detectado (uma única ida ao serviço) ou todos, em ordem de preferência.
+    
+    Um modo degradado é sondado de novo a partir do mais rico quando a geração do
+    índice muda ou a cada SEARCH_REPROBE_SECONDS (só pela requisição que percebe isso).
+    """
+    modo = modo_busca_detectado
+    if modo is None:
+        return MODOS_BUSCA
+    if modo == MODOS_BUSCA[0]:
+        return [modo]
+    geracao = geracao_indice_atual()
+    with _lock_modo_busca:
+        agora = time.monotonic()
+        if geracao == _deteccao_busca['geracao'] and agora - _deteccao_busca['instante'] < SEARCH_REPROBE_SECONDS:
+            return [modo]
+        _deteccao_busca.update(geracao=geracao, instante=agora)
+    log.info(f"🔎 Modo de busca '{modo}' é degradado: sondando de novo a partir do mais completo")
+    return MODOS_BUSCA
+
+def _registrar_modo_busca(modo):
+    global modo_busca_detectado
+    with _lock_modo_busca:
+        if modo_busca_detectado != modo:
+            modo_busca_detectado = modo
+            _deteccao_busca.update(geracao=geracao_indice_atual(), instante=time.monotonic())
+            log.info(f"🔎 Modo de busca detectado para o índice: {modo}")
+
+def _erro_de_capacidade(erro):
+    """Erro 400 = índice não suporta o modo; falhas transitórias não mudam a detecção"""
+    return isinstance(erro, HttpResponseError) and erro.status_code == 400
+
+def _invalidar_modo_busca(modo):
+    """Esquece o modo detectado se ele parou de funcionar (ex.: índice recriado)"""
+    global modo_busca_detectado
+    with _lock_modo_busca:
+        if modo_busca_detectado == modo:
+            modo_busca_detectado = None
+
+def executar_busca(pergunta, top=SEARCH_TOP_RESULTS):
+    """Executa a busca no modo suportado pelo índice, detectando-o na primeira chamada"""
+    client = get_search_client()
+    modos = _modos_a_tentar()
+    for i, modo in enumerate(modos):
         try:
-            resultados_busca = search_client.search(
-                pergunta, 
-                top=SEARCH_TOP_RESULTS,
-                select=[
-                    "content", 
-                    "file_name", 
-                    "filename", 
-                    "page_number", 
-                    "chunk_id", 
-                    "total_pages", 
-                    "file_type"
-                ],
-                search_fields=["content"],
-                highlight_fields="content",
-                query_type="semantic" if hasattr(search_client, 'semantic_search') else "simple",
-                order_by=["search.score() desc"]
-            )
-            resultados = list(resultados_busca)
-            print(f"🎯 Busca realizada com {len(resultados)} resultados")
-            
-        except Exception as sort_error:
-            print(f"⚠️ Problema na ordenação: {sort_error}")
-            resultados_busca = search_client.search(
-                pergunta, 
-                top=SEARCH_TOP_RESULTS,
-                select=[
-                    "content", 
-                    "file_name", 
-                    "filename", 
-                    "page_number", 
-                    "chunk_id", 
-                    "total_pages", 
-                    "file_type"
-                ],
-                search_fields=["content"],
-                highlight_fields="content"
-            )
-            resultados = list(resultados_busca)
-        
-    except Exception as e:
-        print(f"⚠️ Erro na busca, tentando busca básica: {e}")
+            resultados = list(client.search(**parametros_busca(modo, pergunta, client, top)))
+            _registrar_modo_busca(modo)
+            return resultados
+        except Exception as e:
+            if not _erro_de_capacidade(e):
+                raise
+            if len(modos) == 1:
+                _invalidar_modo_busca(modo)
+                log.warning(f"⚠️ Modo de busca '{modo}' deixou de ser suportado, redetectando: {e}")
+                return executar_busca(pergunta, top)
+            if i == len(modos) - 1:
+                raise
+            log.warning(f"⚠️ Modo de busca '{modo}' não suportado, tentando fallback: {e}")
+
+async def executar_busca_async(pergunta, top=SEARCH_TOP_RESULTS):
+    """Versão assíncrona de executar_busca"""
+    client = get_search_async_client()
+    modos = _modos_a_tentar()
+    for i, modo in enumerate(modos):
         try:
-            resultados_busca = search_client.search(
-                pergunta, 
-                top=SEARCH_TOP_RESULTS,
-                select=["content", "file_name", "filename", "page_number"],
-                search_fields=["content"]
-            )
-            resultados = list(resultados_busca)
-        except Exception as e2:
-            print(f"⚠️ Usando fallback simples: {e2}")
-            resultados_busca = search_client.search(pergunta, top=SEARCH_TOP_RESULTS)
-            resultados = list(resultados_busca)
-    
-    # Estrutura dados com metadata rica
+            paginas = await client.search(**parametros_busca(modo, pergunta, client, top))
+            resultados = [doc async for doc in paginas]
+            _registrar_modo_busca(modo)
+            return resultados
+        except Exception as e:
+            if not _erro_de_capacidade(e):
+                raise
+            if len(modos) == 1:
+                _invalidar_modo_busca(modo)
+                log.warning(f"⚠️ Modo de busca '{modo}' deixou de ser suportado, redetectando: {e}")
+                return await executar_busca_async(pergunta, top)
+            if i == len(modos) - 1:
+                raise
+            log.warning(f"⚠️ Modo de busca '{modo}' não suportado, tentando fallback: {e}")
+
+async def detectar_capacidades_busca_async():
+    """Sonda o índice (consulta de 1 resultado) para fixar o modo de busca na inicialização"""
+    await executar_busca_async("*", top=1)
+    return modo_busca_detectado
+
+def estruturar_documentos(resultados):
+    """Estrutura resultados da busca com metadata rica, deduplica e agrupa"""
     documentos_estruturados = []
     for doc in resultados:
         documento = {
             'content': doc.get('content', ''),
             'filename': doc.get('filename', doc.get('file_name', 'Documento')),
             'page': doc.get('page_number', 'N/A'),
+            'page_end': doc.get('page_end') or doc.get('page_number', 'N/A'),
             'chunk_id': doc.get('chunk_id', 'N/A'),
             'total_pages': doc.get('total_pages', 'N/A'),
             'file_type': doc.get('file_type', 'PDF'),
-            'score': getattr(doc, '@search.score', 0.0)
+            'score': doc.get('@search.score') or 0.0
         }
         documentos_estruturados.append(documento)
     
-    documentos_unicos = deduplicador.remover_duplicatas_inteligente(documentos_estruturados)
-    documentos_agrupados = agrupar_por_documento(documentos_unicos)
+    with medir("dedup"):
+        documentos_unicos = deduplicador.remover_duplicatas_inteligente(documentos_estruturados)
+    with medir("group"):
+        documentos_agrupados = agrupar_por_documento(documentos_unicos)
     
     return documentos_agrupados[:CONTEXT_MAX_DOCS]
 
-def formatar_contexto_otimizado(documentos):
-    """Formata contexto com metadata rica para máxima qualidade"""
-    if not documentos:
-        return "Nenhum contexto relevante encontrado."
+def buscar_documentos(pergunta):
+    """Busca documentos com metadata rica e deduplicação avançada"""
+    documentos = cache_busca.obter(pergunta)
+    if documentos is not None:
+        log.info(f"📦 Busca reaproveitada do cache ({len(documentos)} chunks)")
+        return documentos
     
-    contexto_formatado = []
-    arquivos_vistos = {}
+    with medir("search"):
+        resultados = executar_busca(pergunta)
+    log.info(f"🎯 Busca realizada com {len(resultados)} resultados")
+    documentos = estruturar_documentos(resultados)
+    cache_busca.guardar(pergunta, documentos)
+    return documentos
+
+async def buscar_documentos_async(pergunta):
+    """Versão assíncrona de buscar_documentos (não bloqueia o event loop)"""
+    documentos = cache_busca.obter(pergunta)
+    if documentos is not None:
+        log.info(f"📦 Busca reaproveitada do cache ({len(documentos)} chunks)")
+        return documentos
     
-    for i, doc in enumerate(documentos, 1):
-        filename = doc.get('filename', 'N/A')
-        page = doc.get('page', 'N/A')
-        chunk_id = doc.get('chunk_id', 'N/A')
-        total_pages = doc.get('total_pages', 'N/A')
-        file_type = doc.get('file_type', 'PDF')
-        score = doc.get('score', 0.0)
-        
-        if filename not in arquivos_vistos:
-            arquivos_vistos[filename] = []
-        arquivos_vistos[filename].append(page)
-        
-        arquivo_info = f"📁 **{filename}** ({file_type})"
-        if total_pages != 'N/A':
-            arquivo_info += f" - {total_pages} páginas"
-        
-        localizacao_info = ""
+    with medir("search"):
+        resultados = await executar_busca_async(pergunta)
+    log.info(f"🎯 Busca realizada com {len(resultados)} resultados")
+    documentos = estruturar_documentos(resultados)
+    cache_busca.guardar(pergunta, documentos)
+    return documentos
+
+REGEX_PALAVRAS = re.compile(r'\w{3,}')
+PALAVRAS_VAZIAS = {
+    'como', 'para', 'que', 'qual', 'quais', 'onde', 'quando', 'porque', 'por', 'com', 'sem', 'uma',
+    'uns', 'umas', 'dos', 'das', 'nos', 'nas', 'num', 'numa', 'pelo', 'pela', 'este', 'esta', 'isso',
+    'isto', 'esse', 'essa', 'ser', 'ter', 'tem', 'são', 'está', 'fazer', 'faço', 'posso', 'pode', 'preciso',
+    'mais', 'muito', 'também', 'não', 'sim', 'meu', 'minha', 'seu', 'sua', 'the', 'and', 'how'
+}
+
+def termos_relevantes(texto):
+    """Palavras de conteúdo (3+ letras, sem palavras vazias) usadas na sobreposição com a pergunta"""
+    return set(REGEX_PALAVRAS.findall(texto.lower())) - PALAVRAS_VAZIAS
+
+def recortar_por_consulta(conteudo, termos_pergunta, max_tokens):
+    """Mantém as frases do chunk que compartilham termos com a pergunta, priorizando
+    as de maior sobreposição até `max_tokens`. A ordem e as quebras de linha originais
+    são preservadas; trechos omitidos viram " [...] "."""
+    frases = spans_frases(conteudo)
+    if not frases:
+        return ""
+    
+    textos = [conteudo[inicio:fim] for inicio, fim in frases]
+    tokens = [contar_tokens(t) for t in textos]
+    sobreposicao = [len(termos_relevantes(t) & termos_pergunta) for t in textos]
+    if any(sobreposicao):
+        candidatas = sorted((i for i, s in enumerate(sobreposicao) if s), key=lambda i: (-sobreposicao[i], i))
+    else:
+        candidatas = range(len(frases))  # nada em comum com a pergunta: começo do chunk
+    
+    escolhidas = []
+    usados = 0
+    for i in candidatas:
+        if usados + tokens[i] > max_tokens:
+            continue
+        escolhidas.append(i)
+        usados += tokens[i]
+    
+    partes = []
+    anterior = None
+    for i in sorted(escolhidas):
+        if anterior is not None:
+            partes.append(conteudo[frases[anterior][1]:frases[i][0]] if i == anterior + 1 else " [...] ")
+        partes.append(textos[i].strip() if anterior is None or i != anterior + 1 else textos[i])
+        anterior = i
+    return "".join(partes).strip()
+
+MIN_TOKENS_TRECHO = 32  # orçamento restante abaixo disso não comporta um trecho útil
+
+def cabecalho_documento(i, doc, formato):
+    """Cabeçalho de um chunk no contexto: `completo` (emojis/markdown) ou `compacto` (uma linha)"""
+    filename = doc.get('filename', 'N/A')
+    page = doc.get('page', 'N/A')
+    page_end = doc.get('page_end', page)
+    chunk_id = doc.get('chunk_id', 'N/A')
+    total_pages = doc.get('total_pages', 'N/A')
+    file_type = doc.get('file_type', 'PDF')
+    score = doc.get('score', 0.0)
+    # Chunks que atravessam páginas mostram o intervalo
+    paginas = f"{page}-{page_end}" if page_end not in (page, 'N/A') else f"{page}"
+    
+    if formato == "compacto":
+        partes = [f"[{i}] {filename}"]
         if page != 'N/A':
-            localizacao_info = f"📖 Página {page}"
+            partes.append(f"p.{paginas}")
             if chunk_id != 'N/A':
-                localizacao_info += f" (Seção {chunk_id})"
-        
-        score_info = ""
+                partes.append(f"§{chunk_id}")
         if score > 0:
-            if score >= 1.0:
-                indicator = "🎯"
-            elif score >= 0.7:
-                indicator = "🔥"
-            elif score >= 0.5:
-                indicator = "✅"
-            else:
-                indicator = "📋"
-            score_info = f"{indicator} Score: {score:.3f}"
-        
-        documento_fmt = f"""📄 **Documento {i}** | {score_info}
+            partes.append(f"score {score:.2f}")
+        return " ".join(partes)
+    
+    arquivo_info = f"📁 **{filename}** ({file_type})"
+    if total_pages != 'N/A':
+        arquivo_info += f" - {total_pages} páginas"
+    
+    localizacao_info = ""
+    if page != 'N/A':
+        localizacao_info = f"📖 Página {page}" if paginas == f"{page}" else f"📖 Páginas {paginas}"
+        if chunk_id != 'N/A':
+            localizacao_info += f" (Seção {chunk_id})"
+    
+    score_info = ""
+    if score > 0:
+        if score >= 1.0:
+            indicator = "🎯"
+        elif score >= 0.7:
+            indicator = "🔥"
+        elif score >= 0.5:
+            indicator = "✅"
+        else:
+            indicator = "📋"
+        score_info = f"{indicator} Score: {score:.3f}"
+    
+    return f"""📄 **Documento {i}** | {score_info}
 {arquivo_info}
 {localizacao_info}
 
-📝 **Conteúdo:**
-{doc['content'].strip()}
+📝 **Conteúdo:**"""
 
----"""
-        contexto_formatado.append(documento_fmt)
+def formatar_contexto_otimizado(documentos, pergunta=None, max_tokens=CONTEXT_TOKENS, formato=CONTEXT_FORMAT):
+    """Formata o contexto dentro de um orçamento de tokens.
+    
+    Os chunks chegam ordenados por score; cada um é (opcionalmente) recortado às
+    frases ligadas à pergunta e entra enquanto couber no orçamento.
+    """
+    if not documentos:
+        return "Nenhum contexto relevante encontrado."
+    
+    termos_pergunta = termos_relevantes(pergunta) if pergunta and CONTEXT_TRIM else set()
+    separador = "\n" if formato == "compacto" else "\n\n---"
+    # Reserva para o cabeçalho de fontes; cada chunk aceito reserva também sua linha no resumo
+    restante = max_tokens - 40
+    
+    selecionados = []
+    for doc in documentos:
+        cabecalho = cabecalho_documento(len(selecionados) + 1, doc, formato)
+        custo_fixo = contar_tokens(cabecalho + separador) + 2 + 15
+        if restante - custo_fixo < MIN_TOKENS_TRECHO:
+            break
+        
+        conteudo = doc['content'].strip()
+        if termos_pergunta or contar_tokens(conteudo) > restante - custo_fixo:
+            conteudo = recortar_por_consulta(conteudo, termos_pergunta, restante - custo_fixo)
+        if not conteudo:
+            continue
+        
+        selecionados.append((doc, f"{cabecalho}\n{conteudo}{separador}"))
+        restante -= custo_fixo + contar_tokens(conteudo)
+    
+    if not selecionados:
+        return "Nenhum contexto relevante encontrado."
+    
+    arquivos_vistos = {}
+    for doc, _ in selecionados:
+        arquivos_vistos.setdefault(doc.get('filename', 'N/A'), []).append(doc.get('page', 'N/A'))
     
     resumo_arquivos = []
     for arquivo, paginas in arquivos_vistos.items():
@@ -419,25 +1295,22 @@ def formatar_contexto_otimizado(documentos):
         else:
             resumo_arquivos.append(f"• {arquivo}")
     
-    cabecalho = f"""📚 **FONTES CONSULTADAS** ({len(arquivos_vistos)} arquivos, {len(documentos)} seções):
+    if formato == "compacto":
+        cabecalho = f"FONTES ({len(arquivos_vistos)} arquivos, {len(selecionados)} trechos):\n{chr(10).join(resumo_arquivos)}\n\n"
+    else:
+        cabecalho = f"""📚 **FONTES CONSULTADAS** ({len(arquivos_vistos)} arquivos, {len(selecionados)} seções):
 {chr(10).join(resumo_arquivos)}
 
 {'='*60}
 
 """
     
-    return cabecalho + "\n".join(contexto_formatado)
+    contexto = cabecalho + "\n".join(texto for _, texto in selecionados)
+    log.info(f"🧮 Contexto: {len(selecionados)}/{len(documentos)} chunks, ~{contar_tokens(contexto)} tokens "
+          f"(orçamento {max_tokens})")
+    return contexto
 
-def perguntar_ao_modelo(pergunta):
-    """Função principal com cache avançado e prompt otimizado"""
-    resposta_cache = cache_manager.encontrar_pergunta_similar(pergunta)
-    if resposta_cache:
-        return resposta_cache
-    
-    documentos = buscar_documentos(pergunta)
-    contexto_formatado = formatar_contexto_otimizado(documentos)
-    
-    system_message = """Você é um especialista técnico sênior especializado em análise de documentação corporativa. Você tem acesso a um sistema de busca avançado que fornece contexto rico com páginas específicas e seções de documentos.
+SYSTEM_MESSAGE = """Você é um especialista técnico sênior especializado em análise de documentação corporativa. Você tem acesso a um sistema de busca avançado que fornece contexto rico com páginas específicas e seções de documentos.
 
 **SUA MISSÃO:**
 - Fornecer respostas precisas, detalhadas e acionáveis baseadas nos documentos fornecidos
@@ -460,6 +1333,19 @@ def perguntar_ao_modelo(pergunta):
 - Se informação não estiver disponível, declare explicitamente
 - Priorize documentos com scores mais altos (🎯 e 🔥)"""
 
+PARAMETROS_GERACAO = dict(
+    temperature=TEMPERATURE,
+    max_tokens=MAX_TOKENS,
+    top_p=TOP_P,
+    frequency_penalty=0.1,
+    presence_penalty=0.1
+)
+
+def montar_mensagens(pergunta, documentos):
+    """Monta as mensagens do chat (system fixo + contexto + pergunta)"""
+    with medir("format_context"):
+        contexto_formatado = formatar_contexto_otimizado(documentos, pergunta)
+    
     user_message = f"""**CONTEXTO ENRIQUECIDO COM METADATA:**
 {contexto_formatado}
 
@@ -468,31 +1354,18 @@ def perguntar_ao_modelo(pergunta):
 
 **INSTRUÇÃO ESPECÍFICA:**
 Analise cuidadosamente todos os documentos fornecidos acima, considerando seus scores de relevância e localização específica (páginas/seções). Forneça uma resposta estruturada usando o formato obrigatório, citando precisamente as fontes consultadas."""
+    
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": user_message}
+    ]
 
-    try:
-        client = get_azure_openai_client()
-        
-        resposta = client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            top_p=TOP_P,
-            frequency_penalty=0.1,
-            presence_penalty=0.1
-        )
-        
-        resposta_texto = resposta.choices[0].message.content
-        
-    except Exception as e:
-        error_msg = str(e)
-        print(f"❌ Erro na chamada Azure OpenAI: {e}")
-        
-        if "DeploymentNotFound" in error_msg:
-            return """❌ **ERRO: Deployment não encontrado**
+def mensagem_erro_openai(e):
+    """Converte erro da chamada Azure OpenAI em resposta amigável"""
+    error_msg = str(e)
+    
+    if "DeploymentNotFound" in error_msg:
+        return """❌ **ERRO: Deployment não encontrado**
 
 🔧 **SOLUÇÃO:**
 1. Execute: `python verificar_azure.py` para listar deployments disponíveis
@@ -500,32 +1373,35 @@ Analise cuidadosamente todos os documentos fornecidos acima, considerando seus s
 3. Use o nome exato de um deployment ativo
 
 ⚠️ **Deployment configurado pode estar incorreto ou não existir no Azure OpenAI.**"""
-        
-        elif "401" in error_msg or "Unauthorized" in error_msg:
-            return """❌ **ERRO: Credenciais inválidas**
+    
+    elif "401" in error_msg or "Unauthorized" in error_msg:
+        return """❌ **ERRO: Credenciais inválidas**
 
 🔧 **SOLUÇÃO:**
 1. Verifique `AZURE_OPENAI_KEY` no arquivo .env
 2. Confirme se a chave está correta no Azure Portal
 3. Verifique se o recurso Azure OpenAI está ativo"""
-        
-        elif "403" in error_msg or "Forbidden" in error_msg:
-            return """❌ **ERRO: Acesso negado**
+    
+    elif "403" in error_msg or "Forbidden" in error_msg:
+        return """❌ **ERRO: Acesso negado**
 
 🔧 **SOLUÇÃO:**
 1. Verifique permissões no Azure OpenAI
 2. Confirme se a subscription está ativa
 3. Verifique cotas de uso do serviço"""
-        
-        else:
-            return f"""❌ **ERRO na geração de resposta**
+    
+    else:
+        return f"""❌ **ERRO na geração de resposta**
 
 **Detalhes técnicos:** {error_msg}
 
 🔧 **SOLUÇÃO:**
 Execute `python verificar_azure.py` para diagnosticar o problema."""
-    
-    cache_manager.adicionar_ao_cache(pergunta, resposta_texto)
+
+def registrar_resposta(pergunta, documentos, resposta_texto):
+    """Grava a resposta no cache e mostra estatísticas do contexto usado"""
+    with medir("cache_write"):
+        cache_manager.adicionar_ao_cache(pergunta, resposta_texto)
     
     arquivos_unicos = set(doc.get('filename', 'N/A') for doc in documentos)
     paginas_processadas = [doc.get('page') for doc in documentos if doc.get('page') != 'N/A']
@@ -535,25 +1411,320 @@ Execute `python verificar_azure.py` para diagnosticar o problema."""
     if paginas_processadas:
         stats_msg += f" | páginas: {', '.join(map(str, sorted(set(paginas_processadas))))}"
     
-    print(stats_msg)
+    log.info(stats_msg)
+
+def perguntar_ao_modelo(pergunta):
+    """Função principal com cache avançado e prompt otimizado"""
+    inicio = time.perf_counter()
+    resposta, origem = _perguntar_ao_modelo(pergunta)
+    LATENCIA_REQUISICAO.labels(origem).observe(time.perf_counter() - inicio)
+    return resposta
+
+def _perguntar_ao_modelo(pergunta):
+    """Retorna (resposta, origem): cache, coalesced ou generated"""
+    with medir("cache_lookup"):
+        resposta_cache = cache_manager.encontrar_pergunta_similar(pergunta)
+    if resposta_cache:
+        return resposta_cache, "cache"
+    
+    voo = coalescedor.entrar(pergunta)
+    if not voo.lider:
+        log.info("🔗 Pergunta equivalente em andamento, aguardando a mesma resposta")
+        with medir("coalesce_wait"):
+            resposta = voo.aguardar()
+        if resposta is not None:
+            return resposta, "coalesced"
+        return _gerar_resposta(pergunta), "generated"
+    
+    try:
+        # O líder anterior pode ter gravado a resposta entre a consulta ao cache e o registro
+        with medir("cache_lookup"):
+            resposta = cache_manager.encontrar_pergunta_similar(pergunta)
+        origem = "cache" if resposta else "generated"
+        resposta = resposta or _gerar_resposta(pergunta)
+    except BaseException as e:
+        coalescedor.abandonar(voo, e)
+        raise
+    coalescedor.concluir(voo, resposta)
+    return resposta, origem
+
+def _gerar_resposta(pergunta):
+    """Busca, gera e grava a resposta (sem consultar o cache)"""
+    documentos = buscar_documentos(pergunta)
+    
+    try:
+        client = get_azure_openai_client()
+        mensagens = montar_mensagens(pergunta, documentos)
+        
+        with medir("llm"):
+            resposta = client.chat.completions.create(
+                model=AZURE_OPENAI_DEPLOYMENT,
+                messages=mensagens,
+                **PARAMETROS_GERACAO
+            )
+        
+        resposta_texto = resposta.choices[0].message.content
+        
+    except Exception as e:
+        ERROS.labels("llm").inc()
+        log.error(f"❌ Erro na chamada Azure OpenAI: {e}")
+        return mensagem_erro_openai(e)
+    
+    registrar_resposta(pergunta, documentos, resposta_texto)
     return resposta_texto
 
+async def perguntar_ao_modelo_async(pergunta):
+    """Versão assíncrona de perguntar_ao_modelo: I/O no event loop, cache em threads"""
+    inicio = time.perf_counter()
+    resposta, origem = await _perguntar_ao_modelo_async(pergunta)
+    LATENCIA_REQUISICAO.labels(origem).observe(time.perf_counter() - inicio)
+    return resposta
+
+async def _perguntar_ao_modelo_async(pergunta):
+    with medir("cache_lookup"):
+        resposta_cache = await asyncio.to_thread(cache_manager.encontrar_pergunta_similar, pergunta)
+    if resposta_cache:
+        return resposta_cache, "cache"
+    
+    voo = coalescedor.entrar(pergunta)
+    if not voo.lider:
+        log.info("🔗 Pergunta equivalente em andamento, aguardando a mesma resposta")
+        with medir("coalesce_wait"):
+            resposta = await voo.aguardar_async()
+        if resposta is not None:
+            return resposta, "coalesced"
+        return await _gerar_resposta_async(pergunta), "generated"
+    
+    try:
+        with medir("cache_lookup"):
+            resposta = await asyncio.to_thread(cache_manager.encontrar_pergunta_similar, pergunta)
+        origem = "cache" if resposta else "generated"
+        resposta = resposta or await _gerar_resposta_async(pergunta)
+    except BaseException as e:
+        coalescedor.abandonar(voo, e)
+        raise
+    coalescedor.concluir(voo, resposta)
+    return resposta, origem
+
+async def _gerar_resposta_async(pergunta):
+    """Versão assíncrona de _gerar_resposta"""
+    documentos = await buscar_documentos_async(pergunta)
+    
+    try:
+        client = get_azure_openai_async_client()
+        mensagens = montar_mensagens(pergunta, documentos)
+        
+        with medir("llm"):
+            resposta = await client.chat.completions.create(
+                model=AZURE_OPENAI_DEPLOYMENT,
+                messages=mensagens,
+                **PARAMETROS_GERACAO
+            )
+        
+        resposta_texto = resposta.choices[0].message.content
+        
+    except Exception as e:
+        ERROS.labels("llm").inc()
+        log.error(f"❌ Erro na chamada Azure OpenAI: {e}")
+        return mensagem_erro_openai(e)
+    
+    await asyncio.to_thread(registrar_resposta, pergunta, documentos, resposta_texto)
+    return resposta_texto
+
+def fatiar_resposta(texto, tamanho=STREAM_CACHE_CHUNK_CHARS):
+    """Divide uma resposta pronta em pedaços para replay em streaming (quebra em espaços)"""
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(inicio + tamanho, len(texto))
+        if fim < len(texto):
+            espaco = texto.rfind(' ', inicio, fim)
+            if espaco > inicio:
+                fim = espaco + 1
+        yield texto[inicio:fim]
+        inicio = fim
+
+async def perguntar_ao_modelo_stream(pergunta):
+    """Gera a resposta em fragmentos à medida que o Azure OpenAI os envia.
+
+    Cache hits e respostas de perguntas equivalentes em andamento são
+    reenviados em pedaços; a resposta completa só é gravada no cache quando
+    o stream termina sem erro.
+    """
+    inicio = time.perf_counter()
+    with medir("cache_lookup"):
+        resposta_cache = await asyncio.to_thread(cache_manager.encontrar_pergunta_similar, pergunta)
+    if resposta_cache:
+        for pedaco in fatiar_resposta(resposta_cache):
+            yield pedaco
+        LATENCIA_REQUISICAO.labels("cache").observe(time.perf_counter() - inicio)
+        return
+    
+    voo = coalescedor.entrar(pergunta)
+    if not voo.lider:
+        log.info("🔗 Pergunta equivalente em andamento, aguardando a mesma resposta")
+        with medir("coalesce_wait"):
+            resposta = await voo.aguardar_async()
+        if resposta is not None:
+            for pedaco in fatiar_resposta(resposta):
+                yield pedaco
+            LATENCIA_REQUISICAO.labels("coalesced").observe(time.perf_counter() - inicio)
+            return
+        voo = None
+    
+    resultado = {'resposta': None}
+    origem = "generated"
+    try:
+        with medir("cache_lookup"):
+            resposta_cache = await asyncio.to_thread(cache_manager.encontrar_pergunta_similar, pergunta)
+        if resposta_cache:
+            origem = "cache"
+            resultado['resposta'] = resposta_cache
+            for pedaco in fatiar_resposta(resposta_cache):
+                yield pedaco
+        else:
+            async for fragmento in _gerar_resposta_stream(pergunta, resultado):
+                yield fragmento
+    finally:
+        LATENCIA_REQUISICAO.labels(origem).observe(time.perf_counter() - inicio)
+        if voo is not None:
+            if resultado['resposta'] is not None:
+                coalescedor.concluir(voo, resultado['resposta'])
+            else:
+                coalescedor.abandonar(voo, RuntimeError("Geração da pergunta líder interrompida"))
+
+async def _gerar_resposta_stream(pergunta, resultado):
+    """Busca e gera em streaming; resultado['resposta'] só é preenchido se o stream terminar"""
+    documentos = await buscar_documentos_async(pergunta)
+    
+    inicio_llm = time.perf_counter()
+    try:
+        client = get_azure_openai_async_client()
+        stream = await client.chat.completions.create(
+            model=AZURE_OPENAI_DEPLOYMENT,
+            messages=montar_mensagens(pergunta, documentos),
+            stream=True,
+            **PARAMETROS_GERACAO
+        )
+    except Exception as e:
+        ERROS.labels("llm").inc()
+        log.error(f"❌ Erro na chamada Azure OpenAI: {e}")
+        resultado['resposta'] = mensagem_erro_openai(e)
+        yield resultado['resposta']
+        return
+    
+    gerado = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            conteudo = chunk.choices[0].delta.content
+            if conteudo:
+                if not gerado:
+                    LATENCIA_ETAPA.labels("llm_first_token").observe(time.perf_counter() - inicio_llm)
+                gerado.append(conteudo)
+                yield conteudo
+    except Exception as e:
+        ERROS.labels("llm").inc()
+        log.error(f"❌ Erro durante o streaming Azure OpenAI: {e}")
+        yield "\n\n" + mensagem_erro_openai(e)
+        return
+    
+    resposta_texto = "".join(gerado)
+    LATENCIA_ETAPA.labels("llm").observe(time.perf_counter() - inicio_llm)
+    if resposta_texto:
+        await asyncio.to_thread(registrar_resposta, pergunta, documentos, resposta_texto)
+        resultado['resposta'] = resposta_texto
+
+def agrupar_perguntas_similares(perguntas):
+    """Agrupa perguntas quase idênticas do lote: retorna o índice do líder de cada uma"""
+    if not perguntas:
+        return []
+    
+    normalizadas = [cache_manager.normalizar_pergunta(p) for p in perguntas]
+    # O IDF do índice é recalculado sob demanda: sem o lock, inserções concorrentes o invalidam no meio
+    with cache_manager.lock:
+        consultas = cache_manager.indice.matriz_consultas(normalizadas, ignorar_desconhecidos=False)
+    similaridades = (consultas @ consultas.T).tocsr()
+    
+    # Um passe pelas linhas da matriz CSR: o líder de cada pergunta é o primeiro
+    # líder (menor índice) parecido com ela, ou ela mesma
+    e_lider = np.zeros(len(perguntas), dtype=bool)
+    lider_por_texto = {}
+    ponteiros, colunas, valores = similaridades.indptr, similaridades.indices, similaridades.data
+    lider_de = []
+    for i, normalizada in enumerate(normalizadas):
+        linha = slice(ponteiros[i], ponteiros[i + 1])
+        parecidos = colunas[linha][valores[linha] >= SIMILARITY_THRESHOLD]
+        parecidos = parecidos[e_lider[parecidos]]
+        lider = lider_por_texto.get(normalizada)
+        if parecidos.size:
+            lider = min(int(parecidos.min()), lider if lider is not None else len(perguntas))
+        if lider is None:
+            lider = i
+            e_lider[i] = True
+            lider_por_texto[normalizada] = i
+        lider_de.append(lider)
+    return lider_de
+
+async def perguntar_em_lote(perguntas, concorrencia=BATCH_CONCURRENCY):
+    """Responde várias perguntas: cache em lote, agrupamento de quase-duplicatas e
+    busca/geração das restantes com no máximo `concorrencia` em paralelo.
+
+    Gera dicionários {index, question, answer, source, group} à medida que ficam prontos.
+    """
+    respostas_cache = await asyncio.to_thread(cache_manager.encontrar_em_lote, perguntas)
+    for i, resposta in enumerate(respostas_cache):
+        if resposta is not None:
+            yield {"index": i, "question": perguntas[i], "answer": resposta, "source": "cache", "group": i}
+    
+    faltantes = [i for i, resposta in enumerate(respostas_cache) if resposta is None]
+    lider_de = await asyncio.to_thread(agrupar_perguntas_similares, [perguntas[i] for i in faltantes])
+    grupos = {}
+    for posicao, i in enumerate(faltantes):
+        grupos.setdefault(faltantes[lider_de[posicao]], []).append(i)
+    if faltantes:
+        log.info(f"📦 Lote: {len(faltantes)} perguntas sem cache em {len(grupos)} grupos")
+    
+    semaforo = asyncio.Semaphore(max(1, concorrencia))
+    
+    async def responder(lider):
+        async with semaforo:
+            try:
+                return lider, await perguntar_ao_modelo_async(perguntas[lider]), None
+            except Exception as e:
+                return lider, None, str(e)
+    
+    # Tarefas explícitas: se o consumidor desistir (cliente desconectou e o
+    # gerador foi fechado), as que ainda não terminaram são canceladas
+    tarefas = [asyncio.create_task(responder(lider)) for lider in grupos]
+    try:
+        for tarefa in asyncio.as_completed(tarefas):
+            lider, resposta, erro = await tarefa
+            for i in grupos[lider]:
+                item = {"index": i, "question": perguntas[i], "source": "generated" if i == lider else "grouped",
+                        "group": lider}
+                if erro is None:
+                    item["answer"] = resposta
+                else:
+                    item["error"] = erro
+                yield item
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
 def estatisticas_cache():
     """Mostra estatísticas do cache"""
-    cache = cache_manager.cache
-    total = len(cache)
+    total, soma_usos, max_usos = cache_manager.estatisticas_uso()
     
     if total == 0:
         print("📊 Cache vazio")
         return
     
-    usos = [entry.get('uso_count', 1) for entry in cache.values()]
-    
     print(f"📊 Estatísticas do Cache:")
     print(f"   Total de entradas: {total}")
-    print(f"   Uso médio: {sum(usos)/len(usos):.1f}")
-    print(f"   Entrada mais usada: {max(usos)} vezes")
-    print(f"   Economia estimada: {sum(usos) - total} consultas ao modelo")
+    print(f"   Uso médio: {soma_usos/total:.1f}")
+    print(f"   Entrada mais usada: {max_usos} vezes")
+    print(f"   Economia estimada: {soma_usos - total} consultas ao modelo")
 
 def mostrar_configuracoes_qualidade():
     """Mostra configurações atuais de qualidade otimizadas"""
@@ -0,0 +1,211 @@
+import json
+import time
+import itertools
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import HttpResponseError
+from azure.search.documents import IndexDocumentsBatch
+
+log = logging.getLogger("rag.indexacao")
+
+# Limites do Azure AI Search por requisição de indexação
+MAX_BYTES_LOTE = 16 * 1024 * 1024
+MAX_DOCS_LOTE = 1000
+MIN_BYTES_LOTE = 64 * 1024
+
+# Status que indicam falha transitória de um documento (ou do lote inteiro)
+STATUS_RETENTAVEIS = {409, 422, 429, 500, 502, 503, 504}
+
+class EnviadorIndice:
+    """Envio em lote compartilhado por toda a indexação.
+
+    - Acumula ações (merge_or_upload / delete) de vários arquivos num buffer
+      e fecha o lote pelo tamanho do payload JSON (até o limite do serviço).
+    - Mantém até `em_voo` lotes sendo enviados ao mesmo tempo; quem chama
+      `enviar` bloqueia quando todos estão ocupados (backpressure).
+    - Documentos recusados com status transitório voltam ao buffer após
+      backoff exponencial com jitter; o tamanho-alvo do lote cai pela
+      metade sob throttling e volta a crescer após lotes sem falhas.
+    - Cada chamada a `enviar` pode informar `ao_concluir(falhas)`, chamado
+      quando todas as suas ações terminarem (com sucesso ou falha final).
+    """
+
+    def __init__(self, search_client, em_voo=4, max_bytes=MAX_BYTES_LOTE, max_docs=MAX_DOCS_LOTE,
+                 max_tentativas=5, backoff_base=1.0, backoff_max=60.0):
+        self.search_client = search_client
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.limite_bytes = max_bytes
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.lock = threading.Condition()
+        self.buffer = []
+        self.bytes_buffer = 0
+        self.pendentes = 0
+        self.ocioso = False
+        # Lotes enviados em paralelo = threads do executor; o produtor ainda pode
+        # deixar outros `em_voo` lotes prontos na fila antes de bloquear
+        self.vagas = threading.Semaphore(em_voo * 2)
+        self.executor = ThreadPoolExecutor(max_workers=em_voo, thread_name_prefix="enviador")
+        self.relatorio = {'enviados': 0, 'excluidos': 0, 'lotes': 0, 'retentativas': 0,
+                          'bytes': 0, 'segundos_envio': 0.0, 'falhas': []}
+
+    @staticmethod
+    def tamanho_acao(documento):
+        return len(json.dumps(documento, ensure_ascii=False).encode('utf-8')) + 32
+
+    def enviar(self, documentos=(), exclusoes=(), ao_concluir=None):
+        """Enfileira documentos para merge_or_upload e IDs para exclusão.
+
+        Aceita iteráveis (ex.: um gerador lendo os chunks do disco): os
+        documentos são consumidos um a um, sem montar a lista inteira.
+        """
+        # O grupo começa com 1 pendente (esta chamada), para não concluir
+        # antes de o último documento ser enfileirado
+        grupo = {'restantes': 1, 'falhas': [], 'ao_concluir': ao_concluir}
+        acoes = itertools.chain((('merge_or_upload', doc, grupo, 1) for doc in documentos),
+                                (('delete', {'id': id_doc}, grupo, 1) for id_doc in exclusoes))
+        for acao in acoes:
+            with self.lock:
+                grupo['restantes'] += 1
+                self.pendentes += 1
+            self._adicionar(acao)
+        self._descontar(grupo)
+
+    def _adicionar(self, acao, bloquear=True):
+        tamanho = self.tamanho_acao(acao[1])
+        lote = None
+        with self.lock:
+            if self.buffer and (self.bytes_buffer + tamanho > self.limite_bytes
+                                or len(self.buffer) >= self.max_docs):
+                lote = self._retirar_buffer()
+            self.buffer.append(acao)
+            self.bytes_buffer += tamanho
+        if lote:
+            self._despachar(lote, bloquear)
+
+    def _retirar_buffer(self):
+        lote = self.buffer
+        self.buffer = []
+        self.bytes_buffer = 0
+        return lote
+
+    def _despachar(self, lote, bloquear=True):
+        # Só o produtor espera por vaga: as threads do executor reenviando
+        # retentativas nunca bloqueiam (senão poderiam travar umas às outras)
+        if bloquear:
+            self.vagas.acquire()
+        self.executor.submit(self._enviar_lote, lote, bloquear)
+
+    def _enviar_lote(self, lote, liberar_vaga):
+        try:
+            resultados = self._executar(lote)
+        finally:
+            if liberar_vaga:
+                self.vagas.release()
+
+        retentar = []
+        for acao, (ok, status, mensagem) in zip(lote, resultados):
+            tipo, documento, grupo, tentativa = acao
+            if ok:
+                self._finalizar(acao)
+            elif status in STATUS_RETENTAVEIS and tentativa < self.max_tentativas:
+                retentar.append((tipo, documento, grupo, tentativa + 1))
+            else:
+                self._finalizar(acao, (documento['id'], tipo, status, mensagem))
+
+        self._ajustar_limite(throttling=bool(retentar))
+        if retentar:
+            tentativa = max(acao[3] for acao in retentar)
+            espera = min(self.backoff_max, self.backoff_base * 2 ** (tentativa - 2))
+            time.sleep(espera * random.uniform(0.5, 1.0))
+            with self.lock:
+                self.relatorio['retentativas'] += len(retentar)
+            for acao in retentar:
+                self._adicionar(acao, bloquear=False)
+            self._liberar_buffer_se_ocioso()
+
+    def _executar(self, lote):
+        """Envia o lote; retorna [(ok, status, mensagem)] na ordem das ações"""
+        batch = IndexDocumentsBatch()
+        for tipo, documento, _, _ in lote:
+            if tipo == 'delete':
+                batch.add_delete_actions([documento])
+            else:
+                batch.add_merge_or_upload_actions([documento])
+
+        inicio = time.perf_counter()
+        try:
+            resultados = self.search_client.index_documents(batch)
+        except HttpResponseError as e:
+            # Lote inteiro recusado (ex.: 503 por throttling): todas as ações com o mesmo status
+            status = e.status_code or 503
+            resultados = None
+            erro = (False, status, str(e.message or e)[:300])
+        except Exception as e:
+            resultados = None
+            erro = (False, 503, str(e)[:300])
+        finally:
+            with self.lock:
+                self.relatorio['segundos_envio'] += time.perf_counter() - inicio
+                self.relatorio['lotes'] += 1
+
+        if resultados is None:
+            return [erro] * len(lote)
+        por_chave = {r.key: (r.succeeded, r.status_code, r.error_message) for r in resultados}
+        with self.lock:
+            self.relatorio['bytes'] += sum(self.tamanho_acao(acao[1]) for acao in lote)
+        return [por_chave.get(acao[1]['id'], (False, 503, "sem resultado para a chave")) for acao in lote]
+
+    def _ajustar_limite(self, throttling):
+        with self.lock:
+            if throttling:
+                self.limite_bytes = max(MIN_BYTES_LOTE, self.limite_bytes // 2)
+            else:
+                self.limite_bytes = min(self.max_bytes, int(self.limite_bytes * 1.25))
+
+    def _finalizar(self, acao, falha=None):
+        tipo, _, grupo, _ = acao
+        with self.lock:
+            if falha is None:
+                self.relatorio['excluidos' if tipo == 'delete' else 'enviados'] += 1
+            else:
+                self.relatorio['falhas'].append(falha)
+                grupo['falhas'].append(falha)
+            self.pendentes -= 1
+            self.lock.notify_all()
+        self._descontar(grupo)
+
+    def _descontar(self, grupo):
+        with self.lock:
+            grupo['restantes'] -= 1
+            concluido = grupo['restantes'] == 0
+        if concluido and grupo['ao_concluir']:
+            try:
+                grupo['ao_concluir'](grupo['falhas'])
+            except Exception as e:
+                log.error(f"❌ Erro no retorno de conclusão do envio: {e}")
+
+    def _liberar_buffer_se_ocioso(self):
+        """Envia o resto do buffer quando só faltam retentativas (ninguém mais vai enchê-lo)"""
+        with self.lock:
+            lote = self._retirar_buffer() if self.buffer and self.ocioso else None
+        if lote:
+            self._despachar(lote, bloquear=False)
+
+    def fechar(self):
+        """Envia o que restou, espera todas as ações (inclusive retentativas) e retorna o relatório"""
+        with self.lock:
+            self.ocioso = True
+            lote = self._retirar_buffer() if self.buffer else None
+        if lote:
+            self._despachar(lote)
+        with self.lock:
+            while self.pendentes:
+                self.lock.wait()
+        self.executor.shutdown(wait=True)
+        return self.relatorio
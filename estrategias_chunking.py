@@ -0,0 +1,167 @@
+import re
+
+from tokenizacao import TOKENIZER_ENCODING, contar_tokens, dividir_frases, carregar_tokenizador
+
+REGEX_PARAGRAFOS = re.compile(r'\n[ \t]*\n+')
+
+class ChunkingFixo:
+    """Janelas de `tamanho` caracteres com `sobreposicao`, página a página (comportamento original)"""
+
+    nome = "fixo"
+
+    def __init__(self, tamanho=1200, sobreposicao=200):
+        self.tamanho = tamanho
+        self.sobreposicao = sobreposicao
+
+    def assinatura(self):
+        """Identifica a configuração; mudar a assinatura obriga a refazer os chunks"""
+        return f"{self.nome}:{self.tamanho}:{self.sobreposicao}"
+
+    def dividir(self, paginas_texto):
+        """Gera (texto, página inicial, página final); consome as páginas (lista ou gerador) aos poucos"""
+        for pagina_info in paginas_texto:
+            texto, pagina = pagina_info['texto'], pagina_info['pagina']
+            if len(texto) <= self.tamanho:
+                pedacos = [texto]
+            else:
+                passo = self.tamanho - self.sobreposicao
+                pedacos = [texto[i:i + self.tamanho] for i in range(0, len(texto), passo)]
+            for pedaco in pedacos:
+                if len(pedacos) > 1 and not pedaco.strip():
+                    continue
+                yield (pedaco, pagina, pagina)
+
+class ChunkingFrases(ChunkingFixo):
+    """Junta frases e parágrafos, atravessando páginas, até `tamanho` caracteres.
+
+    Os cortes caem entre frases (e, com o chunk já bem cheio, preferem o fim de
+    um parágrafo). A sobreposição repete as últimas frases inteiras do chunk
+    anterior, e um resto pequeno no fim do documento é anexado ao último chunk
+    em vez de virar um chunk minúsculo.
+    """
+
+    nome = "frases"
+    fracao_minima = 0.25  # resto menor que isso (em relação a `tamanho`) não vira chunk próprio
+    fracao_paragrafo = 0.6  # acima disso, um novo parágrafo fecha o chunk
+
+    def medir(self, texto):
+        return len(texto)
+
+    def segmentar(self, paginas_texto):
+        """Gera as frases de todas as páginas: (texto, página, inicia_paragrafo, medida)"""
+        for pagina_info in paginas_texto:
+            pagina = pagina_info['pagina']
+            for paragrafo in REGEX_PARAGRAFOS.split(pagina_info['texto']):
+                inicio = True
+                for frase in dividir_frases(paragrafo.strip()):
+                    for pedaco in self.quebrar(frase):
+                        yield (pedaco, pagina, inicio, self.medir(pedaco))
+                        inicio = False
+
+    def quebrar(self, frase):
+        """Divide uma frase maior que `tamanho` entre palavras (ou no meio, se for uma palavra só)"""
+        if self.medir(frase) <= self.tamanho:
+            return [frase]
+        pedacos = []
+        atual = ""
+        for palavra in frase.split():
+            candidato = f"{atual} {palavra}" if atual else palavra
+            if atual and self.medir(candidato) > self.tamanho:
+                pedacos.append(atual)
+                candidato = palavra
+            while self.medir(candidato) > self.tamanho:
+                corte = max(1, len(candidato) * self.tamanho // self.medir(candidato))
+                pedacos.append(candidato[:corte])
+                candidato = candidato[corte:]
+            atual = candidato
+        if atual:
+            pedacos.append(atual)
+        return pedacos
+
+    @staticmethod
+    def juntar(segmentos):
+        partes = []
+        for i, (texto, _, inicia_paragrafo, _) in enumerate(segmentos):
+            if i:
+                partes.append("\n\n" if inicia_paragrafo else " ")
+            partes.append(texto)
+        return "".join(partes)
+
+    def dividir(self, paginas_texto):
+        # Só o chunk atual e o último fechado ficam em memória; o último é retido
+        # até o próximo fechar porque pode receber o resto do fim do documento
+        fechado = None
+        atual = []
+        novos = 0  # segmentos do chunk atual que não vieram da sobreposição
+        medida = 0
+
+        for segmento in self.segmentar(paginas_texto):
+            _, _, inicia_paragrafo, tamanho_segmento = segmento
+            cheio = medida + tamanho_segmento + 1 > self.tamanho
+            fim_paragrafo = inicia_paragrafo and medida >= self.tamanho * self.fracao_paragrafo
+            if novos and (cheio or fim_paragrafo):
+                if fechado:
+                    yield fechado
+                fechado = (self.juntar(atual), atual[0][1], atual[-1][1])
+                # Sobreposição: últimas frases inteiras que cabem em `sobreposicao`
+                repetidos = []
+                medida_repetida = 0
+                for anterior in reversed(atual):
+                    if medida_repetida + anterior[3] + 1 > self.sobreposicao \
+                            or medida_repetida + anterior[3] + tamanho_segmento + 2 > self.tamanho:
+                        break
+                    repetidos.insert(0, anterior)
+                    medida_repetida += anterior[3] + 1
+                atual, novos, medida = repetidos, 0, medida_repetida
+            atual.append(segmento)
+            novos += 1
+            medida += tamanho_segmento + (1 if len(atual) > 1 else 0)
+
+        if novos:
+            restante = atual[len(atual) - novos:]
+            if fechado and sum(s[3] for s in restante) < self.tamanho * self.fracao_minima:
+                texto, pagina_inicio, _ = fechado
+                fechado = (texto + " " + self.juntar(restante), pagina_inicio, restante[-1][1])
+            else:
+                if fechado:
+                    yield fechado
+                fechado = (self.juntar(atual), atual[0][1], atual[-1][1])
+        if fechado:
+            yield fechado
+
+class ChunkingTokens(ChunkingFrases):
+    """Como `frases`, mas `tamanho` e `sobreposicao` são medidos em tokens do modelo"""
+
+    nome = "tokens"
+
+    def __init__(self, tamanho=300, sobreposicao=50):
+        super().__init__(tamanho, sobreposicao)
+
+    def assinatura(self):
+        # A contagem muda se o tokenizer não estiver disponível
+        return f"{self.nome}:{self.tamanho}:{self.sobreposicao}:{TOKENIZER_ENCODING if carregar_tokenizador() else 'caracteres'}"
+
+    def medir(self, texto):
+        carregar_tokenizador()  # na indexação espera a carga em vez de estimar os primeiros chunks
+        return contar_tokens(texto)
+
+ESTRATEGIAS = {
+    ChunkingFixo.nome: ChunkingFixo,
+    ChunkingFrases.nome: ChunkingFrases,
+    ChunkingTokens.nome: ChunkingTokens,
+}
+
+def criar_estrategia(nome, tamanho=None, sobreposicao=None):
+    """Instancia a estratégia de chunking; tamanhos None usam o padrão da estratégia"""
+    if nome not in ESTRATEGIAS:
+        raise ValueError(f"Estratégia de chunking desconhecida: {nome} (use: {', '.join(ESTRATEGIAS)})")
+    parametros = {}
+    if tamanho is not None:
+        parametros['tamanho'] = tamanho
+    if sobreposicao is not None:
+        parametros['sobreposicao'] = sobreposicao
+    estrategia = ESTRATEGIAS[nome](**parametros)
+    if not 0 <= estrategia.sobreposicao < estrategia.tamanho:
+        raise ValueError(f"Chunking {nome}: a sobreposição ({estrategia.sobreposicao}) deve ser >= 0 "
+                         f"e menor que o tamanho ({estrategia.tamanho})")
+    return estrategia
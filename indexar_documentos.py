@@ -8,8 +8,29 @@ from azure.search.documents import SearchClient
 from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 import re
+import json
+import time
+import uuid
+import shutil
+import signal
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
 import unicodedata
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from enviador_indice import EnviadorIndice
+from manifestos import carregar_manifesto, salvar_manifesto
+from estrategias_chunking import ESTRATEGIAS, criar_estrategia
+
+try:
+    import resource
+except ImportError:  # Windows: sem limite de memória por processo
+    resource = None
 
 load_dotenv()
 
@@ -18,29 +39,83 @@ AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY")
 AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX")
 
 PDF_FOLDER = "kbs_confluence"
+# Estratégia de chunking (fixo, frases ou tokens); tamanho/sobreposição na unidade da estratégia
+CHUNK_STRATEGY = os.getenv("RAG_CHUNK_STRATEGY", "frases")
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "0")) or None
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP")) if os.getenv("RAG_CHUNK_OVERLAP") else None
+CHUNKING_LEGADO = "fixo:1200:200"  # entradas do manifesto anteriores às estratégias
+INDEX_GENERATION_FILE = os.getenv("RAG_INDEX_GENERATION_FILE", "indice_geracao.txt")
 
-def extrair_texto_com_paginas(caminho):
-    """Extrai texto e mantém informação da página"""
-    leitor = PdfReader(caminho)
-    paginas_texto = []
+# Pipeline de indexação: extração/chunking em processos, upload por um enviador único
+PROCESSOS_EXTRACAO = int(os.getenv("RAG_INDEX_PROCESSES", "0")) or os.cpu_count() or 1
+THREADS_UPLOAD = int(os.getenv("RAG_INDEX_UPLOADERS", "4"))  # lotes enviados em paralelo
+FAILURES_FILE = os.getenv("RAG_INDEX_FAILURES", "indice_falhas.json")
+
+# Manifesto da indexação incremental: arquivo -> hash, mtime, tamanho e IDs dos chunks
+MANIFEST_FILE = os.getenv("RAG_INDEX_MANIFEST", "indice_manifesto.json")
+
+# Proteção do pool: tempo máximo por arquivo, memória extra por processo e
+# arquivos em quarentena (não são reprocessados até mudarem)
+TIMEOUT_ARQUIVO = float(os.getenv("RAG_INDEX_FILE_TIMEOUT", "300"))  # segundos; 0 desativa
+MEMORIA_MAX_MB = int(os.getenv("RAG_INDEX_MAX_MEMORY_MB", "1024"))  # por processo de extração; 0 desativa
+QUARANTINE_FILE = os.getenv("RAG_INDEX_QUARANTINE", "indice_quarentena.json")
+
+class TempoEsgotado(BaseException):
+    """Arquivo passou do tempo máximo de extração (BaseException: o PyPDF2 não a engole em `except Exception`)"""
+
+def _estourar_tempo(signum, frame):
+    raise TempoEsgotado()
+
+@contextlib.contextmanager
+def limite_tempo(segundos):
+    """Levanta TempoEsgotado após `segundos` de relógio (SIGALRM; só na thread principal, fora do Windows)"""
+    if not segundos or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    anterior = signal.signal(signal.SIGALRM, _estourar_tempo)
+    signal.setitimer(signal.ITIMER_REAL, segundos)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, anterior)
+
+def limitar_memoria_processo(limite_mb):
+    """Inicializador do pool: limita o espaço de endereçamento do processo ao atual + `limite_mb`.
     
+    Um PDF que tente alocar além disso recebe MemoryError em vez de derrubar a máquina.
+    """
+    if not limite_mb or resource is None or not os.path.exists('/proc/self/statm'):
+        return
+    with open('/proc/self/statm') as f:
+        atual = int(f.read().split()[0]) * resource.getpagesize()
+    _, maximo = resource.getrlimit(resource.RLIMIT_AS)
+    limite = atual + limite_mb * 1024 * 1024
+    if maximo != resource.RLIM_INFINITY:
+        limite = min(limite, maximo)
+    resource.setrlimit(resource.RLIMIT_AS, (limite, maximo))
+
+def iterar_paginas_pdf(leitor):
+    """Gera o texto de cada página com conteúdo ({'texto', 'pagina'}), uma página por vez"""
     for num_pagina, pagina in enumerate(leitor.pages, 1):
         texto_pagina = pagina.extract_text()
         if texto_pagina.strip():
-            paginas_texto.append({
+            yield {
                 'texto': texto_pagina,
                 'pagina': num_pagina
-            })
-    
-    return paginas_texto
+            }
+
+def extrair_texto_com_paginas(caminho):
+    """Extrai texto e mantém informação da página"""
+    return list(iterar_paginas_pdf(PdfReader(caminho)))
 
 def sanitizar_nome(nome):
     """Remove acentos e caracteres especiais"""
     nome = unicodedata.normalize('NFKD', nome).encode('ASCII', 'ignore').decode('ASCII')
     return re.sub(r'[^a-zA-Z0-9_\-=]', '_', nome)
 
-def criar_indice_melhorado():
-    """Cria índice com campos de metadata aprimorados"""
+def criar_indice_melhorado(recriar=True):
+    """Cria índice com campos de metadata aprimorados (com recriar=False, só se ainda não existir)"""
     index_client = SearchIndexClient(endpoint=AZURE_SEARCH_ENDPOINT, credential=AzureKeyCredential(AZURE_SEARCH_KEY))
     
     campos = [
@@ -49,6 +124,7 @@ def criar_indice_melhorado():
         SimpleField(name="file_name", type=SearchFieldDataType.String, filterable=True),
         SimpleField(name="filename", type=SearchFieldDataType.String, filterable=True),
         SimpleField(name="page_number", type=SearchFieldDataType.Int32, sortable=True, filterable=True),
+        SimpleField(name="page_end", type=SearchFieldDataType.Int32, sortable=True, filterable=True),
         SimpleField(name="chunk_id", type=SearchFieldDataType.Int32, sortable=True, filterable=True),
         SimpleField(name="total_pages", type=SearchFieldDataType.Int32, filterable=True),
         SearchableField(name="file_type", type=SearchFieldDataType.String, filterable=True),
@@ -58,111 +134,443 @@ def criar_indice_melhorado():
     index = SearchIndex(name=AZURE_SEARCH_INDEX, fields=campos)
     
     if AZURE_SEARCH_INDEX in [i.name for i in index_client.list_indexes()]:
+        if not recriar:
+            # Índices antigos ganham os campos novos (adicionar campos não exige recriar)
+            existente = index_client.get_index(AZURE_SEARCH_INDEX)
+            nomes = {campo.name for campo in existente.fields}
+            faltantes = [campo for campo in campos if campo.name not in nomes]
+            if faltantes:
+                existente.fields.extend(faltantes)
+                index_client.create_or_update_index(existente)
+                print(f"✅ Campos adicionados ao índice: {', '.join(c.name for c in faltantes)}")
+            return
         index_client.delete_index(AZURE_SEARCH_INDEX)
         print("⚠️ Índice anterior deletado.")
     
     index_client.create_index(index)
     print("✅ Novo índice melhorado criado com metadata rica.")
 
-def enviar_documentos_melhorado(paginas_texto, file_name):
-    """Envia documentos com metadata rica"""
-    search_client = SearchClient(endpoint=AZURE_SEARCH_ENDPOINT, 
-                               index_name=AZURE_SEARCH_INDEX, 
-                               credential=AzureKeyCredential(AZURE_SEARCH_KEY))
-    
+def gerar_chunks(paginas_texto, file_name, estrategia=None, file_type="PDF"):
+    """Divide as páginas em chunks com a estratégia configurada e monta os documentos do índice (sem I/O)"""
+    return list(iterar_chunks(paginas_texto, file_name, len(paginas_texto), estrategia, file_type))
+
+def iterar_chunks(paginas_texto, file_name, total_paginas, estrategia=None, file_type="PDF"):
+    """Como gerar_chunks, mas gera os documentos à medida que as páginas (lista ou gerador) chegam"""
+    estrategia = estrategia or criar_estrategia(CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP)
     safe_file_name = sanitizar_nome(file_name)
-    total_paginas = len(paginas_texto)
-    docs = []
     
-    chunk_counter = 0
-    for pagina_info in paginas_texto:
-        texto_pagina = pagina_info['texto']
-        num_pagina = pagina_info['pagina']
-        
-        chunk_size = 1200
-        overlap = 200
-        
-        if len(texto_pagina) <= chunk_size:
-            doc = {
-                "id": f"{safe_file_name}_p{num_pagina}_c{chunk_counter}",
-                "content": texto_pagina,
-                "file_name": file_name,
-                "filename": file_name,
-                "page_number": num_pagina,
-                "chunk_id": chunk_counter,
-                "total_pages": total_paginas,
-                "file_type": "PDF",
-                "created_date": "2024-01-01T00:00:00Z"
-            }
-            docs.append(doc)
-            chunk_counter += 1
-        else:
-            for i in range(0, len(texto_pagina), chunk_size - overlap):
-                chunk = texto_pagina[i:i + chunk_size]
-                if chunk.strip():
-                    doc = {
-                        "id": f"{safe_file_name}_p{num_pagina}_c{chunk_counter}",
-                        "content": chunk,
-                        "file_name": file_name,
-                        "filename": file_name,
-                        "page_number": num_pagina,
-                        "chunk_id": chunk_counter,
-                        "total_pages": total_paginas,
-                        "file_type": "PDF", 
-                        "created_date": "2024-01-01T00:00:00Z"
-                    }
-                    docs.append(doc)
-                    chunk_counter += 1
-    
-    batch_size = 50
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i:i + batch_size]
-        search_client.upload_documents(documents=batch)
-        
-    print(f"✅ {len(docs)} chunks enviados ao índice para {file_name} ({total_paginas} páginas).")
+    for chunk_counter, (chunk, pagina_inicio, pagina_fim) in enumerate(estrategia.dividir(paginas_texto)):
+        yield {
+            "id": f"{safe_file_name}_p{pagina_inicio}_c{chunk_counter}",
+            "content": chunk,
+            "file_name": file_name,
+            "filename": file_name,
+            "page_number": pagina_inicio,
+            "page_end": pagina_fim,
+            "chunk_id": chunk_counter,
+            "total_pages": total_paginas,
+            "file_type": file_type,
+            "created_date": "2024-01-01T00:00:00Z"
+        }
 
-def indexar_pdf_melhorado(nome_arquivo):
-    """Indexa PDF com metadata rica"""
-    caminho_pdf = os.path.join(PDF_FOLDER, nome_arquivo)
+def criar_search_client():
+    return SearchClient(endpoint=AZURE_SEARCH_ENDPOINT,
+                        index_name=AZURE_SEARCH_INDEX,
+                        credential=AzureKeyCredential(AZURE_SEARCH_KEY))
+
+def enviar_documentos_melhorado(paginas_texto, file_name, search_client=None):
+    """Envia documentos com metadata rica"""
+    if search_client is None:
+        search_client = criar_search_client()
     
-    if os.path.getsize(caminho_pdf) == 0:
-        print(f"⚠️ Arquivo vazio ignorado: {nome_arquivo}")
-        return 'vazio', nome_arquivo
+    total_paginas = len(paginas_texto)
+    enviador = EnviadorIndice(search_client)
+    enviador.enviar(iterar_chunks(paginas_texto, file_name, total_paginas))
+    relatorio = enviador.fechar()
+    print(f"✅ {relatorio['enviados']} chunks enviados ao índice para {file_name} ({total_paginas} páginas).")
+    if relatorio['falhas']:
+        print(f"❌ {len(relatorio['falhas'])} chunks não foram aceitos pelo índice")
+    return relatorio
+
+def hash_arquivo(caminho):
+    """SHA-256 do conteúdo do arquivo (lido em blocos)"""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def processar_pdf(nome_arquivo, pasta=PDF_FOLDER, hash_anterior=None, estrategia=None, pasta_spool=None,
+                  timeout=TIMEOUT_ARQUIVO):
+    """Extrai e divide um PDF em chunks (executa em um processo do pool).
     
+    As páginas são extraídas uma a uma e passam direto pelo chunking. Com
+    `pasta_spool`, os documentos são gravados em um JSONL nessa pasta (resultado
+    'spool') em vez de voltarem em memória ('docs'), então nem o processo nem o
+    pool guardam o arquivo inteiro. Se o hash do conteúdo for igual a
+    `hash_anterior`, não extrai nada e retorna status 'inalterado'. Arquivos que
+    passam de `timeout` segundos ou do limite de memória do processo voltam com
+    status 'quarentena'.
+    """
+    inicio = time.perf_counter()
+    caminho_pdf = os.path.join(pasta, nome_arquivo)
+    resultado = {'arquivo': nome_arquivo, 'docs': [], 'spool': None, 'ids': [], 'chunks': 0, 'paginas': 0,
+                 'erro': None}
+    spool = None
     try:
-        paginas_texto = extrair_texto_com_paginas(caminho_pdf)
-        if not paginas_texto:
-            print(f"⚠️ Nenhum texto extraído de: {nome_arquivo}")
-            return 'vazio', nome_arquivo
-            
-        enviar_documentos_melhorado(paginas_texto, nome_arquivo)
-        return 'indexado', nome_arquivo
+        info = os.stat(caminho_pdf)
+        resultado.update(mtime=info.st_mtime, tamanho=info.st_size)
+        with limite_tempo(timeout):
+            resultado['hash'] = hash_arquivo(caminho_pdf)
+            if resultado['hash'] == hash_anterior:
+                resultado['status'] = 'inalterado'
+            elif info.st_size == 0:
+                resultado['status'] = 'vazio'
+            else:
+                leitor = PdfReader(caminho_pdf)
+                paginas = 0
+                def contar_paginas(paginas_pdf):
+                    nonlocal paginas
+                    for pagina in paginas_pdf:
+                        paginas += 1
+                        yield pagina
+                docs = iterar_chunks(contar_paginas(iterar_paginas_pdf(leitor)), nome_arquivo, len(leitor.pages),
+                                     estrategia)
+                if pasta_spool:
+                    resultado['spool'] = os.path.join(pasta_spool, f"{uuid.uuid4().hex}.jsonl")
+                    spool = open(resultado['spool'], 'w', encoding='utf-8')
+                for doc in docs:
+                    resultado['ids'].append(doc['id'])
+                    if spool:
+                        spool.write(json.dumps(doc, ensure_ascii=False) + '\n')
+                    else:
+                        resultado['docs'].append(doc)
+                resultado.update(status='indexado' if resultado['ids'] else 'vazio', paginas=paginas,
+                                 chunks=len(resultado['ids']))
+    except TempoEsgotado:
+        resultado.update(status='quarentena', erro=f"extração passou de {timeout:.0f}s")
+    except MemoryError:
+        resultado.update(status='quarentena', erro="extração passou do limite de memória do processo")
     except Exception as e:
-        print(f"❌ Erro ao processar {nome_arquivo}: {str(e)}")
-        return 'erro', nome_arquivo
+        resultado.update(status='erro', erro=str(e))
+    finally:
+        if spool:
+            spool.close()
+    if resultado['status'] != 'indexado':
+        descartar_spool(resultado)
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
+
+def descartar_spool(resultado):
+    if resultado.get('spool') and os.path.exists(resultado['spool']):
+        os.remove(resultado['spool'])
+    resultado.update(spool=None, docs=[], ids=[], chunks=0)
 
-def indexar_varios_pdfs_melhorado():
-    """Indexa múltiplos PDFs com processamento paralelo"""
+def ler_spool(caminho):
+    """Gera os documentos gravados por processar_pdf, um por linha"""
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            yield json.loads(linha)
+
+class EstatisticasEtapa:
+    """Contadores de vazão de uma etapa do pipeline (thread-safe)"""
+    
+    def __init__(self, nome):
+        self.nome = nome
+        self.lock = threading.Lock()
+        self.arquivos = 0
+        self.paginas = 0
+        self.chunks = 0
+        self.ocupado = 0.0
+        self.inicio = None
+        self.fim = None
+    
+    def registrar(self, arquivos=0, paginas=0, chunks=0, segundos=0.0):
+        with self.lock:
+            agora = time.perf_counter()
+            if self.inicio is None:
+                self.inicio = agora - segundos
+            self.fim = agora
+            self.arquivos += arquivos
+            self.paginas += paginas
+            self.chunks += chunks
+            self.ocupado += segundos
+    
+    def resumo(self, trabalhadores):
+        duracao = (self.fim - self.inicio) if self.inicio is not None else 0.0
+        por_segundo = lambda n: n / duracao if duracao > 0 else 0.0
+        utilizacao = self.ocupado / (duracao * trabalhadores) * 100 if duracao > 0 else 0.0
+        return (f"   {self.nome:<9} {self.arquivos:>6} arquivos | {por_segundo(self.arquivos):8.1f} arq/s | "
+                f"{por_segundo(self.paginas):8.1f} pág/s | {por_segundo(self.chunks):8.1f} chunks/s | "
+                f"{duracao:7.1f}s | utilização {utilizacao:5.1f}% de {trabalhadores}")
+
+def salvar_relatorio_falhas(falhas, caminho=FAILURES_FILE):
+    """Grava os documentos recusados pelo índice (ou remove o relatório se não houve falhas)"""
+    if not falhas:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        return
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump([{'id': id_doc, 'acao': acao, 'status': status, 'erro': mensagem}
+                   for id_doc, acao, status, mensagem in falhas], f, ensure_ascii=False, indent=1)
+
+def salvar_quarentena(quarentena, caminho=QUARANTINE_FILE):
+    """Grava os arquivos em quarentena (ou remove o registro se não há nenhum)"""
+    if quarentena:
+        salvar_manifesto(quarentena, caminho)
+    elif os.path.exists(caminho):
+        os.remove(caminho)
+
+def registrar_quarentena(quarentena, nome_arquivo, motivo, mtime, tamanho):
+    quarentena[nome_arquivo] = {'motivo': motivo, 'mtime': mtime, 'tamanho': tamanho,
+                                'data': datetime.now().isoformat(timespec='seconds')}
+
+def indexar_varios_pdfs_melhorado(processos=PROCESSOS_EXTRACAO, uploaders=THREADS_UPLOAD, incremental=False,
+                                  estrategia=None, timeout=TIMEOUT_ARQUIVO, memoria_mb=MEMORIA_MAX_MB,
+                                  reprocessar_quarentena=False):
+    """Indexa múltiplos PDFs em pipeline: extração/chunking em um pool de processos
+    (um por núcleo) e upload por um único EnviadorIndice, que junta os chunks de
+    vários arquivos em lotes grandes e mantém `uploaders` lotes em paralelo.
+    Os chunks de cada arquivo vão do processo para o enviador por um arquivo
+    temporário lido aos poucos, sem passar inteiros pela memória.
+    
+    Arquivos que passam de `timeout` segundos, do limite de `memoria_mb` por
+    processo ou que derrubam o processo de extração vão para a quarentena
+    (QUARANTINE_FILE) e são pulados até mudarem no disco (ou com
+    `reprocessar_quarentena`).
+    
+    No modo incremental só arquivos novos ou alterados (segundo o manifesto) são
+    extraídos e enviados, chunks que deixaram de existir são apagados e arquivos
+    removidos da pasta têm seus chunks excluídos do índice. Um arquivo só entra no
+    manifesto se todos os seus chunks foram aceitos, então falhas são refeitas na
+    próxima execução. Arquivos divididos com outra estratégia de chunking são
+    refeitos mesmo sem alteração.
+    Retorna True se o índice foi alterado.
+    """
     if not os.path.exists(PDF_FOLDER):
         print(f"❌ Erro: A pasta {PDF_FOLDER} não existe!")
-        return
+        return False
+
+    estrategia = estrategia or criar_estrategia(CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP)
+    assinatura = estrategia.assinatura()
+    manifesto_anterior = carregar_manifesto(MANIFEST_FILE) if incremental else {}
+    manifesto = dict(manifesto_anterior)
+    lock_manifesto = threading.Lock()
+    quarentena = carregar_manifesto(QUARANTINE_FILE)
 
-    pdfs = [nome for nome in os.listdir(PDF_FOLDER) if nome.lower().endswith('.pdf')]
+    pdfs = []
+    vistos = set()
+    inalterados = 0
+    em_quarentena = 0
+    with os.scandir(PDF_FOLDER) as entradas:
+        for entrada in entradas:
+            if not entrada.name.lower().endswith('.pdf'):
+                continue
+            vistos.add(entrada.name)
+            anterior = manifesto_anterior.get(entrada.name)
+            info = entrada.stat()
+            bloqueado = quarentena.get(entrada.name)
+            if bloqueado and not reprocessar_quarentena \
+                    and bloqueado['mtime'] == info.st_mtime and bloqueado['tamanho'] == info.st_size:
+                em_quarentena += 1
+                continue
+            if anterior and anterior.get('chunking', CHUNKING_LEGADO) == assinatura \
+                    and anterior['mtime'] == info.st_mtime and anterior['tamanho'] == info.st_size:
+                inalterados += 1
+                continue
+            pdfs.append(entrada.name)
+    
+    removidos = [nome for nome in manifesto_anterior if nome not in vistos]
+    for nome in [nome for nome in quarentena if nome not in vistos]:
+        del quarentena[nome]
+    
     total_pdfs = len(pdfs)
-    print(f"\n📚 Total de PDFs encontrados: {total_pdfs}")
+    if incremental:
+        print(f"\n📚 Incremental: {total_pdfs} arquivos novos/modificados, {inalterados} inalterados, "
+              f"{len(removidos)} removidos")
+    else:
+        print(f"\n📚 Total de PDFs encontrados: {total_pdfs}")
+    if em_quarentena:
+        print(f"🚫 {em_quarentena} arquivos em quarentena pulados (ver {QUARANTINE_FILE}; --reprocessar-quarentena)")
+    print(f"   {processos} processos de extração, até {uploaders} lotes de upload em paralelo, "
+          f"chunking {assinatura}, limite de {timeout:.0f}s e +{memoria_mb} MB por arquivo")
 
-    resultados = {'indexado': [], 'vazio': [], 'erro': []}
+    resultados = {'indexado': [], 'vazio': [], 'erro': [], 'inalterado': [], 'quarentena': []}
+    lock_resultados = threading.Lock()
+    extracao = EstatisticasEtapa("extração")
+    upload = EstatisticasEtapa("upload")
+    enviador = EnviadorIndice(criar_search_client(), em_voo=uploaders)
+    concluidos = [0]
+    alterado = [False]
     
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_nome = {executor.submit(indexar_pdf_melhorado, nome): nome for nome in pdfs}
-        for i, future in enumerate(as_completed(future_to_nome), 1):
-            status, nome_arquivo = future.result()
+    def concluir(status, nome_arquivo, detalhe=""):
+        with lock_resultados:
             resultados[status].append(nome_arquivo)
-            print(f"[{i}/{total_pdfs}] {status.upper()}: {nome_arquivo}")
+            concluidos[0] += 1
+            print(f"[{concluidos[0]}/{total_pdfs}] {status.upper()}: {nome_arquivo}{detalhe}")
+    
+    def registrar_no_manifesto(resultado, ids):
+        with lock_manifesto:
+            manifesto[resultado['arquivo']] = {
+                'hash': resultado['hash'],
+                'mtime': resultado['mtime'],
+                'tamanho': resultado['tamanho'],
+                'chunking': assinatura,
+                'chunks': ids
+            }
+    
+    def enviar(resultado):
+        # merge_or_upload: IDs de chunk são determinísticos, então reenviar um arquivo sobrescreve seus chunks
+        nome_arquivo, ids, total = resultado['arquivo'], resultado['ids'], resultado['chunks']
+        antigos = set(manifesto_anterior.get(nome_arquivo, {}).get('chunks', []))
+        obsoletos = sorted(antigos - set(ids))
+        
+        def ao_concluir(falhas):
+            # Chamado por uma thread do enviador quando todos os chunks do arquivo terminaram
+            if len(falhas) < total + len(obsoletos):
+                alterado[0] = True
+            if falhas:
+                concluir('erro', nome_arquivo, f" (upload: {len(falhas)} de {total + len(obsoletos)} "
+                                               f"documentos recusados, ex.: {falhas[0][3]})")
+                return
+            upload.registrar(1, resultado['paginas'], total)
+            registrar_no_manifesto(resultado, ids)
+            detalhe = f" ({total} chunks" + (f", {len(obsoletos)} obsoletos removidos)" if obsoletos else ")")
+            concluir(resultado['status'], nome_arquivo, detalhe)
+        
+        # Lê os chunks do spool conforme o enviador consome (bloqueia se o upload atrasar)
+        docs = ler_spool(resultado['spool']) if resultado['spool'] else resultado['docs']
+        try:
+            enviador.enviar(docs, obsoletos, ao_concluir)
+        finally:
+            descartar_spool(resultado)
+    
+    def colocar_em_quarentena(nome_arquivo, motivo, mtime, tamanho):
+        registrar_quarentena(quarentena, nome_arquivo, motivo, mtime, tamanho)
+        concluir('quarentena', nome_arquivo, f" ({motivo})")
+    
+    def excluir_removidos(falhas):
+        if falhas:
+            print(f"❌ {len(falhas)} chunks de arquivos removidos da pasta não foram excluídos do índice")
+            return
+        with lock_manifesto:
+            for nome in removidos:
+                del manifesto[nome]
+        alterado[0] = True
+        print(f"🗑️ Chunks de {len(removidos)} arquivos removidos da pasta excluídos do índice")
+    
+    def criar_pool():
+        return ProcessPoolExecutor(max_workers=processos, initializer=limitar_memoria_processo, initargs=(memoria_mb,))
+    
+    def submeter(nome):
+        anterior = manifesto_anterior.get(nome, {})
+        hash_anterior = anterior.get('hash') if anterior.get('chunking', CHUNKING_LEGADO) == assinatura else None
+        return executor.submit(processar_pdf, nome, PDF_FOLDER, hash_anterior, estrategia, pasta_spool, timeout)
+    
+    def coletar(futuro, isolado):
+        """Trata um arquivo concluído; retorna True se o processo de extração morreu"""
+        nome = pendentes.pop(futuro)
+        try:
+            resultado = futuro.result()
+        except BrokenProcessPool:
+            if isolado:
+                # Rodava sozinho: o arquivo derrubou o processo (falta de memória no SO, crash do parser)
+                info = os.stat(os.path.join(PDF_FOLDER, nome))
+                colocar_em_quarentena(nome, "o processo de extração morreu", info.st_mtime, info.st_size)
+            else:
+                suspeitos.append(nome)
+            return True
+        extracao.registrar(1, resultado['paginas'], resultado['chunks'], resultado['segundos'])
+        if resultado['status'] == 'inalterado':
+            # Só o mtime mudou (cópia, touch): atualiza o manifesto sem reenviar
+            registrar_no_manifesto(resultado, manifesto_anterior[resultado['arquivo']]['chunks'])
+            concluir('inalterado', resultado['arquivo'])
+        elif resultado['status'] == 'erro':
+            concluir('erro', resultado['arquivo'], f" ({resultado['erro']})")
+        elif resultado['status'] == 'quarentena':
+            colocar_em_quarentena(nome, resultado['erro'], resultado['mtime'], resultado['tamanho'])
+        else:
+            # Arquivos vazios também passam pelo upload para apagar chunks antigos
+            quarentena.pop(nome, None)
+            enviar(resultado)
+        return False
+    
+    pasta_spool = tempfile.mkdtemp(prefix="indexacao_")
+    executor = criar_pool()
+    pendentes = {}  # futuro -> arquivo
+    isolados = set()  # futuros de suspeitos rodando sozinhos no pool
+    fila = deque(pdfs)
+    suspeitos = deque()  # arquivos em voo quando um processo morreu
+    try:
+        while fila or suspeitos or pendentes:
+            if suspeitos:
+                # Depois de uma queda, os suspeitos rodam um de cada vez para achar o culpado
+                if not pendentes:
+                    nome = suspeitos.popleft()
+                    futuro = submeter(nome)
+                    pendentes[futuro] = nome
+                    isolados.add(futuro)
+            else:
+                # Mantém no máximo 2 arquivos por processo em voo para limitar a memória
+                while fila and len(pendentes) < 2 * processos:
+                    nome = fila.popleft()
+                    pendentes[submeter(nome)] = nome
+            
+            prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            quebrou = False
+            for futuro in prontos:
+                quebrou |= coletar(futuro, futuro in isolados)
+            if quebrou:
+                # O pool inteiro caiu: os demais futuros terminam logo com BrokenProcessPool
+                for futuro in wait(list(pendentes))[0]:
+                    coletar(futuro, futuro in isolados)
+                executor.shutdown(wait=False, cancel_futures=True)
+                print("⚠️ Um processo de extração morreu; pool recriado"
+                      + (f", {len(suspeitos)} arquivos serão refeitos um a um" if suspeitos else ""))
+                executor = criar_pool()
+                isolados.clear()
+        
+        if removidos:
+            enviador.enviar(exclusoes=[id_chunk for nome in removidos
+                                       for id_chunk in manifesto_anterior[nome]['chunks']],
+                            ao_concluir=excluir_removidos)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        relatorio = enviador.fechar()
+        upload.ocupado = relatorio['segundos_envio']
+        salvar_manifesto(manifesto, MANIFEST_FILE)
+        salvar_relatorio_falhas(relatorio['falhas'], FAILURES_FILE)
+        salvar_quarentena(quarentena, QUARANTINE_FILE)
+        shutil.rmtree(pasta_spool, ignore_errors=True)
 
     print(f"\n✅ PDFs indexados: {len(resultados['indexado'])}")
     print(f"⚠️ PDFs vazios: {len(resultados['vazio'])}")  
     print(f"❌ PDFs com erro: {len(resultados['erro'])}")
+    if resultados['quarentena'] or em_quarentena:
+        print(f"🚫 PDFs em quarentena: {len(resultados['quarentena'])} novos, {em_quarentena} pulados "
+              f"(detalhes em {QUARANTINE_FILE})")
+    if incremental:
+        print(f"⏭️ PDFs inalterados: {inalterados + len(resultados['inalterado'])}")
+    print(f"\n📦 Upload: {relatorio['enviados']} enviados, {relatorio['excluidos']} excluídos em "
+          f"{relatorio['lotes']} lotes ({relatorio['bytes'] / 1024 / 1024:.1f} MB, "
+          f"{relatorio['retentativas']} retentativas)")
+    if relatorio['falhas']:
+        print(f"❌ {len(relatorio['falhas'])} documentos recusados pelo índice (detalhes em {FAILURES_FILE}):")
+        for id_doc, acao, status, mensagem in relatorio['falhas'][:10]:
+            print(f"   - {id_doc} ({acao}, status {status}): {mensagem}")
+    print("\n⏱️ Vazão por etapa:")
+    print(extracao.resumo(processos))
+    print(upload.resumo(uploaders))
+    return alterado[0]
+
+def registrar_nova_geracao_indice():
+    """Grava uma nova geração do índice (invalida o cache de buscas da API)"""
+    geracao = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    temporario = INDEX_GENERATION_FILE + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write(geracao)
+    os.replace(temporario, INDEX_GENERATION_FILE)
+    print(f"♻️ Nova geração do índice registrada: {geracao}")
 
 def validar_configuracao():
     """Valida variáveis de ambiente necessárias"""
@@ -182,9 +590,39 @@ def validar_configuracao():
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa os PDFs de kbs_confluence no Azure Search")
+    parser.add_argument("--processos", type=int, default=PROCESSOS_EXTRACAO, help="processos de extração/chunking")
+    parser.add_argument("--uploaders", type=int, default=THREADS_UPLOAD, help="lotes de upload enviados em paralelo")
+    parser.add_argument("--incremental", action="store_true",
+                        help="mantém o índice e só envia arquivos novos/alterados (usa o manifesto)")
+    parser.add_argument("--chunking", choices=list(ESTRATEGIAS), default=CHUNK_STRATEGY, help="estratégia de chunking")
+    parser.add_argument("--chunk-tamanho", type=int, default=CHUNK_SIZE,
+                        help="tamanho do chunk (caracteres; tokens na estratégia 'tokens')")
+    parser.add_argument("--chunk-sobreposicao", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--timeout-arquivo", type=float, default=TIMEOUT_ARQUIVO,
+                        help="segundos máximos de extração por PDF antes da quarentena (0 desativa)")
+    parser.add_argument("--memoria-max-mb", type=int, default=MEMORIA_MAX_MB,
+                        help="memória extra por processo de extração antes da quarentena (0 desativa)")
+    parser.add_argument("--reprocessar-quarentena", action="store_true",
+                        help="tenta de novo os PDFs em quarentena mesmo sem terem mudado")
+    args = parser.parse_args()
+    protecao = {'timeout': args.timeout_arquivo, 'memoria_mb': args.memoria_max_mb,
+                'reprocessar_quarentena': args.reprocessar_quarentena}
+    estrategia = criar_estrategia(args.chunking, args.chunk_tamanho, args.chunk_sobreposicao)
+    
     if not validar_configuracao():
         exit(1)
     
+    if args.incremental:
+        print("🔄 Indexação incremental (manifesto: {})".format(MANIFEST_FILE))
+        criar_indice_melhorado(recriar=False)
+        if indexar_varios_pdfs_melhorado(args.processos, args.uploaders, incremental=True, estrategia=estrategia,
+                                         **protecao):
+            registrar_nova_geracao_indice()
+        else:
+            print("✅ Nenhuma alteração no índice")
+        exit(0)
+    
     print("🚀 Iniciando criação de índice MELHORADO com metadata rica...")
     print("⚠️ ATENÇÃO: Isso irá RECRIAR completamente o índice!")
     
@@ -194,6 +632,7 @@ if __name__ == "__main__":
         exit(0)
     
     criar_indice_melhorado()
-    indexar_varios_pdfs_melhorado()
+    indexar_varios_pdfs_melhorado(args.processos, args.uploaders, estrategia=estrategia, **protecao)
+    registrar_nova_geracao_indice()
     print("\n✅ Índice melhorado criado com sucesso!")
-    print("🎯 Agora o sistema RAG terá metadata rica (página, chunks, etc.)") 
\ No newline at end of file
+    print("🎯 Agora o sistema RAG terá metadata rica (página, chunks, etc.)")
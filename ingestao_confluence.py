@@ -0,0 +1,262 @@
+"""Ingestão direta Confluence -> índice, sem exportar PDF.
+
+Busca o corpo já renderizado das páginas (body.view) pela API REST, junto com a
+listagem, converte o HTML em texto num único passe (HTMLParser, sem montar
+DOM) e envia os chunks pelo mesmo caminho da indexação de PDFs (gerar_chunks +
+EnviadorIndice). Evita o pdfpageexport.action (lento no servidor) e o PyPDF2,
+e preserva parágrafos, títulos, listas e tabelas.
+
+Incremental como o download: um manifesto guarda versão e IDs dos chunks de
+cada página, só páginas com versão nova são reenviadas e chunks obsoletos são
+apagados.
+
+Uso:
+    python ingestao_confluence.py [--completo] [--uploaders 4] [--chunking frases]
+"""
+import os
+import re
+import time
+import argparse
+import threading
+from html.parser import HTMLParser
+from datetime import datetime, timedelta, timezone
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from download_confluence import (
+    MARGEM_SINCRONIZACAO_MIN, iterar_paginas_confluence, listagem_completa, nome_arquivo_kb, versao_pagina,
+    carregar_manifesto, salvar_manifesto, validar_configuracao as validar_configuracao_confluence
+)
+from indexar_documentos import (
+    CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP, THREADS_UPLOAD, criar_search_client, criar_indice_melhorado,
+    gerar_chunks, registrar_nova_geracao_indice, validar_configuracao as validar_configuracao_indice
+)
+from enviador_indice import EnviadorIndice
+from estrategias_chunking import ESTRATEGIAS, criar_estrategia
+
+CONFLUENCE_INDEX_MANIFEST = os.getenv("CONFLUENCE_INDEX_MANIFEST", "confluence_indice_manifesto.json")
+LIMITE_LISTAGEM_CORPO = 25  # o Confluence limita o tamanho do lote quando o corpo é expandido
+
+TAGS_BLOCO = {'p', 'div', 'section', 'article', 'blockquote', 'pre', 'table', 'ul', 'ol', 'dl',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr'}
+TAGS_LINHA = {'br', 'li', 'tr', 'dt', 'dd'}
+TAGS_CELULA = {'td', 'th'}
+TAGS_IGNORADAS = {'script', 'style', 'noscript', 'template'}
+REGEX_ESPACOS = re.compile(r'[ \t\r\f\v\n]+')
+REGEX_QUEBRAS = re.compile(r'[ \t]*\n[ \t]*')
+REGEX_PARAGRAFOS_VAZIOS = re.compile(r'\n{3,}')
+
+class ConversorHTML(HTMLParser):
+    """HTML -> texto em um passe: blocos viram parágrafos (linha em branco), itens
+    de lista e linhas de tabela viram linhas, células são separadas por " | "."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.partes = []
+        self.ignorando = 0
+        self.em_pre = 0
+        self.primeira_celula = True
+
+    def quebra(self, separador):
+        if self.partes and not self.partes[-1].endswith('\n'):
+            self.partes.append(separador)
+        elif self.partes and separador == '\n\n' and not self.partes[-1].endswith('\n\n'):
+            self.partes.append('\n')
+
+    def handle_starttag(self, tag, attrs):
+        if tag in TAGS_IGNORADAS:
+            self.ignorando += 1
+        elif tag in TAGS_BLOCO:
+            self.quebra('\n\n')
+            if tag == 'pre':
+                self.em_pre += 1
+        elif tag in TAGS_LINHA:
+            self.quebra('\n')
+            if tag == 'li':
+                self.partes.append('- ')
+            elif tag == 'tr':
+                self.primeira_celula = True
+        elif tag in TAGS_CELULA:
+            if not self.primeira_celula:
+                self.partes.append(' | ')
+            self.primeira_celula = False
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in TAGS_IGNORADAS:
+            self.ignorando = max(0, self.ignorando - 1)
+        elif tag in TAGS_BLOCO:
+            if tag == 'pre':
+                self.em_pre = max(0, self.em_pre - 1)
+            self.quebra('\n\n')
+        elif tag in TAGS_LINHA:
+            self.quebra('\n')
+
+    def handle_data(self, data):
+        if self.ignorando:
+            return
+        if not self.em_pre:
+            data = REGEX_ESPACOS.sub(' ', data)
+            if data == ' ' and (not self.partes or self.partes[-1].endswith((' ', '\n'))):
+                return
+        self.partes.append(data)
+
+    def texto(self):
+        texto = REGEX_QUEBRAS.sub('\n', ''.join(self.partes))
+        return REGEX_PARAGRAFOS_VAZIOS.sub('\n\n', texto).strip()
+
+def html_para_texto(html, tamanho_pedaco=65536):
+    """Converte HTML (string ou iterável de pedaços) em texto, alimentando o parser aos poucos"""
+    conversor = ConversorHTML()
+    pedacos = html
+    if isinstance(html, str):
+        pedacos = (html[i:i + tamanho_pedaco] for i in range(0, len(html), tamanho_pedaco))
+    for pedaco in pedacos:
+        conversor.feed(pedaco)
+    conversor.close()
+    return conversor.texto()
+
+def nome_documento(page):
+    """Nome do documento no índice (o do PDF equivalente, sem a extensão)"""
+    return os.path.splitext(nome_arquivo_kb(page['id'], page['title']))[0]
+
+def documentos_pagina(page, estrategia):
+    """Chunks de uma página listada com body.view"""
+    html = ((page.get('body') or {}).get('view') or {}).get('value', '')
+    texto = html_para_texto(html)
+    if not texto:
+        return [], 0
+    return gerar_chunks([{'texto': texto, 'pagina': 1}], nome_documento(page), estrategia, "Confluence"), len(texto)
+
+def ingerir_confluence(completo=False, uploaders=THREADS_UPLOAD, estrategia=None, caminho=CONFLUENCE_INDEX_MANIFEST,
+                       search_client=None):
+    """Lista as páginas com o corpo e envia ao índice só as novas/alteradas.
+
+    Sem manifesto, com `completo` ou com outra estratégia de chunking, lista o
+    espaço inteiro (e apaga os chunks de páginas que não existem mais). Uma
+    página só entra no manifesto se todos os seus chunks foram aceitos, e a
+    data da sincronização só avança se nada falhou.
+    Retorna True se o índice foi alterado.
+    """
+    estrategia = estrategia or criar_estrategia(CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP)
+    assinatura = estrategia.assinatura()
+    manifesto = carregar_manifesto(caminho)
+    registros = manifesto['paginas']
+    ultima = manifesto.get('ultima_sincronizacao')
+    refazer = manifesto.get('chunking') != assinatura
+    completo = completo or refazer or not ultima
+    inicio = datetime.now(timezone.utc)
+    desde = None if completo else datetime.fromisoformat(ultima) - timedelta(minutes=MARGEM_SINCRONIZACAO_MIN)
+
+    print(f"🔄 Ingestão direta do Confluence ({'listagem completa' if completo else f'alteradas desde {desde:%Y-%m-%d %H:%M} UTC'}, "
+          f"chunking {assinatura})")
+
+    enviador = EnviadorIndice(search_client or criar_search_client(), em_voo=uploaders)
+    lock_registros = threading.Lock()
+    listadas = set()
+    resumo = {}
+    contagem = {'enviadas': 0, 'inalteradas': 0, 'vazias': 0, 'erros': 0, 'chunks': 0, 'caracteres': 0}
+    segundos_conversao = 0.0
+    alterado = [False]
+    listagem_ok = True
+
+    def enviar_pagina(page, docs):
+        ids = [doc['id'] for doc in docs]
+        numero, modificado = versao_pagina(page)
+        obsoletos = sorted(set((registros.get(page['id']) or {}).get('chunks', [])) - set(ids))
+
+        def ao_concluir(falhas):
+            if len(falhas) < len(docs) + len(obsoletos):
+                alterado[0] = True
+            with lock_registros:
+                if falhas:
+                    contagem['erros'] += 1
+                    print(f"❌ {page['title']}: {len(falhas)} documentos recusados pelo índice")
+                    return
+                registros[page['id']] = {'versao': numero, 'modificado': modificado, 'titulo': page['title'],
+                                         'chunks': ids}
+
+        enviador.enviar(docs, obsoletos, ao_concluir)
+
+    try:
+        for lote in iterar_paginas_confluence(desde, expand='body.view,version', limit=LIMITE_LISTAGEM_CORPO,
+                                              resumo=resumo):
+            for page in lote:
+                if page['id'] in listadas:
+                    continue
+                listadas.add(page['id'])
+                registro = registros.get(page['id'])
+                if registro and not refazer and registro['versao'] == versao_pagina(page)[0]:
+                    contagem['inalteradas'] += 1
+                    continue
+
+                inicio_conversao = time.perf_counter()
+                docs, caracteres = documentos_pagina(page, estrategia)
+                segundos_conversao += time.perf_counter() - inicio_conversao
+                contagem['vazias' if not docs else 'enviadas'] += 1
+                contagem['chunks'] += len(docs)
+                contagem['caracteres'] += caracteres
+                enviar_pagina(page, docs)  # bloqueia se o upload atrasar
+            print(f"📥 {len(listadas)} páginas listadas, {contagem['enviadas']} enviadas...")
+
+        if completo and not listagem_completa(listadas, resumo):
+            print(f"⚠️ A listagem trouxe {len(listadas)} de {resumo['total']} páginas; "
+                  f"nenhum chunk de página removida será excluído nesta execução")
+        elif completo:
+            with lock_registros:  # os retornos do enviador ainda podem estar gravando registros
+                removidas = [page_id for page_id in registros if page_id not in listadas]
+                exclusoes = [id_chunk for page_id in removidas for id_chunk in registros[page_id]['chunks']]
+            if removidas:
+                def remover(falhas):
+                    if falhas:
+                        print(f"❌ {len(falhas)} chunks de páginas removidas não foram excluídos do índice")
+                        return
+                    with lock_registros:
+                        for page_id in removidas:
+                            registros.pop(page_id, None)
+                    alterado[0] = True
+                    print(f"🗑️ Chunks de {len(removidas)} páginas removidas do Confluence excluídos do índice")
+                enviador.enviar(exclusoes=exclusoes, ao_concluir=remover)
+    except requests.exceptions.RequestException as e:
+        listagem_ok = False
+        print(f"❌ Erro ao listar páginas, a próxima execução tentará de novo: {str(e)}")
+    finally:
+        relatorio = enviador.fechar()
+        if listagem_ok and not relatorio['falhas'] and not contagem['erros']:
+            manifesto['ultima_sincronizacao'] = inicio.isoformat()
+            manifesto['chunking'] = assinatura
+        salvar_manifesto(manifesto, caminho)
+
+    duracao = (datetime.now(timezone.utc) - inicio).total_seconds()
+    print(f"\n✅ Páginas enviadas: {contagem['enviadas']} ({contagem['chunks']} chunks)")
+    print(f"⏭️ Páginas inalteradas: {contagem['inalteradas']}")
+    print(f"⚠️ Páginas sem texto: {contagem['vazias']}")
+    print(f"❌ Páginas com erro no upload: {contagem['erros']}")
+    print(f"⏱️ {duracao:.1f}s no total, conversão HTML->texto+chunking {segundos_conversao:.2f}s "
+          f"({contagem['caracteres'] / max(segundos_conversao, 1e-9) / 1024 / 1024:.1f} MB/s); "
+          f"upload {relatorio['lotes']} lotes, {relatorio['retentativas']} retentativas")
+    return alterado[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--completo", action="store_true",
+                        help="lista o espaço inteiro e exclui do índice páginas removidas")
+    parser.add_argument("--uploaders", type=int, default=THREADS_UPLOAD, help="lotes de upload enviados em paralelo")
+    parser.add_argument("--chunking", choices=list(ESTRATEGIAS), default=CHUNK_STRATEGY, help="estratégia de chunking")
+    parser.add_argument("--chunk-tamanho", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-sobreposicao", type=int, default=CHUNK_OVERLAP)
+    args = parser.parse_args()
+
+    if not validar_configuracao_confluence() or not validar_configuracao_indice():
+        exit(1)
+
+    criar_indice_melhorado(recriar=False)
+    estrategia = criar_estrategia(args.chunking, args.chunk_tamanho, args.chunk_sobreposicao)
+    if ingerir_confluence(args.completo, args.uploaders, estrategia):
+        registrar_nova_geracao_indice()
+    else:
+        print("✅ Nenhuma alteração no índice")
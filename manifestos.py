@@ -0,0 +1,18 @@
+import os
+import json
+
+def carregar_manifesto(caminho, vazio=None):
+    """Lê um manifesto JSON; `vazio` (ou {}) se o arquivo ainda não existe"""
+    if not os.path.exists(caminho):
+        return vazio if vazio is not None else {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def salvar_manifesto(manifesto, caminho):
+    """Grava o manifesto de forma atômica (arquivo temporário + os.replace)"""
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
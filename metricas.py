@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+LOG_LEVEL = os.getenv("RAG_LOG_LEVEL", "INFO")
+
+# Etapas rápidas (cache, formatação) ficam nos primeiros buckets; busca e LLM nos últimos
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LATENCIA_ETAPA = Histogram(
+    "rag_stage_duration_seconds", "Latência de cada etapa do pipeline RAG",
+    ["stage"], buckets=BUCKETS_LATENCIA
+)
+LATENCIA_REQUISICAO = Histogram(
+    "rag_request_duration_seconds", "Latência total de uma pergunta, por origem da resposta",
+    ["source"], buckets=BUCKETS_LATENCIA
+)
+CONSULTAS_CACHE = Counter(
+    "rag_answer_cache_lookups_total", "Consultas ao cache de respostas", ["result"]
+)
+CONSULTAS_CACHE_BUSCA = Counter(
+    "rag_retrieval_cache_lookups_total", "Consultas ao cache de buscas", ["result"]
+)
+ERROS = Counter("rag_errors_total", "Erros por etapa", ["stage"])
+ENTRADAS_CACHE = Gauge("rag_answer_cache_entries", "Entradas no cache de respostas")
+BYTES_CACHE = Gauge("rag_answer_cache_bytes", "Bytes (pergunta + resposta) no cache de respostas")
+
+@contextmanager
+def medir(etapa):
+    """Mede a duração do bloco no histograma da etapa (funciona também com await dentro)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        LATENCIA_ETAPA.labels(etapa).observe(time.perf_counter() - inicio)
+
+def configurar_logging(nome="rag", saida=None, nivel=LOG_LEVEL):
+    """Logger cujas mensagens são formatadas/escritas por uma thread dedicada.
+
+    O QueueHandler só enfileira o registro, então o caminho da requisição não
+    bloqueia em I/O de console (ou do handler passado em `saida`).
+    """
+    logger = logging.getLogger(nome)
+    if any(isinstance(h, QueueHandler) for h in logger.handlers):
+        return logger
+
+    fila = queue.SimpleQueue()
+    saida = saida or logging.StreamHandler(sys.stdout)
+    saida.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(fila, saida, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(fila))
+    logger.setLevel(nivel)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,102 @@
+import heapq
+from collections import OrderedDict
+
+def tamanho_entrada(entry):
+    """Tamanho aproximado em bytes de uma entrada (pergunta + resposta)"""
+    return len(entry.get('resposta', '').encode('utf-8')) + len(entry.get('pergunta_original', '').encode('utf-8'))
+
+class PoliticaLRU:
+    """Remove a entrada usada há mais tempo (OrderedDict, O(1))"""
+
+    nome = "lru"
+
+    def __init__(self, max_entradas, max_bytes=None):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ordem = OrderedDict()
+        self.tamanhos = {}
+        self.total_bytes = 0
+
+    def registrar(self, chave, entry):
+        self.remover(chave)
+        self.ordem[chave] = None
+        tamanho = tamanho_entrada(entry)
+        self.tamanhos[chave] = tamanho
+        self.total_bytes += tamanho
+
+    def acessar(self, chave, entry):
+        if chave in self.ordem:
+            self.ordem.move_to_end(chave)
+
+    def remover(self, chave):
+        if chave in self.ordem:
+            del self.ordem[chave]
+            self.total_bytes -= self.tamanhos.pop(chave)
+
+    def precisa_remover(self, tamanho_novo):
+        if len(self.ordem) >= self.max_entradas:
+            return True
+        return self.max_bytes is not None and self.total_bytes + tamanho_novo > self.max_bytes
+
+    def escolher_vitima(self):
+        return next(iter(self.ordem))
+
+class PoliticaLFU(PoliticaLRU):
+    """Remove a entrada com menor uso_count (empate: a usada há mais tempo).
+
+    Heap com invalidação preguiçosa: cada acesso empilha (uso, sequência, chave)
+    e só o registro mais recente de cada chave é considerado válido.
+    """
+
+    nome = "lfu"
+
+    def __init__(self, max_entradas, max_bytes=None):
+        super().__init__(max_entradas, max_bytes)
+        self.heap = []
+        self.atual = {}
+        self.sequencia = 0
+
+    def _empilhar(self, chave, entry):
+        self.sequencia += 1
+        registro = (entry.get('uso_count', 1), self.sequencia, chave)
+        self.atual[chave] = registro
+        heapq.heappush(self.heap, registro)
+
+        if len(self.heap) > 2 * len(self.atual) + 64:
+            self.heap = list(self.atual.values())
+            heapq.heapify(self.heap)
+
+    def registrar(self, chave, entry):
+        super().registrar(chave, entry)
+        self._empilhar(chave, entry)
+
+    def acessar(self, chave, entry):
+        super().acessar(chave, entry)
+        if chave in self.atual:
+            self._empilhar(chave, entry)
+
+    def remover(self, chave):
+        super().remover(chave)
+        self.atual.pop(chave, None)
+
+    def escolher_vitima(self):
+        while self.atual.get(self.heap[0][2]) != self.heap[0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][2]
+
+class PoliticaTamanho(PoliticaLRU):
+    """LRU limitado pelo total de bytes das respostas (além do número de entradas)"""
+
+    nome = "tamanho"
+
+POLITICAS = {
+    PoliticaLRU.nome: PoliticaLRU,
+    PoliticaLFU.nome: PoliticaLFU,
+    PoliticaTamanho.nome: PoliticaTamanho,
+}
+
+def criar_politica(nome, max_entradas, max_bytes):
+    """Cria a política de remoção pelo nome (lru, lfu, tamanho)"""
+    if nome not in POLITICAS:
+        raise ValueError(f"Política de remoção desconhecida: {nome} (use: {', '.join(POLITICAS)})")
+    return POLITICAS[nome](max_entradas, max_bytes if nome == PoliticaTamanho.nome else None)
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Os módulos criam arquivos (cache, logs) no diretório atual ao serem importados
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="rag_testes_"))
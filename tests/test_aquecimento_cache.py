@@ -0,0 +1,26 @@
+import os
+import json
+import time
+
+import aquecimento_cache
+from aquecimento_cache import caminho_log_processo, registrar_pergunta_log, ler_log_perguntas
+
+def test_cada_processo_escreve_o_seu_log_e_a_leitura_junta_todos(tmp_path):
+    caminho = str(tmp_path / "log_perguntas.jsonl")
+    outro_worker = caminho_log_processo(caminho, pid=999999)
+    with open(outro_worker + ".1", "w", encoding="utf-8") as f:  # já rotacionado pelo outro worker
+        f.write(json.dumps({'timestamp': "2999-01-01T00:00:00", 'pergunta': "como resetar a senha"}) + "\n")
+
+    registrar_pergunta_log("como resetar a senha", caminho)
+    registrar_pergunta_log("como acessar a vpn", caminho)
+    proprio = caminho_log_processo(caminho)
+    for _ in range(100):
+        if os.path.exists(proprio) and len(open(proprio, encoding="utf-8").readlines()) == 2:
+            break
+        time.sleep(0.02)
+
+    assert proprio.endswith(f"log_perguntas.{os.getpid()}.jsonl")
+    assert aquecimento_cache.arquivos_log_perguntas(caminho) == sorted([outro_worker + ".1", proprio])
+    contagem, perguntas = ler_log_perguntas(caminho, dias=7)
+    assert sorted(contagem.values()) == [1, 2]
+    assert set(perguntas.values()) == {"como resetar a senha", "como acessar a vpn"}
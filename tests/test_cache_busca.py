@@ -0,0 +1,28 @@
+import engine_rag
+from engine_rag import CacheBusca
+
+def test_reformulacao_reaproveita_a_busca():
+    cache = CacheBusca(ttl_segundos=60, max_entradas=10)
+    documentos = [{"content": "Para resetar a senha da VPN..."}]
+    cache.guardar("Como faço para resetar a senha da VPN?", documentos)
+
+    assert cache.obter("resetar senha VPN") is documentos
+    assert cache.obter("Senha da VPN: como resetar") is documentos
+    assert cache.obter("como resetar a senha do email") is None
+
+def test_geracao_do_indice_so_e_relida_quando_o_arquivo_muda(tmp_path, monkeypatch):
+    arquivo = tmp_path / "indice_geracao.txt"
+    arquivo.write_text("g1")
+    monkeypatch.setattr(engine_rag, "INDEX_GENERATION_FILE", str(arquivo))
+    monkeypatch.setattr(engine_rag, "_geracao_indice", {'valor': None, 'mtime': None, 'verificada_em': None})
+    leituras = []
+    ler = engine_rag._ler_geracao_indice
+    monkeypatch.setattr(engine_rag, "_ler_geracao_indice", lambda: leituras.append(1) or ler())
+
+    assert [engine_rag.geracao_indice_atual() for _ in range(50)] == ["g1"] * 50
+    assert len(leituras) == 1
+
+    monkeypatch.setattr(engine_rag, "INTERVALO_VERIFICACAO_GERACAO", 0)
+    arquivo.write_text("g2")
+    engine_rag.os.utime(arquivo, ns=(1, 1))
+    assert engine_rag.geracao_indice_atual() == "g2"
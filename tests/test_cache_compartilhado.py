@@ -0,0 +1,42 @@
+import time
+from datetime import datetime, timedelta
+
+import engine_rag
+from engine_rag import CacheAvancado
+from armazenamento_cache import ArmazenamentoSQLite
+from politicas_cache import criar_politica
+
+def criar_workers(tmp_path):
+    caminho = str(tmp_path / "compartilhado.db")
+    return [CacheAvancado(armazenamento=ArmazenamentoSQLite(caminho), politica=criar_politica("lru", 100, 0),
+                          compartilhado=True) for _ in range(2)]
+
+def test_hit_de_outro_worker_nao_rele_nem_reindexa(tmp_path, monkeypatch):
+    a, b = criar_workers(tmp_path)
+    a.adicionar_ao_cache("como resetar a senha do vpn", "resposta vpn")
+    assert b.encontrar_pergunta_similar("como resetar a senha do vpn") == "resposta vpn"
+
+    reindexadas = []
+    monkeypatch.setattr(b, "_registrar", reindexadas.append)
+    assert a.encontrar_pergunta_similar("como resetar a senha do vpn") == "resposta vpn"
+    b.sincronizar()
+
+    chave = next(iter(b.cache))
+    assert reindexadas == []
+    assert b.cache[chave]['uso_count'] == 3
+    assert b.cache[chave]['timestamp'] == a.cache[chave]['timestamp']
+
+def test_expiracao_reconfere_timestamp_gravado(tmp_path):
+    a, b = criar_workers(tmp_path)
+    a.adicionar_ao_cache("como resetar a senha do vpn", "resposta vpn")
+    b.sincronizar()
+    chave = next(iter(b.cache))
+
+    # b perdeu o último uso: localmente a entrada já venceu, no banco não
+    b.cache[chave]['timestamp'] = (datetime.now() - timedelta(hours=engine_rag.CACHE_EXPIRY_HOURS + 1)).isoformat()
+    b._agendar_expiracao(chave)
+    b.limpar_cache_expirado()
+
+    assert chave in b.cache
+    assert b.expira_em[chave] > time.time()
+    assert a.encontrar_pergunta_similar("como resetar a senha do vpn") == "resposta vpn"
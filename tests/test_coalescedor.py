@@ -0,0 +1,43 @@
+import asyncio
+
+from engine_rag import CacheAvancado, CoalescedorRequisicoes
+from armazenamento_cache import criar_armazenamento
+from politicas_cache import criar_politica
+
+def criar_coalescedor():
+    cache = CacheAvancado(armazenamento=criar_armazenamento("memoria", None), politica=criar_politica("lru", 100, 0),
+                          compartilhado=False)
+    return CoalescedorRequisicoes(cache)
+
+def test_cancelar_seguidor_nao_afeta_os_outros_nem_o_lider():
+    async def cenario():
+        coalescedor = criar_coalescedor()
+        lider = coalescedor.entrar("como resetar senha do vpn")
+        seguidores = [coalescedor.entrar("como resetar senha do vpn") for _ in range(2)]
+        assert lider.lider and not any(s.lider for s in seguidores)
+
+        cancelado = asyncio.create_task(seguidores[0].aguardar_async())
+        esperando = asyncio.create_task(seguidores[1].aguardar_async())
+        await asyncio.sleep(0)
+        cancelado.cancel()
+        await asyncio.sleep(0)
+
+        assert not lider.futuro.cancelled()
+        coalescedor.concluir(lider, "resposta")  # não pode levantar InvalidStateError
+        assert await esperando == "resposta"
+        assert cancelado.cancelled()
+
+    asyncio.run(cenario())
+
+def test_cancelar_lider_libera_seguidores():
+    async def cenario():
+        coalescedor = criar_coalescedor()
+        lider = coalescedor.entrar("erro de acesso ao sharepoint")
+        seguidor = coalescedor.entrar("erro de acesso ao sharepoint")
+        esperando = asyncio.create_task(seguidor.aguardar_async())
+        await asyncio.sleep(0)
+        coalescedor.abandonar(lider, asyncio.CancelledError())
+        assert await esperando is None  # responde sozinho em vez de ser cancelado
+        coalescedor.concluir(lider, "tarde demais")  # futuro já resolvido: ignorado
+
+    asyncio.run(cenario())
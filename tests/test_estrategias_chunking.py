@@ -0,0 +1,29 @@
+import pytest
+
+from estrategias_chunking import criar_estrategia
+from tokenizacao import dividir_frases, spans_frases
+
+
+def test_numero_de_lista_nao_encerra_frase():
+    assert dividir_frases("Passo 1. Abra o menu. Depois feche! Pronto?") == [
+        "Passo 1. Abra o menu.", "Depois feche!", "Pronto?"]
+
+
+def test_segmentar_mantem_item_numerado_na_frase():
+    estrategia = criar_estrategia("frases")
+    frases = [texto for texto, _, _, _ in estrategia.segmentar([{'texto': "Passo 1. Abra o menu. Passo 2. Salve.", 'pagina': 1}])]
+    assert frases == ["Passo 1. Abra o menu.", "Passo 2. Salve."]
+
+
+def test_spans_cortam_frases_e_linhas_com_a_mesma_regra():
+    texto = "Passo 1. Abra o menu. Depois salve\n- item sem ponto\n\nFim."
+    assert [texto[inicio:fim] for inicio, fim in spans_frases(texto)] == [
+        "Passo 1. Abra o menu.", "Depois salve", "- item sem ponto", "Fim."]
+
+
+@pytest.mark.parametrize("nome", ["fixo", "frases", "tokens"])
+def test_sobreposicao_maior_ou_igual_ao_tamanho_e_rejeitada(nome):
+    with pytest.raises(ValueError, match="sobreposição"):
+        criar_estrategia(nome, tamanho=100, sobreposicao=100)
+    with pytest.raises(ValueError, match="sobreposição"):
+        criar_estrategia(nome, tamanho=100, sobreposicao=-1)
@@ -0,0 +1,42 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from engine_rag import IndiceVetorialIncremental
+
+PERGUNTAS = [
+    "como resetar senha do vpn",
+    "como configurar impressora no windows",
+    "erro de acesso ao sharepoint",
+    "como solicitar acesso ao sistema sap",
+    "vpn nao conecta no home office",
+]
+
+CONSULTAS = [
+    "como resetar senha do vpn",
+    "como resetar senha do vpn urgente hoje",
+    "preciso urgente hoje resetar senha do vpn como faço por favor",
+    "impressora windows configurar",
+    "pergunta totalmente nova sem termos conhecidos",
+]
+
+def test_similaridade_igual_ao_tfidf_vectorizer():
+    indice = IndiceVetorialIncremental()
+    for i, pergunta in enumerate(PERGUNTAS):
+        indice.adicionar(f"chave{i}", pergunta)
+    vetorizador = TfidfVectorizer(stop_words='english')
+    matriz = vetorizador.fit_transform(PERGUNTAS)
+
+    for consulta in CONSULTAS:
+        esperadas = cosine_similarity(vetorizador.transform([consulta]), matriz)[0]
+        chave, similaridade = indice.mais_similar(consulta)
+        assert abs(similaridade - esperadas.max()) < 1e-5, consulta
+        if esperadas.max() > 0:
+            assert chave == f"chave{int(np.argmax(esperadas))}"
+
+        lote = indice.mais_similares_lote(indice.matriz_consultas([consulta]))[0]
+        assert abs(lote[1] - esperadas.max()) < 1e-5
+
+        indices, pesos = indice.vetor_normalizado(consulta)
+        esperado = vetorizador.transform([consulta])
+        assert abs(float(np.dot(pesos, pesos)) - float(esperado.multiply(esperado).sum())) < 1e-5
@@ -0,0 +1,27 @@
+import asyncio
+
+import engine_rag
+
+def test_fechar_lote_cancela_perguntas_pendentes(monkeypatch):
+    chamadas = []
+
+    async def perguntar(pergunta):
+        chamadas.append(pergunta)
+        await asyncio.sleep(0.01)
+        return f"resposta {pergunta}"
+
+    monkeypatch.setattr(engine_rag, "perguntar_ao_modelo_async", perguntar)
+    monkeypatch.setattr(engine_rag.cache_manager, "encontrar_em_lote", lambda perguntas: [None] * len(perguntas))
+    perguntas = [f"falha{n} no servico{n}" for n in range(100)]
+
+    async def cenario():
+        lote = engine_rag.perguntar_em_lote(perguntas, concorrencia=4)
+        await lote.__anext__()
+        await lote.aclose()
+        feitas = len(chamadas)
+        await asyncio.sleep(0.2)
+        return feitas
+
+    feitas = asyncio.run(cenario())
+    assert feitas < len(perguntas)
+    assert len(chamadas) == feitas
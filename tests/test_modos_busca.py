@@ -0,0 +1,52 @@
+from azure.core.exceptions import HttpResponseError
+
+import engine_rag
+
+class ClienteIndiceAntigo:
+    """Índice criado antes do campo page_end: selecioná-lo devolve HTTP 400"""
+
+    def __init__(self):
+        self.campos_pedidos = []
+
+    def search(self, search_text, top, select=None, **parametros):
+        self.campos_pedidos.append(select)
+        if select and "page_end" in select:
+            erro = HttpResponseError(message="Invalid expression: Could not find a property named 'page_end'")
+            erro.status_code = 400
+            raise erro
+        return [{"content": "texto", "page_number": 3, "chunk_id": "c1", "@search.score": 2.0}]
+
+def test_indice_sem_page_end_mantem_modo_ordenado(monkeypatch):
+    cliente = ClienteIndiceAntigo()
+    monkeypatch.setattr(engine_rag, "get_search_client", lambda: cliente)
+    monkeypatch.setattr(engine_rag, "modo_busca_detectado", None)
+
+    resultados = engine_rag.executar_busca("senha do vpn")
+
+    assert engine_rag.modo_busca_detectado == "ordenada_legada"
+    assert resultados[0]["chunk_id"] == "c1"
+    assert "chunk_id" in cliente.campos_pedidos[-1]
+
+def test_modo_degradado_volta_ao_mais_rico_apos_reindexacao(tmp_path, monkeypatch):
+    cliente = ClienteIndiceAntigo()
+    arquivo = tmp_path / "indice_geracao.txt"
+    arquivo.write_text("antiga")
+    monkeypatch.setattr(engine_rag, "get_search_client", lambda: cliente)
+    monkeypatch.setattr(engine_rag, "modo_busca_detectado", None)
+    monkeypatch.setattr(engine_rag, "INDEX_GENERATION_FILE", str(arquivo))
+    monkeypatch.setattr(engine_rag, "INTERVALO_VERIFICACAO_GERACAO", 0)
+    monkeypatch.setattr(engine_rag, "_geracao_indice", {'valor': None, 'mtime': None, 'verificada_em': None})
+    monkeypatch.setattr(engine_rag, "_deteccao_busca", {'geracao': None, 'instante': 0.0})
+
+    engine_rag.executar_busca("senha do vpn")
+    assert engine_rag.modo_busca_detectado == "ordenada_legada"
+    pedidos = len(cliente.campos_pedidos)
+    engine_rag.executar_busca("senha do vpn")
+    assert len(cliente.campos_pedidos) == pedidos + 1  # sem nova sondagem
+
+    # Índice recriado com page_end
+    monkeypatch.setattr(cliente, "search", lambda search_text, top, select=None, **parametros: [{"content": "x"}])
+    arquivo.write_text("nova")
+    engine_rag.os.utime(arquivo, ns=(1, 1))
+    engine_rag.executar_busca("senha do vpn")
+    assert engine_rag.modo_busca_detectado == "ordenada"
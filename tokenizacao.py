@@ -0,0 +1,69 @@
+import os
+import re
+import logging
+import threading
+
+log = logging.getLogger("rag.tokenizacao")
+
+TOKENIZER_ENCODING = os.getenv("RAG_TOKENIZER_ENCODING", "o200k_base")
+
+# Fim de frase seguido de espaço; "1." de listas numeradas não conta
+REGEX_FRASES = re.compile(r'(?<=[.!?])(?<!\d\.)\s+')
+REGEX_LINHAS = re.compile(r'[^\n]+')
+
+_codificador = None
+_carga_codificador = None
+_lock_codificador = threading.Lock()
+
+def dividir_frases(texto):
+    """Frases do texto, cortadas no espaço depois de . ! ou ?"""
+    return [frase for frase in REGEX_FRASES.split(texto) if frase]
+
+def spans_frases(texto):
+    """(início, fim) de cada frase não vazia, cortando também nas quebras de linha"""
+    spans = []
+    for linha in REGEX_LINHAS.finditer(texto):
+        inicio = linha.start()
+        for fim_frase in REGEX_FRASES.finditer(texto, linha.start(), linha.end()):
+            spans.append((inicio, fim_frase.start()))
+            inicio = fim_frase.end()
+        spans.append((inicio, linha.end()))
+    return [(inicio, fim) for inicio, fim in spans if texto[inicio:fim].strip()]
+
+def carregar_tokenizador():
+    """Carrega o tokenizer local (tiktoken) uma vez; False se indisponível.
+
+    Pode baixar o encoding na primeira vez (sem timeout): a API chama em segundo
+    plano, e só a indexação (fora do caminho de requisições) espera por ele.
+    """
+    global _codificador
+    if _codificador is not None:
+        return _codificador
+    with _lock_codificador:
+        if _codificador is None:
+            try:
+                import tiktoken
+                _codificador = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                log.info(f"🔤 Tokenizer {TOKENIZER_ENCODING} carregado")
+            except Exception as e:
+                log.warning(f"⚠️ Tokenizer indisponível ({type(e).__name__}); estimando tokens por caracteres")
+                _codificador = False
+    return _codificador
+
+def carregar_tokenizador_em_segundo_plano():
+    """Dispara (uma vez) a carga do tokenizer numa thread daemon"""
+    global _carga_codificador
+    with _lock_codificador:
+        if _carga_codificador is None and _codificador is None:
+            _carga_codificador = threading.Thread(target=carregar_tokenizador, name="carga-tokenizer", daemon=True)
+            _carga_codificador.start()
+    return _carga_codificador
+
+def contar_tokens(texto):
+    """Conta tokens com tiktoken ou estima (~4 caracteres por token) enquanto ele não carregou"""
+    codificador = _codificador
+    if codificador is None:
+        carregar_tokenizador_em_segundo_plano()
+    if codificador:
+        return len(codificador.encode(texto, disallowed_special=()))
+    return (len(texto) + 3) // 4